@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.services.catalog_service import delete_file, reindex_file
+from app.services.ingestion_service import IngestionBusyError
+from app.services.mongo_service import get_file_catalog_entry, list_file_catalog
+
+router = APIRouter()
+
+@router.get("/catalog/")
+async def list_catalog(limit: int = Query(50, ge=1, le=500), cursor: str = None):
+    """
+    Liste les fichiers ingérés avec leurs statistiques (nombre de chunks et de pages,
+    taille, empreinte, modèle d'embedding, date d'ingestion), par ordre de nom.
+    La page suivante s'obtient en passant `next_cursor` dans `cursor`.
+    """
+    files = await list_file_catalog(limit=limit, after=cursor)
+    next_cursor = files[-1]["file_name"] if len(files) == limit else None
+    return {"results": files, "next_cursor": next_cursor}
+
+@router.get("/catalog/{file_name}")
+async def get_catalog_entry(file_name: str):
+    """Récupère la fiche d'un fichier du catalogue."""
+    entry = await get_file_catalog_entry(file_name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Fichier introuvable dans le catalogue")
+    return entry
+
+@router.delete("/catalog/{file_name}")
+async def delete_catalog_entry(file_name: str):
+    """Supprime un fichier : ses chunks (ChromaDB et index lexical) et sa fiche."""
+    deleted = await delete_file(file_name)
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Aucun chunk pour ce fichier")
+    return {"message": "Fichier supprimé", "deleted_chunks": deleted}
+
+@router.post("/catalog/{file_name}/reindex")
+async def reindex_catalog_entry(file_name: str):
+    """Réingère un fichier depuis son chemin d'origine."""
+    try:
+        entry = await reindex_file(file_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=409, detail="Le fichier d'origine n'existe plus")
+    except IngestionBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Fichier introuvable dans le catalogue")
+    return {"message": "Fichier réindexé", "file": entry}
@@ -1,16 +1,23 @@
+import asyncio
+import json
+import logging
 import os
 import shutil
-from fastapi import APIRouter, HTTPException, File, UploadFile, Request
+import time
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.services.chroma_service import search_documents
-from app.services.llm_service import ask_question, generate_response, summarize_history
+from app.services.llm_service import ask_question, generate_response, llm, stream_response, summarize_history
 from app.services.mongo_service import find_conversation_by_history, insert_conversation
+from app.services.response_cache import get_response_cache
 from app.utils.file_processing import process_file
-from app.services.chroma_service import store_document_chunks
+from app.services.ingestion_service import IngestionBusyError, ingest_file
 from fastapi import Form
 from bson import ObjectId
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class QueryRequest(BaseModel):
     query: str
@@ -24,31 +31,20 @@ async def summarize_history_endpoint(request: HistoryRequest):
     summary = await summarize_history(history)
     return {"summary": summary}
 
-@router.post("/chat/")
-async def chat(request: Request, query: str = Form(...), history: str = Form(...), file: UploadFile = File(None), conversation_id: str = Form(None)):
-    """
-    Endpoint pour interroger le LLM avec une question et obtenir une réponse.
+async def _retrieve_context(query: str, file: UploadFile):
     """
-    
-    # # Si aucun conversation_id n'est fourni, créer une nouvelle conversation
-    # if not conversation_id:
-    #     conversation_data = {
-    #         "query": query,
-    #         "response": "",
-    #         "messages": [],  # Initialiser les messages comme une liste vide
-    #     }
-    #     conversation_id = await insert_conversation(conversation_data)
-
-
+    Recherche les documents liés à la requête et traite le fichier uploadé.
 
-    # Rechercher les documents dans ChromaDB
-    documents = search_documents(query)
+    :return: (documents trouvés, références du fichier uploadé)
+    """
+    # Rechercher les documents dans ChromaDB (embedding, Chroma et BM25 : hors de la boucle asyncio)
+    documents = await asyncio.to_thread(search_documents, query)
     
     if not documents:
         raise HTTPException(status_code=404, detail="No documents found for the query.")
     
     # Traiter le fichier s'il est fourni
-    folder_chunks = []
+    uploaded_files = []
     if file:
         UPLOAD_FOLDER = "uploads"
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -56,16 +52,90 @@ async def chat(request: Request, query: str = Form(...), history: str = Form(...
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        # Utiliser store_document_chunks pour obtenir les chunks
-        chunks = store_document_chunks(file_path)
+        # Traiter le fichier dans le pool d'ingestion pour ne pas bloquer les autres requêtes
+        try:
+            chunks = await ingest_file(file_path)
+        except IngestionBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
         
-        # Filtrer les informations pour ne conserver que le nom du fichier et les chunks
-        folder_chunks = [{"file_name": chunk["file_name"], "chunk": chunk["chunk"]} for chunk in chunks]
+        # Ne garder que la référence du fichier : ses chunks pertinents seront retrouvés à chaque question
+        uploaded_files = list({
+            chunk["file_hash"]: {"file_name": chunk["file_name"], "file_hash": chunk["file_hash"]} for chunk in chunks
+        }.values())
+    
+    return documents, uploaded_files
+
+@router.post("/chat/")
+async def chat(request: Request, query: str = Form(...), history: str = Form(...), file: UploadFile = File(None), conversation_id: str = Form(None),
+               use_cache: bool = Form(True)):
+    """
+    Endpoint pour interroger le LLM avec une question et obtenir une réponse.
+    `use_cache=false` force une nouvelle génération (sans passer par le cache des réponses).
+    """
     
+    # # Si aucun conversation_id n'est fourni, créer une nouvelle conversation
+    # if not conversation_id:
+    #     conversation_data = {
+    #         "query": query,
+    #         "response": "",
+    #         "messages": [],  # Initialiser les messages comme une liste vide
+    #     }
+    #     conversation_id = await insert_conversation(conversation_data)
+
+
+
+    documents, uploaded_files = await _retrieve_context(query, file)
+
     # Générer une réponse à partir du LLM
-    response = await generate_response(query, documents, history, folder_chunks, conversation_id)
+    response, prompt_tokens = await generate_response(query, documents, history, uploaded_files, conversation_id,
+                                                      use_cache=use_cache, with_details=True)
     
-    return {"query": query, "response": response}
+    return {"query": query, "response": response, "prompt_tokens": prompt_tokens}
+
+def get_chat_model():
+    """Modèle de chat utilisé pour le streaming (remplaçable via app.dependency_overrides)."""
+    return llm
+
+
+def _sse(event: str, data) -> str:
+    """Formate un événement Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/chat/stream/")
+async def chat_stream(request: Request, query: str = Form(...), history: str = Form(...), file: UploadFile = File(None),
+                      conversation_id: str = Form(None), use_cache: bool = Form(True),
+                      chat_model=Depends(get_chat_model)):
+    """
+    Variante de /chat/ qui envoie la réponse en Server-Sent Events : les sources
+    (événement "sources"), puis les tokens ("token"), puis l'usage et les
+    durées ("done"). En cas d'erreur pendant la génération : événement "error".
+    """
+    started_at = time.perf_counter()
+    documents, uploaded_files = await _retrieve_context(query, file)
+
+    async def events():
+        try:
+            async for event, data in stream_response(query, documents, history, uploaded_files, conversation_id,
+                                                     use_cache=use_cache, chat_model=chat_model,
+                                                     started_at=started_at):
+                if event == "done":
+                    data["timings"]["retrieval"] = retrieval_time
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Erreur pendant le streaming de la réponse : {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    retrieval_time = round(time.perf_counter() - started_at, 4)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/response_cache/stats")
+def response_cache_stats():
+    """Endpoint pour consulter les compteurs (succès/échecs) du cache des réponses."""
+    return get_response_cache().stats()
 
 @router.post("/ask/")
 async def ask(request: QueryRequest):
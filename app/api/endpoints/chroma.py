@@ -1,9 +1,17 @@
+import asyncio
+import json
 import os
 import shutil
-from fastapi import APIRouter, File, UploadFile
+from datetime import datetime
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from app.utils.file_processing import process_file
-from app.services.chroma_service import add_document_chunk, get_all_documents, search_documents, store_document_chunks, search_documents_ranking
+from app.services.chroma_service import add_document_chunk, iter_documents, list_documents, rebuild_lexical_index, search_documents, store_document_chunks, search_documents_ranking
+from app.services.ingest_job_service import create_folder_job
+from app.services.ingestion_service import IngestionBusyError, ingest_file
+from app.services.mongo_service import clear_file_catalog
+from app.services.search_cache import get_search_cache_stats
 
  
 router = APIRouter()
@@ -29,34 +37,26 @@ async def upload_document(file: UploadFile = File(...)):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
 
-    # Traitement et stockage dans ChromaDB
-    stored_chunks = store_document_chunks(file_path) # la fonction qui sort les chunks du fichier
+    # Traitement (dans le pool d'ingestion) et stockage dans ChromaDB
+    try:
+        stored_chunks = await ingest_file(file_path) # la fonction qui sort les chunks du fichier
+    except IngestionBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
 
     return {"message": "Document ajouté", "chunks": stored_chunks}
 
-@router.post("/upload_folder/")
+@router.post("/upload_folder/", status_code=202)
 async def upload_folder(folder_path: str):
     """
-    Upload tous les fichiers d'un dossier, les traite et stocke leurs chunks dans ChromaDB.
+    Lance l'ingestion de tous les fichiers d'un dossier en arrière-plan.
+    La progression se suit avec GET /api/ingest_jobs/{job_id}.
     """
     if not os.path.isdir(folder_path):
-        return {"error": "Le chemin spécifié n'est pas un dossier valide."}
+        raise HTTPException(status_code=400, detail="Le chemin spécifié n'est pas un dossier valide.")
 
-    processed_files = []
-    for file_name in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file_name)
+    job_id = await create_folder_job(folder_path)
 
-        # Vérifier si c'est un fichier
-        if os.path.isfile(file_path):
-            try:
-                # Traiter le fichier et stocker les chunks dans ChromaDB
-                chunks = process_file(file_path)
-                store_document_chunks(file_path)  # Stockage des chunks dans ChromaDB
-                processed_files.append({"file_name": file_name, "status": "success", "chunks": chunks})
-            except Exception as e:
-                processed_files.append({"file_name": file_name, "status": "error", "message": str(e)})
-
-    return {"message": "Traitement terminé", "processed_files": processed_files}
+    return {"message": "Traitement lancé", "job_id": job_id}
 
 @router.post("/add_document/")
 def add_document(chunk: DocumentChunk):
@@ -64,19 +64,61 @@ def add_document(chunk: DocumentChunk):
     metadata = add_document_chunk(chunk.file_name, chunk.pages, chunk.chunk_text)
     return metadata
 
+def _listing_params(fields: str, ingested_after: datetime, ingested_before: datetime):
+    """Convertit les paramètres de listing (champs séparés par des virgules, dates) pour chroma_service."""
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    return (
+        field_list,
+        ingested_after.timestamp() if ingested_after else None,
+        ingested_before.timestamp() if ingested_before else None,
+    )
+
 @router.get("/all_documents/")
-def all_documents():
-    """Endpoint pour récupérer tous les documents dans ChromaDB."""
-    results = get_all_documents()
-    return {"results": results}
+def all_documents(limit: int = Query(100, ge=1, le=1000), cursor: str = None, fields: str = None,
+                  file_name: str = None, ingested_after: datetime = None, ingested_before: datetime = None):
+    """
+    Endpoint pour lister les documents de ChromaDB, page par page.
+    Par défaut seules les métadonnées sont renvoyées ; `fields=id,file_name,content`
+    choisit les champs. Passer `next_cursor` en `cursor` pour obtenir la page suivante.
+    """
+    field_list, after, before = _listing_params(fields, ingested_after, ingested_before)
+    try:
+        return list_documents(limit, cursor, field_list, file_name, after, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/all_documents/export")
+def export_documents(fields: str = None, file_name: str = None, ingested_after: datetime = None,
+                     ingested_before: datetime = None):
+    """
+    Endpoint pour exporter les documents de ChromaDB en NDJSON (un chunk par ligne),
+    lus par pages : la taille du corpus n'est pas limitée.
+    """
+    field_list, after, before = _listing_params(fields, ingested_after, ingested_before)
+    try:
+        documents = iter_documents(field_list, file_name, after, before)
+        first = next(documents, None)  # Valide les paramètres avant d'envoyer la réponse
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def lines():
+        if first is None:
+            return
+        yield json.dumps(first, ensure_ascii=False) + "\n"
+        for document in documents:
+            yield json.dumps(document, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @router.delete("/delete_all_documents/")
-def delete_all_documents():
+async def delete_all_documents():
     """
-    Endpoint pour supprimer tous les documents de la collection ChromaDB.
+    Endpoint pour supprimer tous les documents de la collection ChromaDB,
+    ainsi que les fiches du catalogue (sinon elles feraient ignorer la réingestion).
     """
     from app.services.chroma_service import delete_all_documents_in_collection
-    delete_all_documents_in_collection()
+    await asyncio.to_thread(delete_all_documents_in_collection)
+    await clear_file_catalog()
     return {"message": "Tous les documents ont été supprimés de la collection."}
 
 
@@ -86,8 +128,22 @@ def search(query: str = None):
     results = search_documents(query)
     return {"results": results}
 
+@router.post("/lexical_index/rebuild")
+def lexical_index_rebuild():
+    """Endpoint pour reconstruire l'index lexical (BM25) à partir de la collection ChromaDB."""
+    count = rebuild_lexical_index()
+    return {"message": "Index lexical reconstruit", "chunks": count}
+
+@router.get("/search_cache/stats")
+def search_cache_stats():
+    """Endpoint pour consulter les compteurs (succès/échecs) des caches de recherche."""
+    return get_search_cache_stats()
+
 @router.get("/search_ranking/")
-def search_ranking(query: str = None):
-    """Endpoint pour rechercher un document dans ChromaDB."""
-    results = search_documents_ranking(query)
+def search_ranking(query: str = None, top_k: int = 4, candidates: int = None):
+    """
+    Endpoint pour rechercher un document dans ChromaDB, reclassé par le cross-encoder.
+    `candidates` : nombre de chunks récupérés puis reclassés (par défaut RERANK_CANDIDATES).
+    """
+    results = search_documents_ranking(query, top_k=top_k, candidates=candidates)
     return {"results": results}
\ No newline at end of file
@@ -1,18 +1,65 @@
 # filepath: c:\Users\Skyzo\Desktop\Projet probtp\LLM_BTP\app\api\endpoints\gpt2.py
-from fastapi import APIRouter
-from pydantic import BaseModel
-from app.services.gpt2_service import generate_gpt2_response
+import json
+import logging
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.services.gpt2_service import (
+    GPT2BusyError,
+    GPT2ContextError,
+    agenerate_gpt2_response,
+    check_gpt2_prompt,
+    stream_gpt2_response,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class GPT2Request(BaseModel):
     prompt: str
-    max_length: int = 100
+    max_length: int = Field(100, ge=1, le=1024)  # Contexte maximal de GPT-2 : 1024 tokens
 
 @router.post("/gpt2/")
 async def gpt2(request: GPT2Request):
     """
     Endpoint pour interroger le modèle GPT-2 avec un prompt et obtenir une réponse.
+    Les requêtes concurrentes sont générées ensemble, par micro-batchs.
     """
-    response = generate_gpt2_response(request.prompt, request.max_length)
-    return {"prompt": request.prompt, "response": response}
\ No newline at end of file
+    try:
+        response = await agenerate_gpt2_response(request.prompt, request.max_length)
+    except GPT2BusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except GPT2ContextError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"prompt": request.prompt, "response": response}
+
+def _sse(event: str, data) -> str:
+    """Formate un événement Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/gpt2/stream/")
+async def gpt2_stream(request: GPT2Request):
+    """
+    Variante de /gpt2/ qui envoie la réponse en Server-Sent Events : les morceaux
+    de texte générés ("token"), puis la réponse complète et les durées ("done").
+    Si le client se déconnecte, la génération s'arrête. En cas d'erreur : événement "error".
+    Un prompt plus long que le contexte du modèle est refusé (400) avant l'ouverture du flux.
+    """
+    try:
+        await check_gpt2_prompt(request.prompt)
+    except GPT2ContextError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            async for event, data in stream_gpt2_response(request.prompt, request.max_length):
+                yield _sse(event, data)
+        except Exception as e:
+            logger.error(f"Erreur pendant le streaming GPT-2 : {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
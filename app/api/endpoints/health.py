@@ -0,0 +1,26 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core.chroma_config import embedding_model_error
+from app.services.model_registry import get_model_registry
+
+router = APIRouter()
+
+@router.get("/health/live")
+async def live():
+    """Le processus répond (les modèles peuvent être encore en chargement)."""
+    return {"status": "ok"}
+
+@router.get("/health/ready")
+async def ready():
+    """
+    Indique si les modèles préchargés au démarrage (MODEL_WARMUP) sont prêts :
+    200 si oui, 503 sinon, avec l'état de chaque modèle. Répond aussi 503 si la
+    collection ChromaDB a été construite avec un autre modèle d'embedding.
+    """
+    registry = get_model_registry()
+    if embedding_model_error:
+        content = {"status": "error", "error": embedding_model_error, "models": registry.status()}
+        return JSONResponse(content, status_code=503)
+    is_ready = registry.is_ready()
+    content = {"status": "ready" if is_ready else "loading", "models": registry.status()}
+    return JSONResponse(content, status_code=200 if is_ready else 503)
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from bson import ObjectId
+from app.services.mongo_service import get_ingest_job
+
+router = APIRouter()
+
+@router.get("/ingest_jobs/{job_id}")
+async def ingest_job_status(job_id: str):
+    """Récupère l'état d'un job d'ingestion et la progression de chaque fichier."""
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    job = await get_ingest_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job
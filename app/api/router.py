@@ -1,6 +1,6 @@
 # filepath: c:\Users\Skyzo\Desktop\Projet probtp\LLM_BTP\app\api\router.py
 from fastapi import APIRouter
-from app.api.endpoints import document, chroma, chat, conversations, gpt2
+from app.api.endpoints import document, chroma, chat, conversations, gpt2, ingest_jobs, catalog, health
 
 router = APIRouter()
 router.include_router(document.router, prefix="/api", tags=["documents"])
@@ -8,3 +8,6 @@ router.include_router(chroma.router, prefix="/api", tags=["chroma"])
 router.include_router(chat.router, prefix="/api", tags=["chat"])
 router.include_router(conversations.router, prefix="/api", tags=["conversations"])
 router.include_router(gpt2.router, prefix="/api", tags=["gpt2"])
+router.include_router(ingest_jobs.router, prefix="/api", tags=["ingest_jobs"])
+router.include_router(catalog.router, prefix="/api", tags=["catalog"])
+router.include_router(health.router, prefix="/api", tags=["health"])
@@ -1,11 +1,62 @@
+import logging
 from langchain.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
+from app.core.config import EMBEDDING_MODEL_NAME
+from app.services.embedding_service import get_embedding_engine
+
+logger = logging.getLogger(__name__)
 
 # Définition du chemin de stockage de la base ChromaDB
 CHROMA_PATH = "./chroma_db"
 
-# Chargement du modèle d'embedding
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Modèle des collections créées avant l'enregistrement du modèle dans leurs métadonnées
+BASELINE_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Modèle d'embedding partagé : le même pour l'ingestion et pour les requêtes
+embedding_model = get_embedding_engine()
 
 # Initialisation de la base de données vectorielle
-chroma_db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_model)
\ No newline at end of file
+chroma_db = Chroma(
+    persist_directory=CHROMA_PATH,
+    embedding_function=embedding_model,
+    collection_metadata={"embedding_model": EMBEDDING_MODEL_NAME},
+)
+
+
+def check_embedding_model():
+    """
+    Vérifie que le modèle enregistré dans les métadonnées de la collection
+    est celui utilisé pour vectoriser les requêtes. Une incohérence n'empêche
+    pas le démarrage : elle est journalisée et signalée par /api/health/ready.
+
+    :return: Le message d'erreur, ou None si le modèle est cohérent.
+    """
+    collection = chroma_db._collection
+    metadata = collection.metadata or {}
+    stored_model = metadata.get("embedding_model")
+
+    if stored_model is None:
+        if collection.count() == 0 or EMBEDDING_MODEL_NAME == BASELINE_EMBEDDING_MODEL:
+            # Collection vide, ou antérieure aux métadonnées et construite avec le modèle
+            # configuré : on la marque avec le modèle courant
+            # (les clés "hnsw:" ne peuvent pas être modifiées après création)
+            metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:")}
+            collection.modify(metadata={**metadata, "embedding_model": EMBEDDING_MODEL_NAME})
+            return None
+        error = (
+            "La collection ChromaDB ne précise pas son modèle d'embedding "
+            f"(sans doute '{BASELINE_EMBEDDING_MODEL}') mais les requêtes utilisent '{EMBEDDING_MODEL_NAME}'. "
+            f"Définissez EMBEDDING_MODEL_NAME={BASELINE_EMBEDDING_MODEL} ou ré-ingérez les documents."
+        )
+    elif stored_model != EMBEDDING_MODEL_NAME:
+        error = (
+            f"La collection ChromaDB a été construite avec le modèle '{stored_model}' "
+            f"mais les requêtes utilisent '{EMBEDDING_MODEL_NAME}'."
+        )
+    else:
+        return None
+    logger.warning(error)
+    return error
+
+
+# Erreur de cohérence du modèle d'embedding (None si cohérent), voir /api/health/ready
+embedding_model_error = check_embedding_model()
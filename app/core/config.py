@@ -7,3 +7,95 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "llm_project")
 MONGO_COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME", "documents")
+
+# Moteur d'embedding partagé (un modèle chargé une seule fois par worker)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_QUEUE_SIZE = int(os.getenv("EMBEDDING_QUEUE_SIZE", "256"))
+EMBEDDING_BATCH_WAIT_MS = int(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+# Écritures groupées dans ChromaDB
+CHROMA_WRITE_BATCH_SIZE = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "1000"))
+CHROMA_FLUSH_INTERVAL = float(os.getenv("CHROMA_FLUSH_INTERVAL", "2.0"))
+
+# Pool de processus pour l'ingestion (parsing + embedding hors de la boucle asyncio)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_PENDING = int(os.getenv("INGESTION_MAX_PENDING", "8"))
+INGESTION_QUEUE_TIMEOUT = float(os.getenv("INGESTION_QUEUE_TIMEOUT", "5"))
+# Nombre de chunks par batch (découpage -> embedding -> écriture) et batchs en transit par fichier
+INGESTION_BATCH_SIZE = int(os.getenv("INGESTION_BATCH_SIZE", "256"))
+INGESTION_STREAM_QUEUE_SIZE = int(os.getenv("INGESTION_STREAM_QUEUE_SIZE", "4"))
+
+# Découpage des documents : mots par chunk, chevauchement, limite en tokens (0 : pas de limite)
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "100"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+# Nombre de lignes de données par chunk pour les fichiers Excel (l'en-tête est répété)
+EXCEL_ROWS_PER_CHUNK = int(os.getenv("EXCEL_ROWS_PER_CHUNK", "50"))
+
+# Extraction parallèle des pages des gros PDF (0 ou 1 worker : extraction séquentielle)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "4"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "200"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+
+# Jobs d'ingestion de dossiers : nombre de fichiers traités en parallèle par job
+INGEST_JOB_CONCURRENCY = int(os.getenv("INGEST_JOB_CONCURRENCY", "4"))
+# Bail (en secondes) d'un job d'ingestion : renouvelé par le worker qui l'exécute, repris par un autre une fois expiré
+INGEST_JOB_LEASE = float(os.getenv("INGEST_JOB_LEASE", "60"))
+
+# Cache de recherche : embeddings des requêtes et résultats (durées en secondes)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "1024"))
+SEARCH_RESULT_CACHE_TTL = float(os.getenv("SEARCH_RESULT_CACHE_TTL", "300"))
+
+# Cache sémantique des réponses du LLM (SQLite) : seuil de similarité cosinus, taille, âge maximal en secondes
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "./response_cache/responses.sqlite3")
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+RESPONSE_CACHE_MAX_AGE = float(os.getenv("RESPONSE_CACHE_MAX_AGE", "86400"))
+
+# Modèle OpenAI et budgets de tokens du prompt (historique, chunks retrouvés, chunks uploadés)
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gpt-3.5-turbo")
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "12000"))
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "2000"))
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "4000"))
+PROMPT_UPLOAD_TOKENS = int(os.getenv("PROMPT_UPLOAD_TOKENS", "4000"))
+UPLOAD_EMBEDDING_CACHE_SIZE = int(os.getenv("UPLOAD_EMBEDDING_CACHE_SIZE", "4096"))
+
+# Nombre de chunks des fichiers uploadés dans une conversation retrouvés à chaque question
+UPLOAD_TOP_K = int(os.getenv("UPLOAD_TOP_K", "8"))
+
+# Reclassement des chunks par un cross-encoder : candidats récupérés, micro-batchs, quantification int8 (CPU)
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_MAX_CANDIDATES = int(os.getenv("RERANK_MAX_CANDIDATES", "100"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+RERANK_QUANTIZE = os.getenv("RERANK_QUANTIZE", "false").lower() in ("1", "true", "yes")
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "1"))
+
+# Recherche hybride : index lexical BM25 (sur disque) fusionné avec la recherche vectorielle (RRF)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "./bm25_index")
+BM25_MAX_SEGMENTS = int(os.getenv("BM25_MAX_SEGMENTS", "8"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Modèles locaux : résolution hors ligne (cache local uniquement), modèles préchargés au démarrage
+MODELS_OFFLINE = os.getenv("MODELS_OFFLINE", "false").lower() in ("1", "true", "yes")
+MODEL_WARMUP = [name.strip() for name in os.getenv("MODEL_WARMUP", "embedding,reranker,tokenizer").split(",") if name.strip()]
+GPT2_MODEL_NAME = os.getenv("GPT2_MODEL_NAME", "gpt2")
+NLTK_DATA_PATH = os.getenv("NLTK_DATA_PATH", "/root/nltk_data")
+
+# Génération GPT-2 par micro-batchs : taille maximale d'un batch, fenêtre de regroupement, requêtes en attente
+GPT2_MAX_BATCH_SIZE = int(os.getenv("GPT2_MAX_BATCH_SIZE", "8"))
+GPT2_BATCH_WAIT_MS = int(os.getenv("GPT2_BATCH_WAIT_MS", "10"))
+GPT2_QUEUE_SIZE = int(os.getenv("GPT2_QUEUE_SIZE", "256"))
+# Générations GPT-2 en streaming exécutées en parallèle (une génération par thread, hors micro-batchs)
+GPT2_STREAM_WORKERS = int(os.getenv("GPT2_STREAM_WORKERS", "2"))
+
+# Moteur d'inférence des modèles locaux : "torch" ou "onnx" (ONNX Runtime, dépendance optionnelle optimum[onnxruntime])
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "false").lower() in ("1", "true", "yes")
+ONNX_MODELS_PATH = os.getenv("ONNX_MODELS_PATH", "./onnx_models")
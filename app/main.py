@@ -1,6 +1,15 @@
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.router import router  # Importer le routeur principal
+from app.core.config import MODEL_WARMUP
+from app.services.ingest_job_service import resume_ingest_jobs
+from app.services.ingestion_service import shutdown_ingestion_pool
+from app.services.model_registry import get_model_registry
+from app.services.mongo_service import ensure_file_catalog_indexes
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -14,4 +23,29 @@ app.add_middleware(
 )
 
 # Inclure le routeur dans l'application FastAPI
-app.include_router(router)
\ No newline at end of file
+app.include_router(router)
+
+# Tâches de démarrage en arrière-plan (références gardées jusqu'à leur fin)
+_startup_tasks = set()
+
+async def _create_catalog_indexes():
+    try:
+        await ensure_file_catalog_indexes()
+    except Exception as e:
+        logger.error(f"Erreur lors de la création des index du catalogue : {e}")
+
+@app.on_event("startup")
+async def startup():
+    # Charger les modèles en arrière-plan : le serveur répond tout de suite (voir /api/health/ready)
+    get_model_registry().warm_up(MODEL_WARMUP)
+    # Reprendre les jobs d'ingestion interrompus par un redémarrage (sans attendre MongoDB)
+    resume_ingest_jobs()
+    # Index du catalogue des fichiers (sans effet s'ils existent déjà)
+    task = asyncio.create_task(_create_catalog_indexes())
+    _startup_tasks.add(task)
+    task.add_done_callback(_startup_tasks.discard)
+
+@app.on_event("shutdown")
+def shutdown():
+    # Arrêter les processus d'ingestion
+    shutdown_ingestion_pool()
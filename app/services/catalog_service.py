@@ -0,0 +1,56 @@
+import asyncio
+import logging
+import os
+from app.services.chroma_service import delete_chunks, get_file_chunk_ids, get_file_hash_chunk_ids
+from app.services.ingestion_service import ingest_file
+from app.services.mongo_service import count_file_hash_references, delete_file_catalog_entry, get_file_catalog_entry
+
+
+logger = logging.getLogger(__name__)
+
+
+async def delete_file(file_name: str):
+    """
+    Supprime tous les chunks d'un fichier (ChromaDB et index lexical) puis sa fiche du catalogue.
+    Les chunks sont retrouvés par l'empreinte du fichier catalogué ; à défaut de fiche, par son nom.
+    Les chunks d'un contenu aussi catalogué sous un autre nom sont gardés : seule la fiche
+    est supprimée.
+
+    :param file_name: Le nom du fichier.
+    :return: Le nombre de chunks supprimés, ou None si le fichier est inconnu.
+    """
+    entry = await get_file_catalog_entry(file_name)
+    if entry and await count_file_hash_references(entry["file_hash"], exclude_file_name=file_name):
+        await delete_file_catalog_entry(file_name)
+        logger.info(f"Chunks de {file_name} partagés avec un autre fichier : seule la fiche est supprimée")
+        return 0
+    if entry:
+        chunk_ids = await asyncio.to_thread(get_file_hash_chunk_ids, entry["file_hash"])
+    else:
+        chunk_ids = await asyncio.to_thread(get_file_chunk_ids, file_name)
+    if entry is None and not chunk_ids:
+        return None
+    await asyncio.to_thread(delete_chunks, chunk_ids)
+    await delete_file_catalog_entry(file_name)
+    logger.info(f"{len(chunk_ids)} chunks supprimés pour {file_name}")
+    return len(chunk_ids)
+
+
+async def reindex_file(file_name: str):
+    """
+    Réingère un fichier du catalogue depuis son chemin d'origine. Le fichier est
+    retraité entièrement ; ses anciens chunks ne sont supprimés qu'une fois les
+    nouveaux écrits (en cas d'échec, le fichier reste indexé).
+
+    :param file_name: Le nom du fichier.
+    :return: La nouvelle fiche du fichier, ou None si le fichier n'est pas catalogué.
+    :raises FileNotFoundError: Si le fichier d'origine n'existe plus.
+    """
+    entry = await get_file_catalog_entry(file_name)
+    if entry is None:
+        return None
+    source_path = entry["source_path"]
+    if not os.path.isfile(source_path):
+        raise FileNotFoundError(source_path)
+    await ingest_file(source_path, collect=False, force=True)
+    return await get_file_catalog_entry(file_name)
@@ -1,56 +1,373 @@
+import base64
+import json
+import os
+import time
+import uuid
 from datetime import datetime
 from app.core.chroma_config import chroma_db, embedding_model
-from app.utils.file_processing import process_file
+from app.services.chroma_writer import get_bulk_writer
+from app.services.search_cache import (
+    embedding_key,
+    get_cached_query_embedding,
+    invalidate_search_results,
+    search_result_cache,
+)
+from app.utils.file_processing import compute_chunk_hash, compute_file_hash, iter_prepared_batches, make_chunk_uid
 from langchain_community.vectorstores.utils import filter_complex_metadata
-from transformers import BertTokenizer, BertForSequenceClassification
-import torch
+from app.core.config import HYBRID_CANDIDATES, HYBRID_SEARCH, RERANK_CANDIDATES, RERANK_MAX_CANDIDATES, RRF_K
+from app.services.lexical_service import get_lexical_index, reciprocal_rank_fusion
+from app.services.rerank_service import get_reranker
 
+def add_embeddings(texts: list, embeddings: list, metadatas: list, ids: list = None, flush: bool = True):
+    """
+    Ajoute des textes déjà vectorisés dans ChromaDB, sans les ré-encoder.
+    
+    :param texts: Les textes des chunks.
+    :param embeddings: Les vecteurs calculés pendant le traitement.
+    :param metadatas: Les métadonnées associées à chaque chunk.
+    :param ids: Les identifiants des chunks (générés s'ils ne sont pas fournis).
+    :param flush: Écrire immédiatement le tampon (sinon l'écrivain groupé décide).
+    :return: La liste des identifiants insérés.
+    """
+    if ids is None:
+        ids = [str(uuid.uuid4()) for _ in texts]
+    writer = get_bulk_writer()
+    writer.add(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=texts)
+    if flush:
+        writer.flush()
+    return ids
 
-tokenizer = BertTokenizer.from_pretrained('bert-base-uncased', timeout = 120)
-model = BertForSequenceClassification.from_pretrained('bert-base-uncased')
-model.eval()
+def get_stored_file_chunks(file_hash: str):
+    """
+    Récupère les chunks déjà stockés pour un contenu de fichier donné.
+    
+    :param file_hash: L'empreinte du fichier.
+    :return: La liste des chunks (vide si le fichier n'a jamais été ingéré).
+    """
+    results = chroma_db._collection.get(where={"file_hash": file_hash}, include=["metadatas", "documents"])
+    chunks = [{"file_name": metadata["file_name"],
+               "pages": metadata["pages"],
+               "timestamp": metadata["timestamp"],
+               "chunk_id": metadata["chunk_id"],
+               "chunk": document,
+               "file_hash": metadata["file_hash"],
+               "chunk_hash": metadata["chunk_hash"],
+               "uid": uid}
+              for uid, metadata, document in zip(results["ids"], results["metadatas"], results["documents"])]
+    return sorted(chunks, key=lambda chunk: chunk["chunk_id"])
 
-def store_document_chunks(file_path: str):
+def get_previous_version(source_path: str, shared_hashes=()):
     """
-    Traite un document, extrait ses chunks et les stocke dans ChromaDB.
+    Récupère les chunks stockés pour un fichier (version précédente éventuelle),
+    identifié par son chemin d'origine : deux fichiers de même nom dans des
+    dossiers différents ne sont pas des versions l'un de l'autre. Les chunks
+    écrits avant l'ajout du chemin aux métadonnées sont retrouvés par le nom.
+    
+    :param source_path: Le chemin absolu du fichier.
+    :param shared_hashes: Empreintes de fichiers encore référencées par d'autres fiches du
+                          catalogue : leurs chunks sont réutilisables mais pas à supprimer.
+    :return: Un dictionnaire {empreinte du chunk: identifiant} et la liste des identifiants à remplacer.
+    """
+    results = chroma_db._collection.get(where={"file_name": os.path.basename(source_path)}, include=["metadatas"])
+    chunks = [(uid, metadata) for uid, metadata in zip(results["ids"], results["metadatas"])
+              if metadata.get("source_path", source_path) == source_path]
+    hashes = {metadata["chunk_hash"]: uid for uid, metadata in chunks if metadata.get("chunk_hash")}
+    ids = [uid for uid, metadata in chunks if metadata.get("file_hash") not in shared_hashes]
+    return hashes, ids
+
+def plan_file_ingestion(file_path: str, file_hash: str = None, complete_chunk_count: int = None,
+                        shared_hashes=()):
+    """
+    Détermine ce qu'il reste à faire pour ingérer un fichier.
+    Le fichier n'est considéré inchangé que si une ingestion complète de ce
+    contenu est enregistrée (`complete_chunk_count`, voir le catalogue) et que
+    tous ses chunks sont présents. Les chunks laissés par une ingestion
+    interrompue sont traités comme une version précédente : leurs vecteurs
+    sont réutilisés et ceux qui ne sont pas regénérés sont supprimés.
     
     :param file_path: Chemin du fichier à traiter.
-    :return: Liste des documents insérés dans la base.
+    :param file_hash: L'empreinte du fichier (calculée si absente).
+    :param complete_chunk_count: Le nombre de chunks d'une ingestion complète de ce contenu, ou None.
+    :param shared_hashes: Empreintes de fichiers référencées par d'autres fiches du catalogue
+                          (même contenu sous un autre nom) : leurs chunks ne sont jamais supprimés.
+    :return: (chunks déjà stockés si le fichier est inchangé, sinon None,
+              empreintes -> identifiants des chunks de la version précédente,
+              identifiants de la version précédente)
     """
-    # Obtenir les chunks du document
-    chunks = process_file(file_path)
-    if isinstance(chunks, dict) and chunks.get("status") == "error":
-        raise ValueError(chunks["message"])
+    file_hash = file_hash or compute_file_hash(file_path)
+    stored_chunks = get_stored_file_chunks(file_hash)
+    if stored_chunks and complete_chunk_count is not None and len(stored_chunks) == complete_chunk_count:
+        return stored_chunks, {}, []
+    previous_hashes, previous_ids = get_previous_version(os.path.abspath(file_path), shared_hashes)
+    if stored_chunks:
+        # Ingestion précédente interrompue (ou catalogue absent) : chunks partiels
+        previous_hashes.update({chunk["chunk_hash"]: chunk["uid"] for chunk in stored_chunks})
+        if file_hash not in shared_hashes:
+            previous_ids = list(dict.fromkeys(previous_ids + [chunk["uid"] for chunk in stored_chunks]))
+    return None, previous_hashes, previous_ids
+
+class ChunkStats:
+    """Statistiques d'un fichier calculées pendant le stockage de ses chunks (catalogue)."""
+
+    def __init__(self):
+        self.chunk_count = 0
+        self.file_hash = None
+        self.max_page = 0
+        self.sheets = set()
+
+    def add(self, chunk):
+        self.chunk_count += 1
+        self.file_hash = chunk["file_hash"]
+        pages = str(chunk["pages"])
+        if ":" in pages:  # Excel : "feuille:premières-dernières lignes"
+            self.sheets.add(pages.rsplit(":", 1)[0])
+            return
+        last_page = pages.rsplit("-", 1)[-1]
+        if last_page.isdigit():
+            self.max_page = max(self.max_page, int(last_page))
+
+    def as_dict(self, ingested_at: float):
+        return {
+            "file_hash": self.file_hash,
+            "chunk_count": self.chunk_count,
+            "page_count": len(self.sheets) or self.max_page or None,
+            "ingested_at": ingested_at,
+        }
+
+def delete_chunks(ids):
+    """
+    Supprime des chunks de ChromaDB et de l'index lexical.
+
+    :param ids: Les identifiants des chunks.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    collection = chroma_db._collection
+    limit = get_bulk_writer().batch_limit()
+    for start in range(0, len(ids), limit):
+        collection.delete(ids=ids[start:start + limit])
+    chroma_db.persist()
+    get_lexical_index().delete(ids)
+    invalidate_search_results()
 
+def get_file_hash_chunk_ids(file_hash: str):
+    """Récupère les identifiants des chunks d'un contenu de fichier (filtre sur l'empreinte)."""
+    return chroma_db._collection.get(where={"file_hash": file_hash}, include=[])["ids"]
 
-    # Ajouter les chunks à ChromaDB
-    for chunk in chunks:
-        # Vérifier si le chunk existe déjà dans la base de données
-        
-        metadata = {
+def get_file_chunk_ids(file_name: str):
+    """Récupère les identifiants des chunks d'un fichier (parcours de la collection, sans catalogue)."""
+    return chroma_db._collection.get(where={"file_name": file_name}, include=[])["ids"]
+
+def store_chunk_batches(batches, flush: bool = True, previous_hashes: dict = None, previous_ids: list = None, collect: bool = True,
+                        with_stats: bool = False, source_path: str = None):
+    """
+    Stocke dans ChromaDB, batch par batch, les chunks préparés par iter_prepared_batches.
+    Les chunks inchangés (vecteur à None) réutilisent le vecteur déjà stocké,
+    puis les chunks de la version précédente qui ont disparu sont supprimés.
+    
+    :param batches: Un itérable de batchs de chunks.
+    :param flush: Écrire tout de suite ; False permet de regrouper plusieurs
+                  documents dans un même upsert (ignoré s'il faut remplacer une version précédente).
+    :param previous_hashes: Empreintes -> identifiants des chunks de la version précédente.
+    :param previous_ids: Identifiants de tous les chunks de la version précédente.
+    :param collect: Retourner les chunks stockés (sans vecteurs) ; sinon seulement leur nombre.
+    :param with_stats: Retourner aussi les statistiques du fichier (voir ChunkStats), pour le catalogue.
+    :param source_path: Le chemin absolu du fichier, stocké dans les métadonnées (voir get_previous_version).
+    :return: Les chunks stockés, ou leur nombre (ou le couple (résultat, statistiques)).
+    """
+    previous_hashes = previous_hashes or {}
+    previous_ids = previous_ids or []
+    stored_chunks = []
+    stored_count = 0
+    new_ids = set()
+    lexical_index = get_lexical_index()
+    ingested_at = time.time()  # Date numérique : filtrable par ChromaDB ($gte / $lte)
+    stats = ChunkStats()
+
+    for chunks in batches:
+        # Récupérer les vecteurs des chunks inchangés au lieu de les recalculer
+        reused = [chunk for chunk in chunks if chunk["vector"] is None]
+        if reused:
+            old_ids = [previous_hashes[chunk["chunk_hash"]] for chunk in reused]
+            results = chroma_db._collection.get(ids=old_ids, include=["embeddings"])
+            embeddings = dict(zip(results["ids"], results["embeddings"]))
+            for chunk, old_id in zip(reused, old_ids):
+                chunk["vector"] = list(embeddings[old_id])
+
+        metadatas = [{
             "file_name": chunk["file_name"],
             "pages": chunk["pages"],
             "timestamp": chunk["timestamp"],
             "chunk_id": chunk["chunk_id"],
             "chunk": chunk["chunk"],
-            #"vector": chunk["vector"]  # On stocke aussi le vecteur
-        }
-        
-        chroma_db.add_texts(texts=[chunk["chunk"]], metadatas=[metadata], vectors=[chunk["vector"]])
+            "file_hash": chunk["file_hash"],
+            "chunk_hash": chunk["chunk_hash"],
+            "ingested_at": ingested_at,
+            **({"source_path": source_path} if source_path else {}),
+        } for chunk in chunks]
+
+        ids = add_embeddings(
+            texts=[chunk["chunk"] for chunk in chunks],
+            embeddings=[chunk["vector"] for chunk in chunks],
+            metadatas=metadatas,
+            ids=[chunk["uid"] for chunk in chunks],
+            flush=False,
+        )
+        new_ids.update(ids)
+        stored_count += len(chunks)
+        # Un segment lexical par batch : les postings du fichier ne restent pas en mémoire
+        lexical_batch = lexical_index.builder()
+        for chunk in chunks:
+            lexical_batch.add(chunk["uid"], chunk["chunk"])
+            stats.add(chunk)
+        lexical_index.add(lexical_batch)
+
+        if collect:
+            for chunk in chunks:
+                chunk.pop("vector")  # Les vecteurs ne restent pas en mémoire
+            stored_chunks.extend(chunks)
 
-    chroma_db.persist()  # Sauvegarde des changements
+    if flush or previous_ids:
+        get_bulk_writer().flush()
 
-    return chunks  # Retourne les données stockées
+    # Supprimer les chunks de l'ancienne version (après l'écriture de la nouvelle)
+    stale_ids = list(set(previous_ids) - new_ids)
+    if stale_ids:
+        delete_chunks(stale_ids)
 
+    result = stored_chunks if collect else stored_count
+    return (result, stats.as_dict(ingested_at)) if with_stats else result
 
-def get_all_documents():
-    """Récupère tous les documents dans ChromaDB."""
-    results = chroma_db.similarity_search("", k=1000)  # Utiliser une recherche avec une chaîne vide pour récupérer tous les documents
-    return [{"file_name": doc.metadata["file_name"], 
-             "page": doc.metadata["pages"],
-             "timestamp": doc.metadata["timestamp"],
-             "chunk_id" : doc.metadata["chunk_id"],
-             "content": doc.page_content} for doc in results]
+def store_document_chunks(file_path: str, flush: bool = True, complete_chunk_count: int = None):
+    """
+    Traite un document, extrait ses chunks et les stocke dans ChromaDB.
+    Le document est découpé, vectorisé et écrit par batchs. Un fichier déjà
+    ingéré est ignoré ; pour un fichier modifié, seuls les chunks modifiés
+    sont vectorisés.
+    Fonction synchrone : depuis un endpoint async, utiliser ingestion_service.ingest_file.
+    
+    :param file_path: Chemin du fichier à traiter.
+    :param flush: Écrire le document tout de suite ; False permet de regrouper
+                  plusieurs documents dans un même upsert.
+    :param complete_chunk_count: Voir plan_file_ingestion ; sans lui, le fichier est
+                                 toujours retraité (les vecteurs existants sont réutilisés).
+    :return: Liste des documents insérés dans la base.
+    """
+    stored_chunks, previous_hashes, previous_ids = plan_file_ingestion(file_path, complete_chunk_count=complete_chunk_count)
+    if stored_chunks:
+        return stored_chunks  # Fichier inchangé : rien à faire
+
+    batches = iter_prepared_batches(file_path, previous_hashes.keys())
+    return store_chunk_batches(batches, flush, previous_hashes, previous_ids,
+                               source_path=os.path.abspath(file_path))  # Retourne les données stockées
+
+
+# Champs retournés par défaut par le listing (métadonnées seulement, sans le texte des chunks)
+LISTING_FIELDS = ("id", "file_name", "page", "timestamp", "chunk_id", "ingested_at")
+# Champ de sortie -> clé de métadonnée ChromaDB
+_METADATA_KEYS = {"file_name": "file_name", "page": "pages", "timestamp": "timestamp", "chunk_id": "chunk_id",
+                  "ingested_at": "ingested_at", "file_hash": "file_hash", "chunk_hash": "chunk_hash"}
+
+def encode_cursor(offset: int) -> str:
+    """Encode la position de la page suivante dans un curseur opaque."""
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    """Décode un curseur de pagination (ValueError s'il est invalide)."""
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"]
+    except Exception:
+        raise ValueError("Curseur de pagination invalide.")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Curseur de pagination invalide.")
+    return offset
+
+def build_listing_filter(file_name: str = None, ingested_after: float = None, ingested_before: float = None):
+    """
+    Construit le filtre de métadonnées ChromaDB du listing.
+
+    :param file_name: Ne garder que les chunks de ce fichier.
+    :param ingested_after: Date d'ingestion minimale (timestamp Unix).
+    :param ingested_before: Date d'ingestion maximale (timestamp Unix).
+    :return: Le filtre `where`, ou None.
+    """
+    conditions = []
+    if file_name:
+        conditions.append({"file_name": file_name})
+    if ingested_after is not None:
+        conditions.append({"ingested_at": {"$gte": ingested_after}})
+    if ingested_before is not None:
+        conditions.append({"ingested_at": {"$lte": ingested_before}})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def _project(uid, document, metadata, fields):
+    row = {}
+    for field in fields:
+        if field == "id":
+            row["id"] = uid
+        elif field == "content":
+            row["content"] = document
+        elif field in _METADATA_KEYS:
+            row[field] = metadata.get(_METADATA_KEYS[field])
+    return row
+
+def _normalize_fields(fields):
+    fields = list(fields or LISTING_FIELDS)
+    unknown = set(fields) - set(_METADATA_KEYS) - {"id", "content"}
+    if unknown:
+        raise ValueError(f"Champs inconnus : {', '.join(sorted(unknown))}")
+    return fields
+
+def list_documents(limit: int = 100, cursor: str = None, fields=None, file_name: str = None,
+                   ingested_after: float = None, ingested_before: float = None):
+    """
+    Liste les chunks de ChromaDB page par page (collection.get, sans recherche vectorielle).
+
+    :param limit: Le nombre de chunks par page.
+    :param cursor: Le curseur retourné par la page précédente (None : première page).
+    :param fields: Les champs à retourner (par défaut LISTING_FIELDS ; "content" pour le texte).
+    :param file_name: Filtre sur le nom du fichier.
+    :param ingested_after: Filtre sur la date d'ingestion (timestamp Unix, inclus).
+    :param ingested_before: Filtre sur la date d'ingestion (timestamp Unix, inclus).
+    :return: {"results": [...], "next_cursor": curseur de la page suivante ou None}
+    """
+    fields = _normalize_fields(fields)
+    offset = decode_cursor(cursor) if cursor else 0
+    include = ["metadatas", "documents"] if "content" in fields else ["metadatas"]
+    # Lire un chunk de plus pour savoir s'il reste une page
+    results = chroma_db._collection.get(
+        where=build_listing_filter(file_name, ingested_after, ingested_before),
+        limit=limit + 1, offset=offset, include=include,
+    )
+    ids = results["ids"][:limit]
+    documents = results.get("documents") or [None] * len(ids)
+    rows = [_project(uid, document, metadata, fields)
+            for uid, document, metadata in zip(ids, documents, results["metadatas"])]
+    next_cursor = encode_cursor(offset + limit) if len(results["ids"]) > limit else None
+    return {"results": rows, "next_cursor": next_cursor}
+
+def iter_documents(fields=None, file_name: str = None, ingested_after: float = None,
+                   ingested_before: float = None, batch_size: int = 1000):
+    """
+    Parcourt tous les chunks de ChromaDB par pages de `batch_size` (export en streaming).
+
+    :return: Un générateur de chunks projetés (voir list_documents).
+    """
+    cursor = None
+    while True:
+        page = list_documents(batch_size, cursor, fields, file_name, ingested_after, ingested_before)
+        yield from page["results"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return
+
+def get_all_documents(limit: int = 1000):
+    """Récupère les premiers documents de ChromaDB (avec leur contenu), sans recherche vectorielle."""
+    fields = ["id", "file_name", "page", "timestamp", "chunk_id", "content"]
+    return list_documents(limit=limit, fields=fields)["results"]
 
 def add_document_chunk(file_name: str, page: str, chunk_text: str):
     """Ajoute un chunk de document dans ChromaDB."""
@@ -62,23 +379,127 @@ def add_document_chunk(file_name: str, page: str, chunk_text: str):
         "pages": page,
         "timestamp": timestamp,
         "chunk": chunk_text,
+        "ingested_at": time.time(),
         #"vector": vector
     }
-    chroma_db.add_texts(texts=[chunk_text], metadatas=[metadata], vectors=[vector])
-    chroma_db.persist()
+    # Identifiant adressé par le contenu : ré-ajouter le même chunk ne crée pas de doublon
+    uid = make_chunk_uid(compute_chunk_hash(file_name), compute_chunk_hash(chunk_text))
+    add_embeddings(texts=[chunk_text], embeddings=[vector], metadatas=[metadata], ids=[uid])
+    lexical_batch = get_lexical_index().builder()
+    lexical_batch.add(uid, chunk_text)
+    get_lexical_index().add(lexical_batch)
+
+def _format_results(ids, documents, metadatas):
+    """Met en forme les résultats d'une requête sur la collection."""
+    return [{"id": uid,
+             "file_name": metadata["file_name"],
+             "page": metadata["pages"],
+             "timestamp": metadata["timestamp"],
+             "chunk_id": metadata.get("chunk_id"),
+             "content": document} for uid, document, metadata in zip(ids, documents, metadatas)]
+
+def _get_documents_by_ids(ids):
+    """Relit des chunks par ID, dans l'ordre des IDs (les IDs introuvables sont ignorés)."""
+    if not ids:
+        return []
+    found = chroma_db._collection.get(ids=list(ids), include=["documents", "metadatas"])
+    by_id = {uid: (document, metadata) for uid, document, metadata
+             in zip(found["ids"], found["documents"], found["metadatas"])}
+    kept = [uid for uid in ids if uid in by_id]
+    return _format_results(kept, [by_id[uid][0] for uid in kept], [by_id[uid][1] for uid in kept])
 
 def search_documents(query: str = None, top_k: int = 4):
-    """Affiche tous les documents dans ChromaDB."""
-    if query:
-        results = chroma_db.similarity_search(query, k=top_k)
-    else:
-        results = chroma_db.get_all_documents()
-    
-    return [{"file_name": doc.metadata["file_name"], 
-             "page": doc.metadata["pages"],
-             "timestamp": doc.metadata["timestamp"],
-             "chunk_id" : doc.metadata["chunk_id"],
-             "content": doc.page_content} for doc in results]
+    """
+    Recherche les chunks les plus pertinents pour une requête dans ChromaDB.
+    Avec HYBRID_SEARCH, les classements vectoriel et lexical (BM25 : articles,
+    codes, références exactes) sont fusionnés par Reciprocal Rank Fusion.
+    L'embedding de la requête et les IDs des résultats sont mis en cache ;
+    le cache des résultats est vidé à chaque écriture dans la collection.
+
+    :param query: La requête de recherche (None : les `top_k` premiers documents).
+    :param top_k: Le nombre de résultats.
+    :return: Les chunks trouvés, du plus au moins pertinent.
+    """
+    if not query:
+        return get_all_documents(limit=top_k)
+
+    embedding = get_cached_query_embedding(query, embedding_model.embed_query)
+    key = (embedding_key(embedding), top_k)
+
+    result_ids = search_result_cache.get(key)
+    if result_ids is not None:
+        documents = _get_documents_by_ids(result_ids)
+        if len(documents) == len(result_ids):
+            return documents
+
+    candidates = max(top_k, HYBRID_CANDIDATES) if HYBRID_SEARCH else top_k
+    results = chroma_db._collection.query(query_embeddings=[embedding], n_results=candidates,
+                                          include=["documents", "metadatas"])
+    documents = _format_results(results["ids"][0], results["documents"][0], results["metadatas"][0])
+
+    if HYBRID_SEARCH:
+        lexical_ids = [uid for uid, _ in get_lexical_index().search(query, candidates)]
+        fused_ids = reciprocal_rank_fusion([[doc["id"] for doc in documents], lexical_ids], k=RRF_K)[:top_k]
+        by_id = {doc["id"]: doc for doc in documents}
+        missing = _get_documents_by_ids([uid for uid in fused_ids if uid not in by_id])
+        by_id.update((doc["id"], doc) for doc in missing)
+        documents = [by_id[uid] for uid in fused_ids if uid in by_id]
+
+    documents = documents[:top_k]
+    search_result_cache.set(key, [doc["id"] for doc in documents])
+    return documents
+
+def search_file_chunks(query: str, file_hashes: list, top_k: int = 8):
+    """
+    Recherche les chunks les plus proches d'une requête parmi ceux de
+    certains fichiers (ex. les fichiers uploadés dans une conversation).
+
+    :param query: La requête de recherche.
+    :param file_hashes: Les empreintes des fichiers où chercher.
+    :param top_k: Le nombre de résultats.
+    :return: Les chunks trouvés, du plus proche au plus éloigné.
+    """
+    file_hashes = list(dict.fromkeys(file_hashes))
+    if not file_hashes:
+        return []
+    embedding = get_cached_query_embedding(query, embedding_model.embed_query)
+    where = {"file_hash": file_hashes[0]} if len(file_hashes) == 1 else {"file_hash": {"$in": file_hashes}}
+    results = chroma_db._collection.query(query_embeddings=[embedding], n_results=top_k, where=where,
+                                          include=["documents", "metadatas"])
+    return _format_results(results["ids"][0], results["documents"][0], results["metadatas"][0])
+
+def rebuild_lexical_index(batch_size: int = 1000):
+    """
+    Reconstruit l'index lexical à partir de tous les chunks de ChromaDB
+    (ex. pour une collection remplie avant l'ajout de l'index). L'ancien index
+    reste utilisé pendant la reconstruction.
+
+    :param batch_size: Le nombre de chunks lus par requête.
+    :return: Le nombre de chunks indexés.
+    """
+    lexical_index = get_lexical_index()
+    snapshot = lexical_index.begin_rebuild()
+    staged = []  # Segments écrits page par page, publiés ensemble à la fin
+    count = 0
+    offset = 0
+    try:
+        while True:
+            results = chroma_db._collection.get(limit=batch_size, offset=offset, include=["documents"])
+            lexical_batch = lexical_index.builder()
+            for uid, document in zip(results["ids"], results["documents"]):
+                lexical_batch.add(uid, document or "")
+            count += len(lexical_batch)
+            staged = lexical_index.stage(lexical_batch, staged)
+            if len(results["ids"]) < batch_size:
+                break
+            offset += batch_size
+    except Exception:
+        lexical_index.discard(staged)
+        raise
+    # Les recherches voient l'ancien index jusqu'au remplacement du manifeste
+    lexical_index.publish(staged, snapshot)
+    invalidate_search_results()
+    return count
 
 def delete_all_documents_in_collection():
     """
@@ -92,6 +513,8 @@ def delete_all_documents_in_collection():
         if doc_ids:
             chroma_db.delete(ids=doc_ids)  # Supprime tous les documents avec leurs IDs
             chroma_db.persist()  # Sauvegarde les changements
+            get_lexical_index().clear()
+            invalidate_search_results()
             print("Tous les documents ont été supprimés de la collection.")
         else:
             print("Aucun document trouvé à supprimer.")
@@ -100,35 +523,30 @@ def delete_all_documents_in_collection():
     
 def rank_chunks(query, chunks):
     """
-    Utilise BERT pour classer les chunks en fonction de la pertinence par rapport à la requête.
+    Utilise le cross-encoder pour classer les chunks en fonction de la pertinence par rapport à la requête.
     
     :param query: La requête de recherche.
     :param chunks: Les chunks de texte à classer.
     :return: Les chunks classés par pertinence.
     """
-    inputs = tokenizer([query] * len(chunks), chunks, return_tensors='pt', padding=True, truncation=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    scores = outputs.logits[:, 1]  # Supposons que le modèle de classification binaire donne des scores de pertinence
-    ranked_chunks = [chunk for _, chunk in sorted(zip(scores, chunks), key=lambda pair: pair[0], reverse=True)]
-    return ranked_chunks
+    ranked = get_reranker().rerank_sync(query, [{"content": chunk} for chunk in chunks], top_k=len(chunks))
+    return [chunk["content"] for chunk in ranked]
 
 
-def search_documents_ranking(query: str = None, top_k: int = 4):
-    """Recherche des documents dans ChromaDB et les classe en utilisant BERT."""
-    if query:
-        results = chroma_db.similarity_search(query, k=top_k)
-    else:
-        results = chroma_db.get_all_documents()
-    
-    chunks = [{"file_name": doc.metadata["file_name"], 
-               "page": doc.metadata["pages"],
-               "timestamp": doc.metadata["timestamp"],
-               "content": doc.page_content} for doc in results]
-    
-    if query:
-        ranked_chunks = rank_chunks(query, [chunk["content"] for chunk in chunks])
-        for i, chunk in enumerate(ranked_chunks):
-            chunks[i]["content"] = chunk
+def search_documents_ranking(query: str = None, top_k: int = 4, candidates: int = None):
+    """
+    Recherche des documents dans ChromaDB puis les reclasse avec le cross-encoder.
+    Plus de candidats que `top_k` sont récupérés, pour que le reclassement puisse
+    faire remonter des chunks moins bien placés par la recherche vectorielle.
     
-    return chunks[:top_k]
\ No newline at end of file
+    :param query: La requête de recherche (None : tous les documents, sans reclassement).
+    :param top_k: Le nombre de chunks retournés.
+    :param candidates: Le nombre de candidats reclassés (borné par RERANK_MAX_CANDIDATES).
+    :return: Les chunks, du plus au moins pertinent, avec leur score.
+    """
+    if not query:
+        return get_all_documents(limit=top_k)
+
+    candidates = min(max(candidates or RERANK_CANDIDATES, top_k), RERANK_MAX_CANDIDATES)
+    results = search_documents(query, top_k=candidates)
+    return get_reranker().rerank_sync(query, results, top_k=top_k)
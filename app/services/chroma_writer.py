@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+from app.core.chroma_config import chroma_db
+from app.core.config import CHROMA_WRITE_BATCH_SIZE, CHROMA_FLUSH_INTERVAL
+from app.services.search_cache import invalidate_search_results
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChromaBulkWriter:
+    """
+    Accumule des chunks (d'un ou plusieurs documents) et les écrit dans
+    ChromaDB en un seul upsert suivi d'une seule sauvegarde.
+
+    Le tampon est vidé lorsqu'il atteint `max_batch_size`, lorsqu'il est plus
+    vieux que `flush_interval` secondes, ou sur appel explicite à `flush()`.
+    """
+
+    def __init__(self, vectorstore, max_batch_size: int = 1000, flush_interval: float = 2.0):
+        self.vectorstore = vectorstore
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._ids = []
+        self._embeddings = []
+        self._metadatas = []
+        self._documents = []
+        self._first_add = None
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def batch_limit(self):
+        """Taille de batch effective, bornée par la limite du client Chroma."""
+        try:
+            return min(self.max_batch_size, self.vectorstore._client.get_max_batch_size())
+        except AttributeError:
+            return self.max_batch_size
+
+    def add(self, ids: list, embeddings: list, metadatas: list, documents: list):
+        """
+        Ajoute des chunks vectorisés au tampon.
+
+        :param ids: Les identifiants des chunks.
+        :param embeddings: Les vecteurs des chunks.
+        :param metadatas: Les métadonnées des chunks.
+        :param documents: Les textes des chunks.
+        """
+        with self._lock:
+            if self._first_add is None:
+                self._first_add = time.monotonic()
+            self._ids.extend(ids)
+            self._embeddings.extend(embeddings)
+            self._metadatas.extend(metadatas)
+            self._documents.extend(documents)
+
+            if len(self._ids) >= self.batch_limit():
+                self.flush()
+            else:
+                self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Programme un vidage du tampon à l'échéance de l'intervalle."""
+        if self._timer is not None or self.flush_interval <= 0:
+            return
+        self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+            if self._first_add is not None and time.monotonic() - self._first_add >= self.flush_interval:
+                try:
+                    self.flush()
+                except Exception as e:
+                    # Les chunks non écrits sont restés dans le tampon : nouvel essai au prochain intervalle
+                    logger.error(f"Erreur lors de l'écriture différée dans ChromaDB (nouvel essai prévu) : {e}")
+                    self._schedule_flush()
+            elif self._ids:
+                self._schedule_flush()
+
+    def flush(self):
+        """
+        Écrit tout le tampon dans ChromaDB puis sauvegarde une seule fois.
+        Si l'écriture échoue, les chunks non écrits sont remis dans le tampon
+        et l'erreur est relancée.
+
+        :return: Le nombre de chunks écrits.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._ids:
+                return 0
+
+            ids, embeddings, metadatas, documents = self._ids, self._embeddings, self._metadatas, self._documents
+            first_add = self._first_add
+            self._ids, self._embeddings, self._metadatas, self._documents = [], [], [], []
+            self._first_add = None
+
+            limit = self.batch_limit()
+            collection = self.vectorstore._collection
+            start = 0
+            try:
+                for start in range(0, len(ids), limit):
+                    end = start + limit
+                    collection.upsert(
+                        ids=ids[start:end],
+                        embeddings=embeddings[start:end],
+                        metadatas=metadatas[start:end],
+                        documents=documents[start:end],
+                    )
+            except Exception:
+                # Remettre en tête du tampon les chunks non écrits (l'upsert peut être rejoué)
+                self._ids = ids[start:] + self._ids
+                self._embeddings = embeddings[start:] + self._embeddings
+                self._metadatas = metadatas[start:] + self._metadatas
+                self._documents = documents[start:] + self._documents
+                self._first_add = first_add
+                raise
+            self.vectorstore.persist()
+            invalidate_search_results()  # Les résultats en cache ne reflètent plus la collection
+            logger.info(f"{len(ids)} chunks écrits dans ChromaDB")
+            return len(ids)
+
+    def _reset_after_fork(self):
+        """
+        Dans un processus enfant (fork) : le tampon appartient au parent (qui
+        l'écrira) et son minuteur n'existe pas dans l'enfant ; on repart à vide.
+        """
+        self._lock = threading.RLock()
+        self._timer = None
+        self._ids, self._embeddings, self._metadatas, self._documents = [], [], [], []
+        self._first_add = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_bulk_writer() -> ChromaBulkWriter:
+    """Retourne l'écrivain groupé partagé par le processus."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ChromaBulkWriter(
+                    chroma_db,
+                    max_batch_size=CHROMA_WRITE_BATCH_SIZE,
+                    flush_interval=CHROMA_FLUSH_INTERVAL,
+                )
+    return _writer
+
+
+
+def _reset_writer_after_fork():
+    global _writer_lock
+    _writer_lock = threading.Lock()
+    if _writer is not None:
+        _writer._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):  # Pas de fork sous Windows
+    os.register_at_fork(after_in_child=_reset_writer_after_fork)
@@ -0,0 +1,171 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from app.core.config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_QUEUE_SIZE,
+    EMBEDDING_BATCH_WAIT_MS,
+    INFERENCE_BACKEND,
+    MODELS_OFFLINE,
+    ONNX_QUANTIZE,
+)
+from app.services.model_registry import register_model
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    Moteur d'embedding partagé par tout le processus.
+
+    Le modèle est chargé une seule fois (au premier appel). Les demandes sont
+    déposées dans une file bornée et un thread unique les regroupe en gros
+    batchs d'encodage, ce qui permet de fusionner les uploads concurrents.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 64, queue_size: int = 256, batch_wait_ms: int = 5,
+                 backend: str = "torch", quantize: bool = False):
+        self.model_name = model_name
+        self.backend = backend  # "torch" ou "onnx" (ONNX Runtime)
+        self.quantize = quantize  # Int8 dynamique (moteur onnx uniquement)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _get_model(self):
+        """Charge le modèle sentence-transformers une seule fois."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    logger.info(f"Chargement du modèle d'embedding {self.model_name} ({self.backend})")
+                    if self.backend == "onnx":
+                        from app.services.onnx_backend import load_onnx_sentence_transformer
+                        self._model = load_onnx_sentence_transformer(self.model_name, quantize=self.quantize)
+                    else:
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name, local_files_only=MODELS_OFFLINE)
+        return self._model
+
+    def _reset_after_fork(self):
+        """
+        Dans un processus enfant (fork) : le modèle est gardé (partagé avec le
+        parent), mais le thread d'encodage n'existe plus ; la file et les
+        verrous sont recréés et le thread sera relancé à la première demande.
+        """
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._model_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        """Démarre le thread d'encodage s'il ne tourne pas encore."""
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="embedding-engine", daemon=True)
+                    self._worker.start()
+
+    def _collect_batch(self):
+        """
+        Attend une demande puis regroupe celles qui arrivent dans la fenêtre
+        d'attente, jusqu'à remplir un batch.
+        """
+        requests = [self._queue.get()]
+        total = len(requests[0][0])
+        deadline = time.monotonic() + self.batch_wait
+        while total < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            requests.append(item)
+            total += len(item[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect_batch()
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                vectors = self.encode(texts)
+            except Exception as e:
+                logger.error(f"Erreur lors de l'encodage d'un batch de {len(texts)} textes : {e}")
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future in requests:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def encode(self, texts):
+        """Encode directement une liste de textes, sans passer par la file."""
+        model = self._get_model()
+        vectors = model.encode(texts, batch_size=self.batch_size, show_progress_bar=False, convert_to_numpy=True)
+        return vectors.tolist()
+
+    def embed_documents(self, texts):
+        """
+        Vectorise une liste de textes via la file partagée.
+
+        :param texts: Les textes à vectoriser.
+        :return: Une liste de vecteurs, dans le même ordre que les textes.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((texts, future))  # Bloque si la file est pleine (backpressure)
+        return future.result()
+
+    def embed_query(self, text):
+        """Vectorise une requête unique."""
+        return self.embed_documents([text])[0]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_embedding_engine() -> EmbeddingEngine:
+    """Retourne le moteur d'embedding du processus, créé au premier appel."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = EmbeddingEngine(
+                    EMBEDDING_MODEL_NAME,
+                    batch_size=EMBEDDING_BATCH_SIZE,
+                    queue_size=EMBEDDING_QUEUE_SIZE,
+                    batch_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+                    backend=INFERENCE_BACKEND,
+                    quantize=ONNX_QUANTIZE,
+                )
+    return _engine
+
+
+def _reset_engine_after_fork():
+    global _engine_lock
+    _engine_lock = threading.Lock()
+    if _engine is not None:
+        _engine._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):  # Pas de fork sous Windows
+    os.register_at_fork(after_in_child=_reset_engine_after_fork)
+
+# Chargé au premier embedding, ou au démarrage par le préchargement (MODEL_WARMUP)
+register_model("embedding", lambda: get_embedding_engine()._get_model())
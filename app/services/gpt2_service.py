@@ -1,14 +1,414 @@
 # filepath: c:\Users\Skyzo\Desktop\Projet probtp\LLM_BTP\app\services\gpt2_service.py
-from transformers import GPT2LMHeadModel, GPT2Tokenizer
-import torch
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from app.core.config import (
+    GPT2_MODEL_NAME,
+    GPT2_MAX_BATCH_SIZE,
+    GPT2_BATCH_WAIT_MS,
+    GPT2_QUEUE_SIZE,
+    GPT2_STREAM_WORKERS,
+    INFERENCE_BACKEND,
+    MODELS_OFFLINE,
+    ONNX_QUANTIZE,
+)
+from app.services.model_registry import get_model_registry, register_model
+
+
+logger = logging.getLogger(__name__)
+
+
+class GPT2BusyError(Exception):
+    """Levée lorsque la file de génération GPT-2 est pleine."""
+
+
+class GPT2ContextError(ValueError):
+    """Levée lorsqu'un prompt dépasse le contexte du modèle."""
+
+
+# Charger le modèle et le tokenizer GPT-2 (au premier appel, pas à l'import)
+def load_gpt2():
+    if INFERENCE_BACKEND == "onnx":
+        from app.services.onnx_backend import load_ort_model
+        tokenizer, model = load_ort_model("ORTModelForCausalLM", GPT2_MODEL_NAME, quantize=ONNX_QUANTIZE)
+        tokenizer.padding_side = "left"
+        tokenizer.pad_token = tokenizer.eos_token
+        return tokenizer, model
+    from transformers import GPT2LMHeadModel, GPT2Tokenizer
+    tokenizer = GPT2Tokenizer.from_pretrained(GPT2_MODEL_NAME, local_files_only=MODELS_OFFLINE)
+    tokenizer.padding_side = "left"  # Les prompts d'un batch finissent tous à la même position
+    tokenizer.pad_token = tokenizer.eos_token
+    model = GPT2LMHeadModel.from_pretrained(GPT2_MODEL_NAME, local_files_only=MODELS_OFFLINE)
+    model.eval()
+    return tokenizer, model
+
+register_model("gpt2", load_gpt2)
+
+
+def _context_size(tokenizer, model) -> int:
+    """Le nombre maximal de positions du modèle (1024 pour GPT-2)."""
+    return getattr(model.config, "n_positions", None) or tokenizer.model_max_length
+
+
+def _check_prompt_length(tokenizer, model, prompt: str) -> int:
+    """
+    :return: Le nombre de tokens du prompt.
+    :raises GPT2ContextError: Si le prompt ne tient pas dans le contexte du modèle.
+    """
+    length = len(tokenizer(prompt)["input_ids"])
+    context = _context_size(tokenizer, model)
+    if length > context:
+        raise GPT2ContextError(f"Le prompt fait {length} tokens, au-delà du contexte du modèle ({context}).")
+    return length
+
+
+def _context_groups(lengths: list, max_lengths: list, context: int) -> list:
+    """
+    Répartit les requêtes en batchs qui tiennent dans le contexte : les prompts
+    étant complétés à gauche, chaque ligne d'un batch occupe la longueur du plus
+    long prompt plus le plus grand nombre de nouveaux tokens du batch.
+
+    :return: Les listes d'indices des requêtes de chaque batch.
+    """
+    groups = []
+    group, longest, budget = [], 0, 0
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        new_longest = max(longest, lengths[index])
+        new_budget = max(budget, max_lengths[index] - lengths[index])
+        if group and new_longest + new_budget > context:
+            groups.append(group)
+            group, new_longest, new_budget = [], lengths[index], max(max_lengths[index] - lengths[index], 0)
+        group.append(index)
+        longest, budget = new_longest, new_budget
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _token_budget_processor(budgets, prompt_length: int, eos_token_id: int):
+    """
+    Force la fin (token EOS) de chaque séquence du batch une fois son propre
+    nombre de nouveaux tokens atteint : chaque requête garde son `max_length`
+    et la génération du batch s'arrête dès que toutes les séquences sont finies.
+    """
+    import torch
+    from transformers import LogitsProcessor
+
+    budgets = torch.tensor(budgets)
+
+    class TokenBudgetProcessor(LogitsProcessor):
+        def __call__(self, input_ids, scores):
+            done = (input_ids.shape[1] - prompt_length) >= budgets.to(scores.device)
+            if done.any():
+                scores[done] = float("-inf")
+                scores[done, eos_token_id] = 0.0
+            return scores
+
+    return TokenBudgetProcessor()
+
+
+class GPT2BatchScheduler:
+    """
+    Regroupe les prompts reçus en même temps en un seul appel à `generate`.
+
+    Les demandes sont déposées dans une file bornée ; un thread d'inférence
+    attend la première, regroupe celles qui arrivent dans la fenêtre
+    `batch_wait_ms` (jusqu'à `max_batch_size`), complète les prompts à gauche
+    puis génère le batch avec le cache clés/valeurs. Chaque requête garde son
+    `max_length` (longueur totale, prompt compris, comme `generate`) ; les
+    requêtes qui ne tiendraient pas ensemble dans le contexte du modèle sont
+    générées dans des batchs séparés.
+    """
+
+    def __init__(self, max_batch_size: int = 8, batch_wait_ms: int = 10, queue_size: int = 256):
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        """Dans un processus enfant (fork) : la file et le thread d'inférence sont recréés."""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        """Démarre le thread d'inférence s'il ne tourne pas encore."""
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="gpt2-scheduler", daemon=True)
+                    self._worker.start()
+
+    def _collect_batch(self):
+        """Attend une demande puis regroupe celles qui arrivent dans la fenêtre d'attente."""
+        requests = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(requests) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            requests.append(item)
+        return requests
+
+    def _run(self):
+        while True:
+            requests = [request for request in self._collect_batch() if request[2].set_running_or_notify_cancel()]
+            if not requests:
+                continue
+            try:
+                responses = self.generate([prompt for prompt, _, _ in requests],
+                                          [max_length for _, max_length, _ in requests])
+            except Exception as e:
+                logger.error(f"Erreur lors de la génération d'un batch de {len(requests)} prompts : {e}")
+                for _, _, future in requests:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), response in zip(requests, responses):
+                future.set_result(response)
+
+    def generate(self, prompts: list, max_lengths: list) -> list:
+        """
+        Génère directement un batch de prompts, sans passer par la file.
+
+        :param prompts: Les prompts.
+        :param max_lengths: La longueur maximale (prompt compris, en tokens) de chaque réponse,
+                            limitée au contexte du modèle.
+        :return: Les textes générés (prompt compris), dans l'ordre des prompts.
+        :raises GPT2ContextError: Si un prompt dépasse le contexte du modèle.
+        """
+        tokenizer, model = get_model_registry().get("gpt2")
+        context = _context_size(tokenizer, model)
+        lengths = [_check_prompt_length(tokenizer, model, prompt) for prompt in prompts]
+        max_lengths = [min(max_length, context) for max_length in max_lengths]
+
+        responses = [None] * len(prompts)
+        for group in _context_groups(lengths, max_lengths, context):
+            generated = self._generate_batch(tokenizer, model, [prompts[index] for index in group],
+                                             [max_lengths[index] for index in group])
+            for index, response in zip(group, generated):
+                responses[index] = response
+        return responses
+
+    def _generate_batch(self, tokenizer, model, prompts: list, max_lengths: list) -> list:
+        """Génère un batch dont toutes les lignes tiennent dans le contexte du modèle."""
+        import torch
+        encoded = tokenizer(prompts, return_tensors="pt", padding=True)
+        prompt_length = encoded["input_ids"].shape[1]
+        prompt_lengths = encoded["attention_mask"].sum(dim=1).tolist()
+        budgets = [max(max_length - length, 0) for max_length, length in zip(max_lengths, prompt_lengths)]
+
+        if max(budgets) == 0:
+            new_tokens = [[] for _ in prompts]
+        else:
+            with torch.inference_mode():
+                outputs = model.generate(
+                    **encoded,
+                    max_new_tokens=max(budgets),
+                    num_return_sequences=1,
+                    pad_token_id=tokenizer.eos_token_id,
+                    use_cache=True,
+                    logits_processor=[_token_budget_processor(budgets, prompt_length, tokenizer.eos_token_id)],
+                )
+            new_tokens = [outputs[row, prompt_length:prompt_length + budgets[row]].tolist()
+                          for row in range(len(prompts))]
+
+        responses = []
+        for row, tokens in enumerate(new_tokens):
+            prompt_ids = encoded["input_ids"][row, prompt_length - prompt_lengths[row]:].tolist()
+            responses.append(tokenizer.decode(prompt_ids + tokens, skip_special_tokens=True))
+        return responses
+
+    def submit(self, prompt: str, max_length: int) -> Future:
+        """
+        Dépose un prompt dans la file de génération (charge le modèle s'il ne l'est pas encore).
+
+        :return: Un Future résolu avec le texte généré.
+        :raises GPT2ContextError: Si le prompt dépasse le contexte du modèle.
+        :raises GPT2BusyError: Si la file est pleine.
+        """
+        tokenizer, model = get_model_registry().get("gpt2")
+        _check_prompt_length(tokenizer, model, prompt)  # Rejeté avant d'entrer dans un batch
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((prompt, max_length, future))
+        except queue.Full:
+            raise GPT2BusyError("Trop de générations GPT-2 en attente, réessayez plus tard.")
+        return future
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_gpt2_scheduler() -> GPT2BatchScheduler:
+    """Retourne le planificateur de génération GPT-2 du processus, créé au premier appel."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GPT2BatchScheduler(
+                    max_batch_size=GPT2_MAX_BATCH_SIZE,
+                    batch_wait_ms=GPT2_BATCH_WAIT_MS,
+                    queue_size=GPT2_QUEUE_SIZE,
+                )
+    return _scheduler
+
+
+_stream_executor = None
+_stream_executor_lock = threading.Lock()
+
+
+def _get_stream_executor() -> ThreadPoolExecutor:
+    """Retourne le pool de threads des générations en streaming, créé au premier appel."""
+    global _stream_executor
+    if _stream_executor is None:
+        with _stream_executor_lock:
+            if _stream_executor is None:
+                _stream_executor = ThreadPoolExecutor(max_workers=GPT2_STREAM_WORKERS, thread_name_prefix="gpt2-stream")
+    return _stream_executor
+
+
+def _reset_scheduler_after_fork():
+    global _scheduler_lock, _stream_executor, _stream_executor_lock
+    _scheduler_lock = threading.Lock()
+    if _scheduler is not None:
+        _scheduler._reset_after_fork()
+    _stream_executor = None
+    _stream_executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):  # Pas de fork sous Windows
+    os.register_at_fork(after_in_child=_reset_scheduler_after_fork)
 
-# Charger le modèle et le tokenizer GPT-2
-model_name = "gpt2"
-tokenizer = GPT2Tokenizer.from_pretrained(model_name)
-model = GPT2LMHeadModel.from_pretrained(model_name)
 
 def generate_gpt2_response(prompt: str, max_length: int = 100):
-    inputs = tokenizer.encode(prompt, return_tensors="pt")
-    outputs = model.generate(inputs, max_length=max_length, num_return_sequences=1)
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return response
\ No newline at end of file
+    return get_gpt2_scheduler().submit(prompt, max_length).result()
+
+async def check_gpt2_prompt(prompt: str) -> int:
+    """
+    Vérifie qu'un prompt tient dans le contexte du modèle, avant de répondre
+    (ex. avant d'ouvrir un flux SSE). Le modèle est chargé hors de la boucle asyncio.
+
+    :return: Le nombre de tokens du prompt.
+    :raises GPT2ContextError: Si le prompt dépasse le contexte du modèle.
+    """
+    tokenizer, model = await asyncio.to_thread(get_model_registry().get, "gpt2")
+    return _check_prompt_length(tokenizer, model, prompt)
+
+async def agenerate_gpt2_response(prompt: str, max_length: int = 100):
+    """
+    Génère une réponse GPT-2 sans bloquer la boucle asyncio : le prompt est
+    regroupé avec les requêtes concurrentes dans le thread d'inférence.
+    """
+    await asyncio.to_thread(get_model_registry().get, "gpt2")  # Chargement éventuel hors de la boucle
+    future = get_gpt2_scheduler().submit(prompt, max_length)
+    return await asyncio.wrap_future(future)
+
+
+# Marque la fin de la génération dans la file du streaming
+_STREAM_END = object()
+
+
+def _async_text_streamer(tokenizer, loop, chunks: asyncio.Queue):
+    """
+    Pont entre le thread de génération et la boucle asyncio (équivalent de
+    TextIteratorStreamer sans thread bloqué en lecture) : chaque morceau de
+    texte décodé est déposé dans une asyncio.Queue.
+    """
+    from transformers import TextStreamer
+
+    class AsyncTextStreamer(TextStreamer):
+        def on_finalized_text(self, text: str, stream_end: bool = False):
+            if text:
+                _call_soon(loop, chunks.put_nowait, text)
+
+    return AsyncTextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+
+def _cancel_criteria(cancelled: threading.Event):
+    """Arrête la génération au token suivant dès que `cancelled` est levé (client déconnecté)."""
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([CancelCriteria()])
+
+
+def _call_soon(loop, callback, *args):
+    try:
+        loop.call_soon_threadsafe(callback, *args)
+    except RuntimeError:
+        pass  # Boucle fermée : plus personne n'attend le résultat
+
+
+async def stream_gpt2_response(prompt: str, max_length: int = 100):
+    """
+    Génère une réponse GPT-2 token par token, dans un thread de génération dédié.
+
+    Si le consommateur s'arrête (client déconnecté), la génération est
+    interrompue au token suivant et ne consomme plus de CPU.
+
+    :param prompt: Le prompt.
+    :param max_length: La longueur maximale (prompt compris, en tokens).
+    :return: Un générateur asynchrone de couples (événement, données) :
+             ("token", texte) puis ("done", réponse complète, nombre de tokens générés et durées).
+    """
+    started_at = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    tokenizer, model = await asyncio.to_thread(get_model_registry().get, "gpt2")
+    chunks = asyncio.Queue()
+    cancelled = threading.Event()
+    streamer = _async_text_streamer(tokenizer, loop, chunks)
+    _check_prompt_length(tokenizer, model, prompt)
+    max_length = min(max_length, _context_size(tokenizer, model))
+    inputs = tokenizer(prompt, return_tensors="pt")
+
+    def run():
+        if cancelled.is_set():
+            return None  # Client parti avant le début de la génération
+        import torch
+        with torch.inference_mode():
+            return model.generate(
+                **inputs,
+                max_length=max_length,
+                num_return_sequences=1,
+                pad_token_id=tokenizer.eos_token_id,
+                use_cache=True,
+                streamer=streamer,
+                stopping_criteria=_cancel_criteria(cancelled),
+            )
+
+    future = _get_stream_executor().submit(run)
+    future.add_done_callback(lambda _: _call_soon(loop, chunks.put_nowait, _STREAM_END))
+    first_token = None
+    try:
+        while True:
+            text = await chunks.get()
+            if text is _STREAM_END:
+                break
+            if first_token is None:
+                first_token = time.perf_counter() - started_at
+            yield "token", text
+        outputs = future.result()  # Relance l'erreur de génération éventuelle
+        yield "done", {
+            "response": tokenizer.decode(outputs[0], skip_special_tokens=True),
+            "generated_tokens": outputs.shape[1] - inputs["input_ids"].shape[1],
+            "timings": {
+                "first_token": round(first_token, 4) if first_token is not None else None,
+                "total": round(time.perf_counter() - started_at, 4),
+            },
+        }
+    finally:
+        cancelled.set()
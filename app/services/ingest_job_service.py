@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from app.core.config import INGEST_JOB_CONCURRENCY, INGEST_JOB_LEASE
+from app.services.ingestion_service import ingest_file
+from app.services.mongo_service import (
+    claim_unfinished_ingest_job,
+    get_ingest_job,
+    insert_ingest_job,
+    renew_ingest_job_lease,
+    update_ingest_job,
+    update_ingest_job_file,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Identifiant de ce worker : propriétaire des baux des jobs qu'il exécute
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex}"
+
+# Garder une référence sur les tâches en cours (sinon elles peuvent être collectées)
+_running_tasks = set()
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _lease_end():
+    return _now() + timedelta(seconds=INGEST_JOB_LEASE)
+
+
+def _schedule(job_id: str):
+    task = asyncio.create_task(run_ingest_job(job_id))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+
+
+async def create_folder_job(folder_path: str) -> str:
+    """
+    Crée un job d'ingestion pour tous les fichiers d'un dossier et le lance
+    en arrière-plan.
+
+    :param folder_path: Le dossier à ingérer.
+    :return: L'ID du job.
+    """
+    file_names = sorted(
+        file_name for file_name in os.listdir(folder_path)
+        if os.path.isfile(os.path.join(folder_path, file_name))
+    )
+    now = _now()
+    job = {
+        "folder_path": folder_path,
+        "status": "pending",
+        "created_at": now,
+        "updated_at": now,
+        "claimed_at": now,
+        "owner": WORKER_ID,
+        "lease_until": _lease_end(),
+        "total_files": len(file_names),
+        "processed_files": 0,
+        "files": [{"file_name": file_name, "status": "pending"} for file_name in file_names],
+    }
+    job_id = await insert_ingest_job(job)
+    _schedule(job_id)
+    return job_id
+
+
+async def _ingest_job_file(job_id: str, folder_path: str, index: int, file_name: str, slots: asyncio.Semaphore):
+    """Ingère un fichier d'un job et enregistre sa progression."""
+    async with slots:
+        await update_ingest_job_file(job_id, index, {"status": "running", "started_at": _now()})
+        try:
+            # Écriture immédiate : un fichier marqué "success" doit être persisté pour la reprise
+            chunk_count = await ingest_file(os.path.join(folder_path, file_name), timeout=None, collect=False)
+            fields = {"status": "success", "chunks": chunk_count}
+        except Exception as e:
+            logger.error(f"Erreur lors de l'ingestion de {file_name} (job {job_id}) : {e}")
+            fields = {"status": "error", "message": str(e)}
+        fields["finished_at"] = _now()
+        await update_ingest_job_file(job_id, index, fields, processed_increment=1)
+        await update_ingest_job(job_id, {"updated_at": _now()})
+
+
+async def _keep_lease(job_id: str, job_task: asyncio.Task):
+    """
+    Renouvelle le bail du job tant qu'il s'exécute. Si le job a été repris par
+    un autre worker (bail expiré, par exemple après une longue pause), son
+    exécution ici est annulée pour qu'il ne tourne pas deux fois.
+    """
+    while True:
+        await asyncio.sleep(INGEST_JOB_LEASE / 3)
+        try:
+            renewed = await renew_ingest_job_lease(job_id, WORKER_ID, _lease_end())
+        except Exception as e:
+            logger.error(f"Impossible de renouveler le bail du job {job_id} : {e}")
+            continue
+        if not renewed:
+            logger.warning(f"Le job d'ingestion {job_id} a été repris par un autre worker, arrêt ici.")
+            job_task.cancel()
+            return
+
+
+async def run_ingest_job(job_id: str):
+    """
+    Exécute (ou reprend) un job d'ingestion : les fichiers déjà traités sont
+    ignorés, les autres sont ingérés en parallèle.
+    """
+    job = await get_ingest_job(job_id)
+    if job is None:
+        logger.error(f"Job d'ingestion introuvable : {job_id}")
+        return
+
+    await update_ingest_job(job_id, {"status": "running", "updated_at": _now()})
+    heartbeat = asyncio.create_task(_keep_lease(job_id, asyncio.current_task()))
+    try:
+        await _run_job_files(job_id, job)
+    finally:
+        heartbeat.cancel()
+
+
+async def _run_job_files(job_id: str, job: dict):
+    """Ingère les fichiers restants d'un job et enregistre son état final."""
+    slots = asyncio.Semaphore(INGEST_JOB_CONCURRENCY)
+    remaining = [
+        (index, file["file_name"]) for index, file in enumerate(job["files"])
+        if file["status"] not in ("success", "error")
+    ]
+    processed = len(job["files"]) - len(remaining)
+
+    try:
+        await asyncio.gather(*[
+            _ingest_job_file(job_id, job["folder_path"], index, file_name, slots)
+            for index, file_name in remaining
+        ])
+    except Exception as e:
+        logger.error(f"Le job d'ingestion {job_id} a échoué : {e}")
+        await update_ingest_job(job_id, {"status": "failed", "message": str(e), "updated_at": _now()})
+        return
+
+    await update_ingest_job(job_id, {
+        "status": "completed",
+        "processed_files": processed + len(remaining),
+        "updated_at": _now(),
+    })
+    logger.info(f"Job d'ingestion {job_id} terminé")
+
+
+async def _claim_expired_jobs():
+    """Reprend les jobs dont le bail a expiré."""
+    while True:
+        job_id = await claim_unfinished_ingest_job(_now(), _lease_end(), WORKER_ID)
+        if job_id is None:
+            break
+        logger.info(f"Reprise du job d'ingestion {job_id}")
+        _schedule(job_id)
+
+
+async def _watch_ingest_jobs():
+    """Cherche les jobs abandonnés par un worker arrêté : au démarrage, puis régulièrement."""
+    while True:
+        try:
+            await _claim_expired_jobs()
+        except Exception as e:
+            # MongoDB indisponible : nouvel essai au prochain tour
+            logger.error(f"Erreur lors de la reprise des jobs d'ingestion : {e}")
+        await asyncio.sleep(INGEST_JOB_LEASE)
+
+
+def resume_ingest_jobs():
+    """
+    Reprend en arrière-plan les jobs interrompus (bail expiré) puis surveille ceux
+    que d'autres workers abandonneraient (appelé au démarrage, sans attendre MongoDB).
+    """
+    task = asyncio.create_task(_watch_ingest_jobs())
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.core.config import (
+    EMBEDDING_MODEL_NAME,
+    INGESTION_WORKERS,
+    INGESTION_MAX_PENDING,
+    INGESTION_QUEUE_TIMEOUT,
+    INGESTION_STREAM_QUEUE_SIZE,
+)
+from app.services.chroma_service import ChunkStats, plan_file_ingestion, store_chunk_batches
+from app.services.mongo_service import (
+    get_complete_chunk_count,
+    get_file_catalog_entry,
+    get_shared_file_hashes,
+    upsert_file_catalog_entry,
+)
+from app.utils.file_processing import compute_file_hash, stream_prepared_batches
+
+
+logger = logging.getLogger(__name__)
+
+# Valeur par défaut de `timeout` : attendre INGESTION_QUEUE_TIMEOUT secondes
+_DEFAULT_TIMEOUT = object()
+
+
+class IngestionBusyError(Exception):
+    """Levée lorsque le pool d'ingestion est saturé."""
+
+
+_executor = None
+_manager = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def get_ingestion_pool() -> ProcessPoolExecutor:
+    """
+    Retourne le pool de processus d'ingestion, créé au premier appel.
+    Chaque processus charge son propre moteur d'embedding une seule fois.
+    """
+    global _executor, _manager
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                context = multiprocessing.get_context("spawn")  # Pas de fork avec torch déjà chargé
+                # Le manager fournit les files (partageables avec le pool) qui ramènent les batchs ;
+                # il est gardé quand seul le pool est recréé (après un BrokenProcessPool)
+                if _manager is None:
+                    _manager = context.Manager()
+                _executor = ProcessPoolExecutor(max_workers=INGESTION_WORKERS, mp_context=context)
+    return _executor
+
+
+def shutdown_ingestion_pool():
+    """Arrête le pool d'ingestion (à l'arrêt de l'application)."""
+    global _executor, _manager
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
+
+
+def _reset_pool_after_fork():
+    """
+    Dans un processus enfant (fork) : le pool et le manager appartiennent au
+    parent, l'enfant créera les siens au premier fichier.
+    """
+    global _executor, _manager, _executor_lock, _slots
+    _executor = None
+    _manager = None
+    _executor_lock = threading.Lock()
+    _slots = None
+
+
+if hasattr(os, "register_at_fork"):  # Pas de fork sous Windows
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(INGESTION_MAX_PENDING)
+    return _slots
+
+
+async def _acquire_slot(timeout):
+    """
+    Réserve une place dans le pool. Lève IngestionBusyError si aucune place
+    ne se libère avant `timeout` secondes (None : attendre indéfiniment).
+    """
+    slots = _get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise IngestionBusyError("Le pool d'ingestion est saturé, réessayez plus tard.")
+
+
+def _drain_batches(batch_queue, future):
+    """
+    Lit les batchs envoyés par le processus d'ingestion jusqu'au signal de fin.
+
+    :param batch_queue: La file alimentée par stream_prepared_batches.
+    :param future: La tâche du pool, surveillée si le worker meurt sans signal de fin.
+    :return: Un générateur de batchs de chunks.
+    """
+    while True:
+        try:
+            kind, payload = batch_queue.get(timeout=1)
+        except queue.Empty:
+            if future.done():
+                future.result()  # Relance l'erreur du worker (ex. BrokenProcessPool)
+                raise RuntimeError("Le processus d'ingestion s'est arrêté sans terminer le fichier.")
+            continue
+        if kind == "batch":
+            yield payload
+        elif kind == "error":
+            raise ValueError(payload)
+        else:
+            return
+
+
+async def ingest_file(file_path: str, flush: bool = True, timeout=_DEFAULT_TIMEOUT, collect: bool = True,
+                      force: bool = False):
+    """
+    Ingère un fichier sans bloquer la boucle asyncio : le parsing et l'embedding
+    tournent dans le pool de processus et les batchs sont écrits dans Chroma
+    (depuis un thread) au fur et à mesure qu'ils arrivent. La mémoire utilisée
+    est bornée par la taille des batchs, pas par celle du document.
+    Un fichier inchangé n'est pas retraité ; pour un fichier modifié, seuls les
+    chunks modifiés sont vectorisés.
+
+    :param file_path: Chemin du fichier à traiter.
+    :param flush: Écrire les chunks tout de suite dans ChromaDB.
+    :param timeout: Temps d'attente maximal d'une place libre dans le pool.
+    :param collect: Retourner les chunks stockés (sans vecteurs) ; sinon seulement leur nombre.
+    :param force: Retraiter le fichier même inchangé (les vecteurs existants sont réutilisés
+                  et les anciens chunks ne sont supprimés qu'après l'écriture des nouveaux).
+    :return: Les chunks stockés, ou leur nombre.
+    Le fichier est enregistré dans le catalogue (voir record_file_catalog).
+    """
+    global _executor
+    if timeout is _DEFAULT_TIMEOUT:
+        timeout = INGESTION_QUEUE_TIMEOUT
+
+    file_hash = await asyncio.to_thread(compute_file_hash, file_path)
+    complete_chunk_count = None
+    shared_hashes = set()
+    try:
+        if not force:
+            complete_chunk_count = await get_complete_chunk_count(file_hash)
+        # Chunks partagés avec un fichier de même contenu catalogué sous un autre nom : à garder
+        shared_hashes = await get_shared_file_hashes(os.path.basename(file_path))
+    except Exception as e:
+        logger.error(f"Catalogue indisponible, le fichier sera retraité : {e}")
+    stored_chunks, previous_hashes, previous_ids = await asyncio.to_thread(
+        plan_file_ingestion, file_path, file_hash, complete_chunk_count, shared_hashes)
+    if stored_chunks:
+        logger.info(f"Fichier inchangé, ingestion ignorée : {file_path}")
+        if await get_file_catalog_entry(os.path.basename(file_path)) is None:
+            stats = ChunkStats()
+            for chunk in stored_chunks:
+                stats.add(chunk)
+            await record_file_catalog(file_path, stats.as_dict(time.time()))
+        return stored_chunks if collect else len(stored_chunks)
+
+    await _acquire_slot(timeout)
+    pool = None
+    cancel_event = None
+    try:
+        pool = get_ingestion_pool()
+        batch_queue = _manager.Queue(maxsize=INGESTION_STREAM_QUEUE_SIZE)  # Bornée : le worker attend l'écriture
+        cancel_event = _manager.Event()  # Levé si l'écriture échoue : le worker arrête d'envoyer des batchs
+        future = pool.submit(stream_prepared_batches, file_path, list(previous_hashes.keys()), batch_queue,
+                             cancel_event=cancel_event)
+        result, stats = await asyncio.to_thread(
+            store_chunk_batches,
+            _drain_batches(batch_queue, future),
+            flush,
+            previous_hashes,
+            previous_ids,
+            collect,
+            True,
+            os.path.abspath(file_path),
+        )
+    except BrokenProcessPool:
+        # Un worker est mort (mémoire, segfault...) : on recrée le pool au prochain appel
+        logger.error("Le pool d'ingestion est cassé, il sera recréé.")
+        with _executor_lock:
+            if _executor is pool:  # Pas déjà recréé par une autre ingestion
+                _executor.shutdown(wait=False, cancel_futures=True)  # Libère les processus restants
+                _executor = None
+        raise
+    finally:
+        if cancel_event is not None:
+            try:
+                cancel_event.set()
+            except Exception:
+                pass  # Manager arrêté : le worker est déjà parti
+        _get_slots().release()
+
+    # Écrite en dernier : marque l'ingestion comme complète (voir plan_file_ingestion)
+    await record_file_catalog(file_path, stats)
+    return result
+
+
+async def record_file_catalog(file_path: str, stats: dict):
+    """
+    Enregistre la fiche d'un fichier ingéré dans le catalogue (MongoDB).
+    Une erreur du catalogue n'interrompt pas l'ingestion.
+
+    :param file_path: Chemin du fichier ingéré.
+    :param stats: Les statistiques retournées par store_chunk_batches.
+    """
+    entry = {
+        "file_name": os.path.basename(file_path),
+        "file_hash": stats["file_hash"],
+        "chunk_count": stats["chunk_count"],
+        "page_count": stats["page_count"],
+        "byte_size": os.path.getsize(file_path),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "ingested_at": datetime.fromtimestamp(stats["ingested_at"], timezone.utc),
+        "source_path": os.path.abspath(file_path),
+    }
+    try:
+        await upsert_file_catalog_entry(entry)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'enregistrement de {file_path} dans le catalogue : {e}")
@@ -0,0 +1,36 @@
+import logging
+import threading
+from app.core.config import BM25_INDEX_PATH, BM25_MAX_SEGMENTS
+from app.utils.bm25_index import BM25Index
+
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> BM25Index:
+    """Retourne l'index lexical (BM25) du processus, ouvert au premier appel."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = BM25Index(BM25_INDEX_PATH, max_segments=BM25_MAX_SEGMENTS)
+    return _index
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list:
+    """
+    Fusionne plusieurs classements (listes d'identifiants, du meilleur au moins bon)
+    par Reciprocal Rank Fusion : score = somme des 1 / (k + rang).
+
+    :param rankings: Les classements à fusionner.
+    :param k: La constante de lissage (60 dans l'article d'origine).
+    :return: Les identifiants, du meilleur au moins bon score fusionné.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, uid in enumerate(ranking, start=1):
+            scores[uid] = scores.get(uid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
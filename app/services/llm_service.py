@@ -1,33 +1,34 @@
+import asyncio
+import hashlib
+import json
 import os
 import logging
+import time
+from datetime import datetime, timezone
+import numpy as np
 from langchain_openai import ChatOpenAI, OpenAI
 from langchain.chains.question_answering import load_qa_chain
 from langchain.chains import LLMChain
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import SystemMessage, HumanMessage
-import nltk
-print(nltk.data.path)
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from transformers import AutoModelForCausalLM, AutoTokenizer
 
 
-from app.services.mongo_service import get_uploaded_chunks, update_uploaded_chunks
-
-# Définir le chemin des données NLTK
-nltk_data_path = "/root/nltk_data"
-if not os.path.exists(nltk_data_path):
-    os.makedirs(nltk_data_path)
-nltk.data.path.append(nltk_data_path)
-
-# Télécharger les ressources nécessaires
-nltk.download('punkt', download_dir=nltk_data_path)
-nltk.download('stopwords', download_dir=nltk_data_path)
-nltk.download('punkt_tab')
-
-#Biblioteque pour le traitement de texte stopwords
-# nltk.download('stopwords')
-# nltk.download('punkt')
+from app.core.config import LLM_MODEL_NAME, UPLOAD_EMBEDDING_CACHE_SIZE, UPLOAD_TOP_K
+from app.services.chroma_service import search_file_chunks
+from app.services.embedding_service import get_embedding_engine
+from app.services.mongo_service import (
+    add_uploaded_files,
+    get_history_summary,
+    get_uploaded_chunks,
+    get_uploaded_files,
+    set_history_summary,
+)
+from app.services.response_cache import get_response_cache, make_context_key
+from app.services.prompt_service import get_prompt_assembler
+from app.services.search_cache import get_cached_query_embedding
+from app.utils.cache import TTLCache
+from app.utils.file_processing import compute_chunk_hash
+from app.utils.nltk_resources import french_stopwords, tokenize
 
 # Configure the logger
 logging.basicConfig(level=logging.INFO)
@@ -44,16 +45,20 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 # Définir la longueur maximale de l'historique
 MAX_HISTORY_LENGTH = 5000
 
+# Embeddings des chunks uploadés (pour les classer par pertinence à chaque tour)
+upload_embedding_cache = TTLCache(maxsize=UPLOAD_EMBEDDING_CACHE_SIZE, ttl=3600)
+
 # Initialiser le modèle OpenAI
 llm = ChatOpenAI(
     temperature=0.7,
-    model_name="gpt-3.5-turbo",
-    api_key=openai_api_key)
+    model_name=LLM_MODEL_NAME,
+    api_key=openai_api_key,
+    stream_usage=True)  # Le dernier chunk du streaming porte l'usage des tokens
 
 # Fonction pour supprimer les stopwords d'un texte
 def remove_stopwords(text):
-    stop_words = set(stopwords.words('french'))
-    word_tokens = word_tokenize(text)
+    stop_words = french_stopwords()
+    word_tokens = tokenize(text)
     filtered_tokens = [word for word in word_tokens if word.lower() not in stop_words]
     return filtered_tokens
 
@@ -107,57 +112,175 @@ async def summarize_history(history: str) -> str:
 
 
 
-# Fonction pour générer une réponse à partir du LLM OpenAI (fonction principale)
-async def generate_response(query: str, documents: list, history: str, folder_chunks: list, conversation_id: str) -> str:
+# Fonction pour découper l'historique en messages
+def split_history(history: str) -> list:
     """
-    Génère une réponse à partir du LLM en utilisant la requête, les documents fournis et les chunks de fichier.
-    
-    :parametre query: La requête de l'utilisateur.
-    :parametre documents: Les documents à utiliser pour générer la réponse.
-    :parametre history: L'historique des messages précédents.
-    :parametre folder_chunks: Les chunks de fichier à inclure dans les messages.
-    :return: La réponse générée par le LLM.
+    Découpe l'historique en messages. Le frontend envoie les textes des messages
+    joints par des retours à la ligne (un message sur plusieurs lignes compte
+    alors pour plusieurs, sans effet sur l'offset : l'historique ne fait que
+    s'allonger). Une liste JSON de messages ({"type", "text"}) est aussi acceptée.
     """
+    try:
+        items = json.loads(history)
+    except ValueError:
+        items = None
+    if isinstance(items, list):
+        return [f"{item.get('type', '')}: {item.get('text', '')}" if isinstance(item, dict) else str(item)
+                for item in items]
+    return history.splitlines()
 
-    if len(history) > MAX_HISTORY_LENGTH:
-        #history = history[-MAX_HISTORY_LENGTH:]
-        history = await summarize_history(history)
-        # si conerstaion_id est fourni, récupérer les chunks existants depuis MongoDB
-    if conversation_id:
-        # Récupérer les chunks existants depuis MongoDB
-        existing_chunks = await get_uploaded_chunks(conversation_id)
 
-        # Si aucun chunk n'existe, ajouter les nouveaux chunks
-        if not existing_chunks:
-            new_chunks = [chunk["chunk"] for chunk in folder_chunks if "chunk" in chunk]
-            if new_chunks:
-                await update_uploaded_chunks(conversation_id, new_chunks)
-                logger.info(f"Nouveaux chunks ajoutés à la conversation {conversation_id}")
-        else:
-            logger.info(f"Chunks existants pour la conversation {conversation_id}")
+def _hash_messages(messages: list) -> str:
+    return hashlib.sha256("\0".join(messages).encode("utf-8")).hexdigest()
+
+
+# Fonction pour intégrer les nouveaux messages à un résumé existant
+async def fold_history_summary(summary: str, new_messages: str) -> str:
+    """
+    Met à jour un résumé de conversation avec les messages échangés depuis.
+    """
+    messages = [
+        SystemMessage(content="Vous êtes un assistant qui résume des textes en gardant les information les plus importante."),
+        HumanMessage(content=f"Voici le résumé de la conversation jusqu'ici: {summary}\n\n"
+                             f"Voici les nouveaux messages: {new_messages}\n\n"
+                             "Mettez à jour le résumé en y intégrant les nouveaux messages.")
+    ]
+
+    logger.info(f"Envoyer au LLM pour mise à jour du résumé: {messages}")
 
-        folder_chunks.extend(existing_chunks or [])
+    response = await llm.agenerate([messages])
+    return response.generations[0][0].text
 
 
-    # if folder_chunks:
-    #     new_chunks = [chunk["chunk"] for chunk in folder_chunks]
-    #     await update_uploaded_chunks(conversation_id, new_chunks)
-    #     folder_chunks.extend(new_chunks)
+# Fonction pour obtenir l'historique à envoyer au LLM (résumé glissant)
+async def get_prompt_history(history: str, conversation_id: str = None) -> str:
+    """
+    Réduit un historique trop long. Le résumé est enregistré sur la conversation
+    avec le nombre de messages qu'il couvre (offset) et l'empreinte de ces
+    messages : aux tours suivants, seuls les nouveaux messages sont ajoutés,
+    et le résumé n'est recalculé (à partir de lui-même et des nouveaux messages)
+    que lorsque l'ensemble dépasse MAX_HISTORY_LENGTH.
+
+    :param history: L'historique envoyé par le frontend.
+    :param conversation_id: La conversation où est stocké le résumé (sinon : résumé complet).
+    :return: L'historique à envoyer au LLM.
+    """
+    if len(history) <= MAX_HISTORY_LENGTH:
+        return history
+    if not conversation_id:
+        return await summarize_history(history)
+
+    messages = split_history(history)
+    state = await get_history_summary(conversation_id)
+    summary, offset = "", 0
+    if state and state["offset"] <= len(messages) and state["prefix_hash"] == _hash_messages(messages[:state["offset"]]):
+        summary, offset = state["summary"], state["offset"]
+    else:
+        logger.info(f"Aucun résumé réutilisable pour la conversation {conversation_id}")
+
+    delta = "\n".join(messages[offset:])
+    if summary and len(summary) + len(delta) <= MAX_HISTORY_LENGTH:
+        # Le résumé et les derniers messages tiennent dans la limite : pas d'appel au LLM
+        return f"Résumé de la conversation: {summary}\n\nMessages récents:\n{delta}" if delta else summary
+
+    summary = await fold_history_summary(summary, delta) if summary else await summarize_history(delta)
+    await set_history_summary(conversation_id, {
+        "summary": summary,
+        "offset": len(messages),
+        "prefix_hash": _hash_messages(messages),
+        "updated_at": datetime.now(timezone.utc),
+    })
+    return summary
 
 
+# Fonction pour classer les chunks uploadés par pertinence
+def rank_uploaded_chunks(query: str, texts: list) -> list:
+    """
+    Calcule la similarité cosinus entre la requête et chaque chunk uploadé.
+    Les embeddings des chunks sont gardés en cache : la conversation renvoie
+    les mêmes chunks à chaque tour.
+
+    :return: Les scores, dans l'ordre des textes.
+    """
+    engine = get_embedding_engine()
+    query_vector = np.asarray(get_cached_query_embedding(query, engine.embed_query), dtype=np.float32)
+    keys = [compute_chunk_hash(text) for text in texts]
+    missing = [index for index, key in enumerate(keys) if upload_embedding_cache.get(key) is None]
+    if missing:
+        for index, vector in zip(missing, engine.embed_documents([texts[index] for index in missing])):
+            upload_embedding_cache.set(keys[index], np.asarray(vector, dtype=np.float32))
+    scores = []
+    for index, key in enumerate(keys):
+        vector = upload_embedding_cache.get(key)
+        if vector is None:  # Évincé entre-temps
+            vector = np.asarray(engine.embed_query(texts[index]), dtype=np.float32)
+        norm = np.linalg.norm(vector) * np.linalg.norm(query_vector)
+        scores.append(float(np.dot(vector, query_vector) / norm) if norm else 0.0)
+    return scores
+
+
+# Fonction pour préparer les messages envoyés au LLM (historique, documents, chunks uploadés)
+async def build_messages(query: str, documents: list, history: str, uploaded_files: list, conversation_id: str):
+    """
+    Construit les messages envoyés au LLM.
+
+    :param query: La requête de l'utilisateur.
+    :param documents: Les documents à utiliser pour générer la réponse.
+    :param history: L'historique des messages précédents.
+    :param uploaded_files: Les fichiers uploadés avec la requête ({"file_name", "file_hash"}).
+    :param conversation_id: La conversation dont on récupère les fichiers uploadés.
+    :return: (messages, historique envoyé, chunks uploadés retenus, décompte des tokens du prompt)
+    """
+
+    # Historique trop long : résumé glissant (persisté sur la conversation)
+    history = await get_prompt_history(history, conversation_id)
+
+    # Fichiers uploadés : la conversation ne garde que leurs références, les chunks restent dans ChromaDB
+    uploaded_files = list(uploaded_files)
+    legacy_chunks = []
+    if conversation_id:
+        if uploaded_files:
+            await add_uploaded_files(conversation_id, uploaded_files)
+            logger.info(f"Nouveaux fichiers ajoutés à la conversation {conversation_id}")
+        uploaded_files.extend(await get_uploaded_files(conversation_id))
+        # Anciennes conversations : chunks copiés dans MongoDB avant les références
+        legacy_chunks = await get_uploaded_chunks(conversation_id)
+
+    # Seuls les chunks uploadés les plus pertinents pour la question sont envoyés
+    folder_chunks = await asyncio.to_thread(
+        search_file_chunks, query, [file["file_hash"] for file in uploaded_files], UPLOAD_TOP_K
+    )
+    folder_chunks = [{"file_name": chunk["file_name"], "chunk": chunk["content"]} for chunk in folder_chunks]
+    folder_chunks.extend(legacy_chunks)
+
+    if not any(doc["content"] for doc in documents):
+        raise ValueError("Le contexte est vide. Assurez-vous que les documents contiennent des données.")
+
+    # Budget de tokens par section : historique, chunks retrouvés, chunks uploadés
+    instructions = [
+        "Vous êtes un assistant utile et concis.",
+        "Voici l'historique de la conversation: ",
+        "Voici les documents en rapport avec la demande de l'utilisateur: ",
+        "Le nom des fichiers: " + "\n\n".join([str(doc["file_name"]) for doc in documents]),
+        "Voici les Pages respectives des chunks: " + "\n\n".join([str(doc["page"]) for doc in documents]),
+        "Voici les IDs respectifs des chunks: " + "\n\n".join([str(doc["chunk_id"]) for doc in documents]),
+        "Voici le document uploadé: ",
+        f"Voici la demande de l'utilisateur: {query}",
+        query,
+    ]
+    history, documents, uploaded_texts, prompt_tokens = await asyncio.to_thread(
+        get_prompt_assembler().assemble, query, instructions, history, documents, folder_chunks,
+        rank_uploaded_chunks if legacy_chunks else None  # Les chunks retrouvés sont déjà classés
+    )
 
     context = "\n\n".join([doc["content"] for doc in documents])
     metadata = "\n\n".join([str(doc["file_name"]) for doc in documents])
     page = "\n\n".join([str(doc["page"]) for doc in documents])
     chunks_id = "\n\n".join([str(doc["chunk_id"]) for doc in documents])
+    uploaded = "\n\n".join(uploaded_texts)
 
     history_sw = remove_stopwords(history)
     query_sw = remove_stopwords(query)
-
-
-
-    if not context:
-        raise ValueError("Le contexte est vide. Assurez-vous que les documents contiennent des données.")
     
     # Créer le message structuré à envoyer au LLM
     messages = [
@@ -167,7 +290,7 @@ async def generate_response(query: str, documents: list, history: str, folder_ch
         SystemMessage(content=f"Le nom des fichiers: {metadata}"),
         SystemMessage(content=f"Voici les Pages respectives des chunks: {page}"),
         SystemMessage(content=f"Voici les IDs respectifs des chunks: {chunks_id}"),
-        SystemMessage(content=f"Voici le document uploadé: {folder_chunks}"),
+        SystemMessage(content=f"Voici le document uploadé: {uploaded}"),
         SystemMessage(content=f"Voici la demande de l'utilisateur: {query}"),
     ]
 
@@ -189,12 +312,60 @@ async def generate_response(query: str, documents: list, history: str, folder_ch
     print('/n/n')
     logger.info(f"History: {history}")
     print('/n/n')
-    logger.info(f"folder_chunks: {folder_chunks}")
+    logger.info(f"folder_chunks: {uploaded_texts}")
     print('/n/n')
     logger.info(f"Query: {query_sw}")
     print('/n/n')
 
+    return messages, history, uploaded_texts, prompt_tokens
+
+
+# Fonction pour chercher une réponse dans le cache sémantique
+async def lookup_cached_response(query: str, documents: list, history: str, folder_chunks: list):
+    """
+    Cherche une réponse générée pour une question proche, avec les mêmes
+    chunks, le même historique et le même document uploadé.
+
+    :return: (réponse en cache ou None, clé à passer à store_cached_response)
+    """
+    context_key = make_context_key([doc.get("id", doc["chunk_id"]) for doc in documents], history, folder_chunks)
+    query_embedding = await asyncio.to_thread(get_cached_query_embedding, query, get_embedding_engine().embed_query)
+    cached_response = await asyncio.to_thread(get_response_cache().get, query_embedding, context_key)
+    return cached_response, (query, query_embedding, context_key)
+
+
+# Fonction pour enregistrer une réponse dans le cache sémantique
+async def store_cached_response(cache_key, response_text: str):
+    """Enregistre une réponse générée (cache_key : retourné par lookup_cached_response)."""
+    query, query_embedding, context_key = cache_key
+    await asyncio.to_thread(get_response_cache().set, query, query_embedding, context_key, response_text)
 
+
+# Fonction pour générer une réponse à partir du LLM OpenAI (fonction principale)
+async def generate_response(query: str, documents: list, history: str, uploaded_files: list, conversation_id: str,
+                            use_cache: bool = True, with_details: bool = False):
+    """
+    Génère une réponse à partir du LLM en utilisant la requête, les documents fournis et les chunks de fichier.
+    Une réponse déjà générée pour une question proche, avec les mêmes chunks et
+    le même historique, est reprise du cache sémantique.
+    
+    :parametre query: La requête de l'utilisateur.
+    :parametre documents: Les documents à utiliser pour générer la réponse.
+    :parametre history: L'historique des messages précédents.
+    :parametre uploaded_files: Les fichiers uploadés avec la requête ({"file_name", "file_hash"}).
+    :parametre use_cache: Utiliser le cache des réponses (False : toujours interroger le LLM).
+    :parametre with_details: Retourner aussi le décompte des tokens du prompt.
+    :return: La réponse générée par le LLM (ou le couple (réponse, décompte)).
+    """
+    messages, history, uploaded_texts, prompt_tokens = await build_messages(
+        query, documents, history, uploaded_files, conversation_id
+    )
+
+    # Cache sémantique : même contexte (chunks, historique, document uploadé) et question proche
+    if use_cache:
+        cached_response, cache_key = await lookup_cached_response(query, documents, history, uploaded_texts)
+        if cached_response is not None:
+            return (cached_response, prompt_tokens) if with_details else cached_response
     
     # Générer la réponse
     response = await llm.agenerate([messages])
@@ -203,8 +374,70 @@ async def generate_response(query: str, documents: list, history: str, folder_ch
     logger.info(f"Réponse du LLM: {response_text}")
     print("\n")
 
+    if use_cache:
+        await store_cached_response(cache_key, response_text)
+
     logger.info(f"Conversation ID: {conversation_id}")
     #Afficher un pas de ligne
     
     # Retourner la réponse générée
-    return response_text
\ No newline at end of file
+    return (response_text, prompt_tokens) if with_details else response_text
+
+
+# Fonction pour générer une réponse token par token (streaming)
+async def stream_response(query: str, documents: list, history: str, uploaded_files: list, conversation_id: str,
+                          use_cache: bool = True, chat_model=None, started_at: float = None):
+    """
+    Variante de generate_response qui produit la réponse au fur et à mesure.
+
+    :param chat_model: Le modèle de chat à utiliser (par défaut le modèle OpenAI ;
+                       un modèle factice de langchain_core peut être injecté).
+    :param started_at: Instant de réception de la requête (time.perf_counter),
+                       origine des mesures de temps.
+    :return: Un générateur asynchrone d'événements (type, données) :
+             "sources", puis des "token", puis "done" avec l'usage, le décompte
+             des tokens du prompt et les durées.
+    """
+    chat_model = chat_model or llm
+    started_at = started_at or time.perf_counter()
+
+    def elapsed():
+        return round(time.perf_counter() - started_at, 4)
+
+    # Les sources sont connues avant la génération : les envoyer tout de suite
+    yield "sources", [{"file_name": doc["file_name"], "page": doc["page"], "chunk_id": doc.get("chunk_id")}
+                      for doc in documents]
+
+    messages, history, uploaded_texts, prompt_tokens = await build_messages(
+        query, documents, history, uploaded_files, conversation_id
+    )
+    timings = {"prompt_ready": elapsed()}
+
+    if use_cache:
+        cached_response, cache_key = await lookup_cached_response(query, documents, history, uploaded_texts)
+        if cached_response is not None:
+            timings["first_token"] = elapsed()
+            yield "token", cached_response
+            timings["total"] = elapsed()
+            yield "done", {"cached": True, "usage": None, "prompt_tokens": prompt_tokens, "timings": timings}
+            return
+
+    response_parts = []
+    aggregate = None
+    async for chunk in chat_model.astream(messages):
+        aggregate = chunk if aggregate is None else aggregate + chunk
+        if chunk.content:
+            if "first_token" not in timings:
+                timings["first_token"] = elapsed()
+            response_parts.append(chunk.content)
+            yield "token", chunk.content
+    timings["total"] = elapsed()
+
+    response_text = "".join(response_parts)
+    logger.info(f"Réponse du LLM (streaming): {response_text}")
+    if use_cache:
+        await store_cached_response(cache_key, response_text)
+
+    usage = getattr(aggregate, "usage_metadata", None)
+    yield "done", {"cached": False, "usage": dict(usage) if usage else None, "prompt_tokens": prompt_tokens,
+                   "timings": timings}
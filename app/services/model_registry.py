@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+from app.core.config import MODELS_OFFLINE
+
+
+logger = logging.getLogger(__name__)
+
+if MODELS_OFFLINE:
+    # Résolution hors ligne : les modèles sont lus dans le cache local (HF_HOME), sans appel réseau
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+
+class ModelRegistry:
+    """
+    Registre des modèles locaux du processus.
+
+    Chaque service enregistre une fonction de chargement ; le modèle n'est
+    chargé qu'au premier `get` (ou par le préchargement lancé au démarrage),
+    une seule fois même si plusieurs threads le demandent en même temps.
+    L'état de chaque modèle (pending, loading, ready, error) sert au
+    diagnostic de disponibilité (/api/health/ready).
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._states = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._warmup = []
+        self._warmup_thread = None
+
+    def register(self, name: str, loader):
+        """
+        Enregistre un modèle.
+
+        :param name: Le nom du modèle dans le registre.
+        :param loader: La fonction (sans argument) qui charge et retourne le modèle.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+            self._states.setdefault(name, {"status": "pending"})
+
+    def get(self, name: str):
+        """
+        Retourne un modèle, chargé au premier appel.
+
+        :param name: Le nom du modèle.
+        :return: Le modèle.
+        :raises KeyError: Si le modèle n'est pas enregistré.
+        """
+        if name in self._models:
+            return self._models[name]
+        if name not in self._loaders:
+            raise KeyError(f"Modèle non enregistré : {name}")
+        with self._locks[name]:
+            if name not in self._models:
+                self._states[name] = {"status": "loading"}
+                started = time.perf_counter()
+                try:
+                    model = self._loaders[name]()
+                except Exception as e:
+                    # Pas de mise en cache de l'échec : le prochain appel réessaie
+                    self._states[name] = {"status": "error", "error": str(e)}
+                    raise
+                self._models[name] = model
+                load_time = round(time.perf_counter() - started, 3)
+                self._states[name] = {"status": "ready", "load_time": load_time}
+                logger.info(f"Modèle {name} chargé en {load_time} s")
+        return self._models[name]
+
+    def status(self) -> dict:
+        """Retourne l'état de chaque modèle enregistré."""
+        return {name: dict(state) for name, state in self._states.items()}
+
+    def is_ready(self) -> bool:
+        """Indique si tous les modèles à précharger sont chargés."""
+        return all(name in self._models for name in self._warmup)
+
+    def load(self, names: list):
+        """
+        Charge des modèles dans le thread courant, par exemple dans le processus
+        maître avant la création des workers. Une erreur de chargement est
+        journalisée et visible dans `status` (le modèle sera rechargé au premier usage).
+
+        :param names: Les noms des modèles, chargés dans l'ordre.
+        """
+        for name in names:
+            if name not in self._loaders:
+                self._states[name] = {"status": "error", "error": "Modèle non enregistré"}
+                continue
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Échec du préchargement du modèle {name} : {e}")
+
+    def _reset_after_fork(self):
+        """
+        Dans un processus enfant (fork) : les modèles déjà chargés restent
+        partagés avec le parent (copie à l'écriture), les verrous et le thread
+        de préchargement du parent sont remplacés.
+        """
+        self._lock = threading.Lock()
+        self._locks = {name: threading.Lock() for name in self._loaders}
+        self._warmup_thread = None
+        for name, state in self._states.items():
+            if state["status"] == "loading":
+                self._states[name] = {"status": "pending"}
+
+    def warm_up(self, names: list):
+        """
+        Charge des modèles dans un thread en arrière-plan (sans bloquer le démarrage).
+        Une erreur de chargement est journalisée et visible dans `status`.
+
+        :param names: Les noms des modèles, chargés dans l'ordre.
+        """
+        self._warmup = list(names)
+        self._warmup_thread = threading.Thread(target=self.load, args=(self._warmup,), name="model-warmup",
+                                               daemon=True)
+        self._warmup_thread.start()
+        return self._warmup_thread
+
+
+_registry = ModelRegistry()
+
+if hasattr(os, "register_at_fork"):  # Pas de fork sous Windows
+    os.register_at_fork(after_in_child=_registry._reset_after_fork)
+
+
+def get_model_registry() -> ModelRegistry:
+    """Retourne le registre des modèles du processus."""
+    return _registry
+
+
+def register_model(name: str, loader):
+    """Enregistre un modèle dans le registre du processus (voir ModelRegistry.register)."""
+    _registry.register(name, loader)
@@ -89,4 +89,223 @@ async def get_uploaded_chunks(conversation_id):
     conversation = await conversation_collection.find_one({"_id": ObjectId(conversation_id)})
     if not conversation:
         raise ValueError("Conversation introuvable.")
-    return conversation.get("uploaded_chunks", [])
\ No newline at end of file
+    return conversation.get("uploaded_chunks", [])
+
+async def add_uploaded_files(conversation_id, files):
+    """
+    Ajoute des références de fichiers uploadés à une conversation
+    (les chunks eux-mêmes restent dans ChromaDB).
+    
+    :param conversation_id: ID de la conversation.
+    :param files: Liste de {"file_name", "file_hash"}.
+    :return: Nombre de documents modifiés.
+    """
+    result = await conversation_collection.update_one(
+        {"_id": ObjectId(conversation_id)},
+        {"$addToSet": {"uploaded_files": {"$each": files}}}
+    )
+    return result.modified_count
+
+
+async def get_uploaded_files(conversation_id):
+    """
+    Récupère les références des fichiers uploadés dans une conversation.
+    
+    :param conversation_id: ID de la conversation.
+    :return: Liste de {"file_name", "file_hash"}.
+    """
+    conversation = await conversation_collection.find_one(
+        {"_id": ObjectId(conversation_id)}, {"uploaded_files": 1}
+    )
+    if not conversation:
+        raise ValueError("Conversation introuvable.")
+    return conversation.get("uploaded_files", [])
+
+async def get_history_summary(conversation_id):
+    """
+    Récupère le résumé glissant de l'historique d'une conversation.
+    
+    :param conversation_id: ID de la conversation.
+    :return: Le résumé (summary, offset, prefix_hash) ou None.
+    """
+    conversation = await conversation_collection.find_one(
+        {"_id": ObjectId(conversation_id)}, {"history_summary": 1}
+    )
+    if not conversation:
+        return None
+    return conversation.get("history_summary")
+
+async def set_history_summary(conversation_id, history_summary):
+    """
+    Enregistre le résumé glissant de l'historique d'une conversation.
+    
+    :param conversation_id: ID de la conversation.
+    :param history_summary: Le résumé et le nombre de messages qu'il couvre.
+    :return: Nombre de documents modifiés.
+    """
+    result = await conversation_collection.update_one(
+        {"_id": ObjectId(conversation_id)},
+        {"$set": {"history_summary": history_summary}}
+    )
+    return result.modified_count
+
+# Fonctions pour gérer les jobs d'ingestion
+ingest_job_collection = database["ingest_jobs"]
+
+async def insert_ingest_job(job):
+    """Insère un job d'ingestion dans la collection."""
+    result = await ingest_job_collection.insert_one(job)
+    return str(result.inserted_id)
+
+async def get_ingest_job(job_id):
+    """
+    Récupère un job d'ingestion.
+    
+    :param job_id: ID du job.
+    :return: Le job trouvé ou None.
+    """
+    job = await ingest_job_collection.find_one({"_id": ObjectId(job_id)})
+    if job:
+        job["id"] = str(job["_id"])
+        del job["_id"]
+    return job
+
+async def update_ingest_job(job_id, fields):
+    """Met à jour les champs d'un job d'ingestion."""
+    result = await ingest_job_collection.update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+    return result.modified_count
+
+async def update_ingest_job_file(job_id, file_index, fields, processed_increment=0):
+    """
+    Met à jour l'état d'un fichier d'un job d'ingestion.
+    
+    :param job_id: ID du job.
+    :param file_index: Position du fichier dans la liste des fichiers du job.
+    :param fields: Champs à mettre à jour pour ce fichier.
+    :param processed_increment: Valeur à ajouter au compteur de fichiers traités.
+    :return: Nombre de documents modifiés.
+    """
+    update = {"$set": {f"files.{file_index}.{key}": value for key, value in fields.items()}}
+    if processed_increment:
+        update["$inc"] = {"processed_files": processed_increment}
+    result = await ingest_job_collection.update_one({"_id": ObjectId(job_id)}, update)
+    return result.modified_count
+
+async def claim_unfinished_ingest_job(now, lease_until, owner):
+    """
+    Réserve un job d'ingestion inachevé dont le bail a expiré (le worker qui
+    l'exécutait s'est arrêté), afin qu'un seul worker le reprenne.
+    
+    :param now: La date courante.
+    :param lease_until: La fin du nouveau bail.
+    :param owner: L'identifiant du worker qui reprend le job.
+    :return: L'ID du job réservé ou None.
+    """
+    job = await ingest_job_collection.find_one_and_update(
+        {
+            "status": {"$in": ["pending", "running"]},
+            "$or": [{"lease_until": {"$lt": now}}, {"lease_until": {"$exists": False}}],
+        },
+        {"$set": {"claimed_at": now, "lease_until": lease_until, "owner": owner}},
+    )
+    return str(job["_id"]) if job else None
+
+async def renew_ingest_job_lease(job_id, owner, lease_until):
+    """
+    Prolonge le bail d'un job, seulement s'il appartient encore à `owner`.
+    
+    :return: True si le bail a été prolongé, False si le job a été repris par un autre worker.
+    """
+    result = await ingest_job_collection.update_one(
+        {"_id": ObjectId(job_id), "owner": owner},
+        {"$set": {"lease_until": lease_until}},
+    )
+    return result.matched_count == 1
+
+# Fonctions pour gérer le catalogue des fichiers ingérés
+file_catalog_collection = database["file_catalog"]
+
+async def ensure_file_catalog_indexes():
+    """Crée les index du catalogue (appelé au démarrage)."""
+    await file_catalog_collection.create_index("file_name", unique=True)
+    await file_catalog_collection.create_index("file_hash")
+    await file_catalog_collection.create_index([("ingested_at", -1)])
+
+async def upsert_file_catalog_entry(entry):
+    """
+    Enregistre (ou remplace) la fiche d'un fichier ingéré.
+    
+    :param entry: La fiche du fichier (clé : file_name).
+    :return: Nombre de documents modifiés ou créés.
+    """
+    result = await file_catalog_collection.replace_one({"file_name": entry["file_name"]}, entry, upsert=True)
+    return result.modified_count or int(result.upserted_id is not None)
+
+async def get_file_catalog_entry(file_name):
+    """
+    Récupère la fiche d'un fichier. Les identifiants des chunks ne sont pas
+    stockés dans la fiche (taille limitée d'un document) : ils se retrouvent
+    dans ChromaDB par l'empreinte du fichier.
+    
+    :param file_name: Le nom du fichier.
+    :return: La fiche ou None.
+    """
+    # chunk_ids : champ des anciennes fiches, plus écrit
+    return await file_catalog_collection.find_one({"file_name": file_name}, {"_id": 0, "chunk_ids": 0})
+
+async def get_complete_chunk_count(file_hash):
+    """
+    Indique si un contenu de fichier a été entièrement ingéré : la fiche du
+    catalogue n'est écrite qu'à la fin d'une ingestion réussie.
+    
+    :param file_hash: L'empreinte du fichier.
+    :return: Le nombre de chunks de l'ingestion complète, ou None.
+    """
+    entry = await file_catalog_collection.find_one({"file_hash": file_hash}, {"_id": 0, "chunk_count": 1})
+    return entry["chunk_count"] if entry else None
+
+async def get_shared_file_hashes(file_name):
+    """
+    Récupère les empreintes des fichiers catalogués sous un autre nom. Les
+    identifiants des chunks dépendent du contenu (empreinte), pas du nom : un
+    même contenu ingéré sous deux noms partage ses chunks.
+    
+    :param file_name: Le nom du fichier à exclure.
+    :return: L'ensemble des empreintes.
+    """
+    return set(await file_catalog_collection.distinct("file_hash", {"file_name": {"$ne": file_name}}))
+
+async def count_file_hash_references(file_hash, exclude_file_name=None):
+    """
+    Compte les fiches du catalogue qui référencent un contenu de fichier.
+    
+    :param file_hash: L'empreinte du fichier.
+    :param exclude_file_name: Un nom de fichier à ne pas compter.
+    :return: Le nombre de fiches.
+    """
+    query = {"file_hash": file_hash}
+    if exclude_file_name is not None:
+        query["file_name"] = {"$ne": exclude_file_name}
+    return await file_catalog_collection.count_documents(query)
+
+async def list_file_catalog(limit=50, after=None):
+    """
+    Liste les fiches du catalogue par ordre de nom de fichier (pagination par clé, via l'index).
+    
+    :param limit: Le nombre de fiches.
+    :param after: Le dernier nom de fichier de la page précédente.
+    :return: Les fiches (sans les identifiants des chunks).
+    """
+    query = {"file_name": {"$gt": after}} if after else {}
+    cursor = file_catalog_collection.find(query, {"_id": 0, "chunk_ids": 0}).sort("file_name", 1).limit(limit)
+    return await cursor.to_list(limit)
+
+async def delete_file_catalog_entry(file_name):
+    """Supprime la fiche d'un fichier."""
+    result = await file_catalog_collection.delete_one({"file_name": file_name})
+    return result.deleted_count
+
+async def clear_file_catalog():
+    """Supprime toutes les fiches du catalogue (collection ChromaDB vidée)."""
+    result = await file_catalog_collection.delete_many({})
+    return result.deleted_count
@@ -0,0 +1,124 @@
+import glob
+import logging
+import os
+import re
+import shutil
+import threading
+from app.core.config import MODELS_OFFLINE, ONNX_MODELS_PATH
+
+
+logger = logging.getLogger(__name__)
+
+# Jeu d'instructions visé par la quantification int8 dynamique (présent sur tous les CPU x86 récents)
+QUANTIZATION_TARGET = "avx2"
+
+_export_lock = threading.Lock()
+
+
+def _require_optimum():
+    try:
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(
+            "INFERENCE_BACKEND=onnx nécessite la dépendance optionnelle optimum[onnxruntime] : "
+            "pip install \"optimum[onnxruntime]\""
+        ) from e
+
+
+def onnx_model_dir(model_name: str, quantize: bool = False) -> str:
+    """Retourne le dossier où est exporté (une seule fois) un modèle au format ONNX."""
+    name = re.sub(r"[^\w.-]+", "__", model_name)
+    return os.path.join(ONNX_MODELS_PATH, f"{name}-int8" if quantize else name)
+
+
+def _build_once(model_dir: str, build):
+    """
+    Construit le dossier d'un modèle s'il n'existe pas encore : dans un dossier
+    temporaire puis renommé d'un coup, car plusieurs processus (workers,
+    ingestion) peuvent faire l'export en même temps.
+
+    :param model_dir: Le dossier final.
+    :param build: La fonction (dossier) -> None qui exporte le modèle.
+    """
+    with _export_lock:
+        if os.path.isdir(model_dir):
+            return
+        temporary_dir = f"{model_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+        build(temporary_dir)
+        try:
+            os.rename(temporary_dir, model_dir)
+        except OSError:
+            shutil.rmtree(temporary_dir, ignore_errors=True)  # Exporté entre-temps par un autre processus
+
+
+def _quantize(model_dir: str):
+    """Quantifie en int8 (dynamique) chaque fichier ONNX d'un dossier exporté."""
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    config = getattr(AutoQuantizationConfig, QUANTIZATION_TARGET)(is_static=False, per_channel=False)
+    for path in glob.glob(os.path.join(model_dir, "*.onnx")):
+        quantizer = ORTQuantizer.from_pretrained(model_dir, file_name=os.path.basename(path))
+        quantizer.quantize(save_dir=model_dir, quantization_config=config)
+
+
+def load_ort_model(model_class: str, model_name: str, quantize: bool = False):
+    """
+    Charge un modèle Hugging Face avec ONNX Runtime (optimum). Le modèle est
+    exporté en ONNX au premier chargement puis relu depuis ONNX_MODELS_PATH.
+
+    :param model_class: La classe optimum (ex. "ORTModelForSequenceClassification").
+    :param model_name: Le modèle Hugging Face.
+    :param quantize: Utiliser la version quantifiée en int8 (créée au premier chargement).
+    :return: Le couple (tokenizer, modèle). Le modèle s'utilise comme le modèle torch
+             (tenseurs torch en entrée et en sortie, `generate` pour les modèles de langage).
+    """
+    _require_optimum()
+    import optimum.onnxruntime
+    from transformers import AutoTokenizer
+
+    ort_class = getattr(optimum.onnxruntime, model_class)
+
+    def build(path):
+        logger.info(f"Export ONNX de {model_name}{' (int8)' if quantize else ''} vers {path}")
+        ort_class.from_pretrained(model_name, export=True, local_files_only=MODELS_OFFLINE).save_pretrained(path)
+        AutoTokenizer.from_pretrained(model_name, local_files_only=MODELS_OFFLINE).save_pretrained(path)
+        if quantize:
+            _quantize(path)
+
+    model_dir = onnx_model_dir(model_name, quantize)
+    _build_once(model_dir, build)
+    # Fichier exporté par optimum (un seul graphe, y compris pour les modèles de langage)
+    # et sa version quantifiée par ORTQuantizer
+    file_name = "model_quantized.onnx" if quantize else "model.onnx"
+    if not os.path.isfile(os.path.join(model_dir, file_name)):
+        raise RuntimeError(f"{file_name} introuvable dans {model_dir} : supprimez le dossier pour refaire l'export.")
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = ort_class.from_pretrained(model_dir, file_name=file_name)
+    return tokenizer, model
+
+
+def load_onnx_sentence_transformer(model_name: str, quantize: bool = False):
+    """
+    Charge un modèle sentence-transformers avec le moteur ONNX Runtime (même
+    pooling et même normalisation que la version torch).
+
+    :param model_name: Le modèle sentence-transformers.
+    :param quantize: Utiliser la version quantifiée en int8 (créée au premier chargement).
+    :return: Le modèle SentenceTransformer.
+    """
+    _require_optimum()
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    def build(path):
+        logger.info(f"Export ONNX de {model_name}{' (int8)' if quantize else ''} vers {path}")
+        model = SentenceTransformer(model_name, backend="onnx", local_files_only=MODELS_OFFLINE)
+        model.save(path)
+        if quantize:
+            export_dynamic_quantized_onnx_model(model, QUANTIZATION_TARGET, path)
+
+    model_dir = onnx_model_dir(model_name, quantize)
+    _build_once(model_dir, build)
+    model_kwargs = {"file_name": f"onnx/model_qint8_{QUANTIZATION_TARGET}.onnx"} if quantize else None
+    return SentenceTransformer(model_dir, backend="onnx", model_kwargs=model_kwargs)
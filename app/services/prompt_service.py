@@ -0,0 +1,177 @@
+import logging
+import threading
+import tiktoken
+from app.core.config import (
+    LLM_MODEL_NAME,
+    PROMPT_MAX_TOKENS,
+    PROMPT_HISTORY_TOKENS,
+    PROMPT_CONTEXT_TOKENS,
+    PROMPT_UPLOAD_TOKENS,
+)
+from app.services.model_registry import register_model
+
+
+logger = logging.getLogger(__name__)
+
+
+class PromptAssembler:
+    """
+    Assemble les sections du prompt (historique, chunks retrouvés, chunks
+    uploadés) en respectant un budget de tokens par section, compté avec le
+    tokenizer du modèle.
+
+    - historique : les tokens les plus récents sont conservés ;
+    - chunks retrouvés : ajoutés dans l'ordre de la recherche tant qu'ils tiennent ;
+    - chunks uploadés : dédoublonnés, classés par pertinence avec `rank_uploads`
+      puis ajoutés tant qu'ils tiennent.
+
+    Le budget non utilisé par l'historique et les chunks retrouvés revient aux
+    chunks uploadés, sans que le total dépasse `max_tokens`.
+    """
+
+    def __init__(self, encoding, max_tokens: int, history_tokens: int, context_tokens: int, upload_tokens: int):
+        """
+        :param encoding: Le tokenizer (objet avec encode/decode, ex. tiktoken).
+        :param max_tokens: Le budget total du prompt (hors réponse).
+        :param history_tokens: Le budget de l'historique.
+        :param context_tokens: Le budget des chunks retrouvés.
+        :param upload_tokens: Le budget des chunks uploadés.
+        """
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+        self.history_tokens = history_tokens
+        self.context_tokens = context_tokens
+        self.upload_tokens = upload_tokens
+
+    def count(self, text: str) -> int:
+        """Compte les tokens d'un texte."""
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate_start(self, text: str, budget: int) -> str:
+        """Garde les `budget` derniers tokens d'un texte."""
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= budget:
+            return text
+        return self.encoding.decode(tokens[-budget:]) if budget > 0 else ""
+
+    def _fill(self, texts: list, budget: int):
+        """Sélectionne les textes, dans l'ordre, tant qu'ils tiennent dans le budget."""
+        selected, used = [], 0
+        for index, text in enumerate(texts):
+            tokens = self.count(text)
+            if used + tokens > budget:
+                continue  # Un chunk plus court peut encore tenir
+            selected.append(index)
+            used += tokens
+        return selected, used
+
+    def assemble(self, query: str, instructions: list, history: str, documents: list, uploads: list,
+                 rank_uploads=None):
+        """
+        Sélectionne le contenu de chaque section.
+
+        :param query: La requête de l'utilisateur.
+        :param instructions: Les textes fixes du prompt (consignes, requête...).
+        :param history: L'historique (éventuellement résumé).
+        :param documents: Les chunks retrouvés (dicts avec "content"), du plus au moins pertinent.
+        :param uploads: Les chunks uploadés (dicts avec "file_name"/"chunk" ou chaînes).
+        :param rank_uploads: Fonction (requête, textes) -> scores de pertinence.
+        :return: (historique, documents retenus, textes uploadés retenus, décompte des tokens)
+        """
+        fixed = sum(self.count(text) for text in instructions)
+        available = max(self.max_tokens - fixed, 0)
+
+        history_budget = min(self.history_tokens, available)
+        history_text = self.truncate_start(history, history_budget)
+        history_used = self.count(history_text)
+        available -= history_used
+
+        context_budget = min(self.context_tokens, available)
+        kept, context_used = self._fill([doc["content"] for doc in documents], context_budget)
+        kept_documents = [documents[index] for index in kept]
+        available -= context_used
+
+        # Chunks uploadés : dédoublonnés (la conversation en accumule), puis classés
+        upload_texts = list(dict.fromkeys(
+            f"[{chunk['file_name']}] {chunk['chunk']}" if isinstance(chunk, dict) else str(chunk)
+            for chunk in uploads
+        ))
+        if rank_uploads and len(upload_texts) > 1:
+            scores = rank_uploads(query, upload_texts)
+            upload_texts = [text for _, text in sorted(zip(scores, upload_texts), key=lambda pair: -pair[0])]
+        upload_budget = min(self.upload_tokens + (self.history_tokens - history_used)
+                            + (self.context_tokens - context_used), available)
+        kept, upload_used = self._fill(upload_texts, upload_budget)
+        kept_uploads = [upload_texts[index] for index in kept]
+
+        breakdown = {
+            "instructions": fixed,
+            "history": history_used,
+            "retrieved_chunks": context_used,
+            "uploaded_chunks": upload_used,
+            "total": fixed + history_used + context_used + upload_used,
+            "budget": self.max_tokens,
+            "history_truncated": history_text != history,
+            "retrieved_kept": len(kept_documents),
+            "retrieved_dropped": len(documents) - len(kept_documents),
+            "uploaded_kept": len(kept_uploads),
+            "uploaded_dropped": len(upload_texts) - len(kept_uploads),
+        }
+        logger.info(f"Tokens du prompt : {breakdown}")
+        return history_text, kept_documents, kept_uploads, breakdown
+
+
+class ApproximateEncoding:
+    """
+    Tokenizer de secours quand tiktoken ne peut pas charger son encodage (BPE
+    absent de TIKTOKEN_CACHE_DIR sur un serveur sans accès internet) : un token
+    pour `chars_per_token` caractères, ce qui surestime un peu le décompte
+    pour un texte français courant.
+    """
+
+    def __init__(self, chars_per_token: int = 3):
+        self.chars_per_token = chars_per_token
+
+    def encode(self, text: str, disallowed_special=()) -> list:
+        step = self.chars_per_token
+        return [text[index:index + step] for index in range(0, len(text), step)]
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+
+def _load_encoding():
+    """Charge l'encodage tiktoken du modèle, ou le tokenizer approché s'il est introuvable."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(LLM_MODEL_NAME)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Encodage tiktoken indisponible ({e}) : décompte approché des tokens")
+        return ApproximateEncoding()
+
+
+_assembler = None
+_assembler_lock = threading.Lock()
+
+
+def get_prompt_assembler() -> PromptAssembler:
+    """Retourne l'assembleur de prompt, créé au premier appel."""
+    global _assembler
+    if _assembler is None:
+        with _assembler_lock:
+            if _assembler is None:
+                _assembler = PromptAssembler(
+                    _load_encoding(),
+                    max_tokens=PROMPT_MAX_TOKENS,
+                    history_tokens=PROMPT_HISTORY_TOKENS,
+                    context_tokens=PROMPT_CONTEXT_TOKENS,
+                    upload_tokens=PROMPT_UPLOAD_TOKENS,
+                )
+    return _assembler
+
+
+# Le tokenizer tiktoken est téléchargé au premier usage (ou lu dans TIKTOKEN_CACHE_DIR,
+# provisionné dans l'image Docker) ; à défaut, décompte approché
+register_model("tokenizer", lambda: get_prompt_assembler().encoding)
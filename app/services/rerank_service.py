@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import (
+    RERANK_MODEL_NAME,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_QUANTIZE,
+    RERANK_WORKERS,
+    INFERENCE_BACKEND,
+    MODELS_OFFLINE,
+    ONNX_QUANTIZE,
+)
+from app.services.model_registry import register_model
+
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Reclasse des chunks candidats avec un cross-encoder (requête, chunk) -> score.
+
+    Les paires sont tokenisées une fois, triées par longueur puis découpées en
+    micro-batchs : chaque batch n'est complété (padding) que jusqu'à la paire la
+    plus longue qu'il contient. Le modèle peut être quantifié en int8
+    (quantification dynamique torch, CPU). Les calculs tournent dans un pool de
+    threads dédié, ce qui borne le nombre de reclassements simultanés.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16, max_length: int = 256, quantize: bool = False,
+                 workers: int = 1, backend: str = "torch"):
+        """
+        :param model_name: Le cross-encoder Hugging Face (une sortie de pertinence).
+        :param batch_size: Le nombre de paires par micro-batch.
+        :param max_length: La longueur maximale (en tokens) d'une paire ; au-delà, le chunk est tronqué.
+        :param quantize: Quantifier le modèle en int8 (CPU) : quantification dynamique torch ou ONNX Runtime.
+        :param workers: Le nombre de reclassements exécutés en parallèle.
+        :param backend: Le moteur d'inférence, "torch" ou "onnx" (ONNX Runtime).
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.quantize = quantize
+        self.workers = workers
+        self.backend = backend
+        self._tokenizer = None
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reranker")
+
+    def _get_model(self):
+        """Charge le tokenizer et le modèle une seule fois."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None and self.backend == "onnx":
+                    from app.services.onnx_backend import load_ort_model
+                    logger.info(f"Chargement du cross-encoder {self.model_name} (onnx)")
+                    self._tokenizer, self._model = load_ort_model(
+                        "ORTModelForSequenceClassification", self.model_name, quantize=self.quantize)
+                elif self._model is None:
+                    import torch
+                    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+                    logger.info(f"Chargement du cross-encoder {self.model_name}")
+                    tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=MODELS_OFFLINE)
+                    model = AutoModelForSequenceClassification.from_pretrained(
+                        self.model_name, local_files_only=MODELS_OFFLINE)
+                    model.eval()
+                    if self.quantize:
+                        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                    self._tokenizer = tokenizer
+                    self._model = model
+        return self._tokenizer, self._model
+
+    def _reset_after_fork(self):
+        """
+        Dans un processus enfant (fork) : le modèle est gardé (partagé avec le
+        parent), le pool de threads et le verrou sont recréés.
+        """
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reranker")
+
+    def score(self, query: str, texts: list) -> list:
+        """
+        Calcule le score de pertinence de chaque texte pour la requête.
+
+        :param query: La requête de recherche.
+        :param texts: Les textes candidats.
+        :return: Les scores, dans l'ordre des textes.
+        """
+        if not texts:
+            return []
+        import torch
+        tokenizer, model = self._get_model()
+        encoded = tokenizer([query] * len(texts), list(texts), truncation=True,
+                            max_length=self.max_length)
+        features = [{key: values[index] for key, values in encoded.items()} for index in range(len(texts))]
+
+        # Regrouper les paires de longueurs proches pour limiter le padding
+        order = sorted(range(len(texts)), key=lambda index: len(features[index]["input_ids"]))
+        scores = [0.0] * len(texts)
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                indexes = order[start:start + self.batch_size]
+                batch = tokenizer.pad([features[index] for index in indexes], return_tensors="pt")
+                logits = model(**batch).logits
+                # Une sortie : score de pertinence ; deux sorties : logit de la classe "pertinent"
+                values = logits[:, 0] if logits.shape[-1] == 1 else logits[:, -1]
+                for index, value in zip(indexes, values.tolist()):
+                    scores[index] = value
+        return scores
+
+    def rerank(self, query: str, candidates: list, top_k: int = 4, key: str = "content") -> list:
+        """
+        Reclasse des candidats et retourne les `top_k` meilleurs avec leur score.
+
+        :param query: La requête de recherche.
+        :param candidates: Les chunks candidats (dicts).
+        :param top_k: Le nombre de chunks retournés.
+        :param key: Le champ des candidats qui contient le texte.
+        :return: Les chunks, du plus au moins pertinent, avec un champ "score".
+        """
+        scores = self.score(query, [candidate[key] for candidate in candidates])
+        ranked = sorted(zip(scores, range(len(candidates))), key=lambda pair: pair[0], reverse=True)
+        return [{**candidates[index], "score": score} for score, index in ranked[:top_k]]
+
+    def rerank_sync(self, query: str, candidates: list, top_k: int = 4, key: str = "content") -> list:
+        """Reclasse dans le pool du reranker en attendant le résultat (appel synchrone)."""
+        return self._executor.submit(self.rerank, query, candidates, top_k, key).result()
+
+    async def arerank(self, query: str, candidates: list, top_k: int = 4, key: str = "content") -> list:
+        """Reclasse dans le pool du reranker sans bloquer la boucle asyncio."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.rerank, query, candidates, top_k, key)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """Retourne le reranker du processus, créé au premier appel (le modèle est chargé au premier reclassement)."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker(
+                    RERANK_MODEL_NAME,
+                    batch_size=RERANK_BATCH_SIZE,
+                    max_length=RERANK_MAX_LENGTH,
+                    quantize=ONNX_QUANTIZE if INFERENCE_BACKEND == "onnx" else RERANK_QUANTIZE,
+                    workers=RERANK_WORKERS,
+                    backend=INFERENCE_BACKEND,
+                )
+    return _reranker
+
+
+def _reset_reranker_after_fork():
+    global _reranker_lock
+    _reranker_lock = threading.Lock()
+    if _reranker is not None:
+        _reranker._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):  # Pas de fork sous Windows
+    os.register_at_fork(after_in_child=_reset_reranker_after_fork)
+
+register_model("reranker", lambda: get_reranker()._get_model())
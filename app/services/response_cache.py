@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from app.core.config import (
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_THRESHOLD,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_AGE,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def make_context_key(chunk_ids, history: str, folder_chunks=None) -> str:
+    """
+    Calcule la clé du contexte d'une réponse : l'ensemble des chunks retrouvés,
+    l'historique (éventuellement résumé) et le document uploadé.
+    Les IDs des chunks dépendant de leur contenu, une réponse en cache n'est
+    jamais réutilisée après la modification d'un document.
+
+    :param chunk_ids: Les identifiants des chunks retrouvés (l'ordre est ignoré).
+    :param history: L'historique envoyé au LLM.
+    :param folder_chunks: Les chunks du document uploadé.
+    :return: L'empreinte SHA-256 du contexte.
+    """
+    digest = hashlib.sha256()
+    for chunk_id in sorted(str(chunk_id) for chunk_id in chunk_ids):
+        digest.update(chunk_id.encode("utf-8") + b"\0")
+    digest.update(b"\1" + hashlib.sha256(history.encode("utf-8")).digest())
+    digest.update(b"\1" + repr(folder_chunks or []).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache sémantique des réponses du LLM, stocké dans SQLite.
+
+    Une réponse est réutilisée si elle a été générée pour le même contexte
+    (voir make_context_key) et pour une question dont l'embedding est assez
+    proche (similarité cosinus >= `threshold`). Les entrées sont évincées par
+    âge (`max_age` secondes) et par nombre (les moins récemment utilisées).
+    """
+
+    def __init__(self, path: str, threshold: float = 0.95, max_entries: int = 5000, max_age: float = 86400):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    context_key TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_context ON responses (context_key)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used_at)")
+
+    @contextmanager
+    def _connect(self):
+        # Une connexion par opération : le cache est appelé depuis plusieurs threads
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:  # Commit (ou rollback en cas d'erreur)
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding, context_key: str):
+        """
+        Cherche une réponse pour une question proche dans le même contexte.
+
+        :param embedding: L'embedding de la question.
+        :param context_key: La clé du contexte (make_context_key).
+        :return: La réponse en cache, ou None.
+        """
+        query_vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock, self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, embedding, response FROM responses WHERE context_key = ? AND created_at >= ?",
+                (context_key, now - self.max_age),
+            ).fetchall()
+            best_id, best_response, best_score = None, None, self.threshold
+            for row_id, blob, response in rows:
+                score = float(np.dot(query_vector, np.frombuffer(blob, dtype=np.float32)))
+                if score >= best_score:
+                    best_id, best_response, best_score = row_id, response, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE responses SET last_used_at = ? WHERE id = ?", (now, best_id))
+            self.hits += 1
+        logger.info(f"Réponse trouvée dans le cache (similarité {best_score:.3f})")
+        return best_response
+
+    def set(self, query: str, embedding, context_key: str, response: str):
+        """Enregistre une réponse puis évince les entrées trop anciennes ou en surnombre."""
+        now = time.time()
+        blob = self._normalize(embedding).tobytes()
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT INTO responses (context_key, query, embedding, response, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (context_key, query, blob, response, now, now),
+            )
+            connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+            connection.execute(
+                "DELETE FROM responses WHERE id NOT IN "
+                "(SELECT id FROM responses ORDER BY last_used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        """Vide le cache."""
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM responses")
+
+    def stats(self):
+        """Retourne la taille et les compteurs du cache."""
+        with self._lock, self._connect() as connection:
+            size = connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "size": size,
+                "max_entries": self.max_entries,
+                "max_age": self.max_age,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Retourne le cache des réponses, créé au premier appel."""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    RESPONSE_CACHE_PATH,
+                    threshold=RESPONSE_CACHE_THRESHOLD,
+                    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                    max_age=RESPONSE_CACHE_MAX_AGE,
+                )
+    return _response_cache
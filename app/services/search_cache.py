@@ -0,0 +1,60 @@
+import hashlib
+import logging
+import numpy as np
+from app.core.config import (
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_TTL,
+    SEARCH_RESULT_CACHE_SIZE,
+    SEARCH_RESULT_CACHE_TTL,
+)
+from app.utils.cache import TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+# Niveau 1 : texte normalisé de la requête -> embedding
+query_embedding_cache = TTLCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL)
+
+# Niveau 2 : (embedding, k, filtre) -> identifiants des résultats ; vidé à chaque écriture
+search_result_cache = TTLCache(maxsize=SEARCH_RESULT_CACHE_SIZE, ttl=SEARCH_RESULT_CACHE_TTL)
+
+
+def normalize_query(query: str) -> str:
+    """Normalise les espaces d'une requête ; la casse est conservée (le modèle y est sensible)."""
+    return " ".join(query.split())
+
+
+def embedding_key(embedding) -> str:
+    """Empreinte compacte d'un embedding, utilisée comme clé."""
+    return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+
+def get_cached_query_embedding(query: str, embed_query):
+    """
+    Retourne l'embedding d'une requête, calculé avec `embed_query` au premier appel.
+
+    :param query: La requête de l'utilisateur.
+    :param embed_query: La fonction d'embedding à utiliser en cas d'échec du cache.
+    :return: L'embedding de la requête.
+    """
+    key = normalize_query(query)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        # Le texte embarqué est exactement la clé du cache
+        embedding = embed_query(key)
+        query_embedding_cache.set(key, embedding)
+    return embedding
+
+
+def invalidate_search_results():
+    """Vide le cache des résultats : à appeler après toute modification de la collection."""
+    search_result_cache.clear()
+    logger.debug("Cache des résultats de recherche invalidé")
+
+
+def get_search_cache_stats():
+    """Retourne les compteurs des deux niveaux de cache."""
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+    }
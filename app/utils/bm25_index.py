@@ -0,0 +1,511 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+from app.utils.nltk_resources import french_stopwords
+
+try:
+    import fcntl  # Verrou entre processus (Linux / macOS)
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Mots, nombres et références composées (ex. L.4121-1, REF-2034/B)
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+SEPARATOR_PATTERN = re.compile(r"[-./]")
+
+
+@lru_cache(maxsize=200000)
+def term_hash(term: str) -> int:
+    """Empreinte 64 bits d'un terme : le vocabulaire est stocké sous forme de tableau numpy trié."""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class FrenchAnalyzer:
+    """
+    Découpe un texte en termes pour l'index lexical : minuscules, stopwords
+    français (NLTK) retirés, racinisation (FrenchStemmer). Les jetons qui
+    contiennent des chiffres (articles, codes produits, références de contrat)
+    sont gardés tels quels, avec chacune de leurs parties.
+    """
+
+    def __init__(self):
+        self._stopwords = None
+        self._stem = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._stem is None:
+            with self._lock:
+                if self._stem is None:
+                    from nltk.stem.snowball import FrenchStemmer
+                    self._stopwords = french_stopwords()
+                    self._stem = lru_cache(maxsize=200000)(FrenchStemmer().stem)
+
+    def analyze(self, text: str) -> list:
+        """
+        :param text: Le texte à analyser.
+        :return: La liste des termes (avec répétitions).
+        """
+        self._load()
+        terms = []
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            parts = [part for part in SEPARATOR_PATTERN.split(token) if part]
+            if any(char.isdigit() for char in token):
+                terms.append(token)
+                if len(parts) > 1:
+                    terms.extend(parts)
+                continue
+            for part in parts:
+                if len(part) > 1 and part not in self._stopwords:
+                    terms.append(self._stem(part))
+        return terms
+
+
+class SegmentBuilder:
+    """
+    Accumule les postings (terme, document, fréquence) de nouveaux documents
+    avant leur écriture dans un segment. Seuls les postings sont gardés en
+    mémoire, pas les textes.
+    """
+
+    def __init__(self, analyzer: FrenchAnalyzer):
+        self.analyzer = analyzer
+        self.ids = []
+        self.lengths = []
+        self._hashes = []
+        self._docs = []
+        self._tfs = []
+
+    def add(self, uid: str, text: str):
+        """Ajoute un document (ignoré s'il ne contient aucun terme)."""
+        counts = Counter(self.analyzer.analyze(text))
+        if not counts:
+            return
+        doc = len(self.ids)
+        self.ids.append(uid)
+        self.lengths.append(sum(counts.values()))
+        self._hashes.append(np.fromiter((term_hash(term) for term in counts), dtype=np.uint64, count=len(counts)))
+        self._tfs.append(np.fromiter(counts.values(), dtype=np.int32, count=len(counts)))
+        self._docs.append(np.full(len(counts), doc, dtype=np.int32))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def arrays(self):
+        """Retourne (ids, longueurs, termes, documents, fréquences) des postings accumulés."""
+        return (
+            self.ids,
+            np.asarray(self.lengths, dtype=np.int32),
+            np.concatenate(self._hashes) if self._hashes else np.empty(0, dtype=np.uint64),
+            np.concatenate(self._docs) if self._docs else np.empty(0, dtype=np.int32),
+            np.concatenate(self._tfs) if self._tfs else np.empty(0, dtype=np.int32),
+        )
+
+
+class Segment:
+    """Segment immuable de l'index, ouvert en mémoire mappée (partagée entre processus)."""
+
+    FILES = ("ids", "lengths", "terms", "offsets", "docs", "tfs")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.name = os.path.basename(directory)
+        for name in self.FILES:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+
+    @property
+    def doc_count(self):
+        return len(self.ids)
+
+    def postings(self, hashes):
+        """Retourne, pour chaque terme, les bornes (début, fin) de ses postings (vides si absent)."""
+        positions = np.searchsorted(self.terms, hashes)
+        clipped = np.minimum(positions, len(self.terms) - 1)
+        found = (positions < len(self.terms)) & (self.terms[clipped] == hashes)
+        starts = np.where(found, self.offsets[clipped], 0)
+        ends = np.where(found, self.offsets[clipped + 1], 0)
+        return starts, ends
+
+    @staticmethod
+    def write(directory: str, ids, lengths, hashes, docs, tfs):
+        """Écrit un segment : postings triés par terme puis par document."""
+        order = np.lexsort((docs, hashes))
+        hashes, docs, tfs = hashes[order], docs[order], tfs[order]
+        terms, starts = np.unique(hashes, return_index=True)
+        offsets = np.append(starts, len(hashes)).astype(np.int64)
+        arrays = {
+            "ids": np.asarray([uid.encode("utf-8") for uid in ids], dtype=bytes),
+            "lengths": np.asarray(lengths, dtype=np.int32),
+            "terms": terms.astype(np.uint64),
+            "offsets": offsets,
+            "docs": docs.astype(np.int32),
+            "tfs": tfs.astype(np.int32),
+        }
+        os.makedirs(directory)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+
+
+class BM25Index:
+    """
+    Index inversé BM25 stocké sur disque, maintenu à côté de ChromaDB.
+
+    L'index est formé de segments immuables (tableaux numpy ouverts en mémoire
+    mappée : les workers partagent les pages via le cache du système au lieu
+    de recharger l'index) et d'un manifeste JSON qui liste les segments et les
+    documents supprimés. Un ajout écrit un nouveau segment ; une suppression
+    marque les documents dans le manifeste ; au-delà de `max_segments`, les
+    plus petits segments sont fusionnés. Les écritures sont protégées par un verrou de
+    fichier, les lecteurs rechargent le manifeste quand il change.
+    """
+
+    def __init__(self, path: str, analyzer: FrenchAnalyzer = None, max_segments: int = 8,
+                 k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.analyzer = analyzer or FrenchAnalyzer()
+        self.max_segments = max_segments
+        self.k1 = k1
+        self.b = b
+        self._manifest_path = os.path.join(path, "manifest.json")
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._segments = []      # [(segment, documents supprimés)]
+        self._open_segments = {}
+        self._positions = {}     # Segment -> {identifiant: position}, construit à la première écriture
+        os.makedirs(path, exist_ok=True)
+
+    def builder(self) -> SegmentBuilder:
+        """Crée un accumulateur de documents à passer à add()."""
+        return SegmentBuilder(self.analyzer)
+
+    # --- Manifeste et verrous ---
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"segments": []}
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self._manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self._manifest_path)  # Remplacement atomique
+        self._stamp = None
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path, ".lock"), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _segment(self, name):
+        segment = self._open_segments.get(name)
+        if segment is None:
+            segment = Segment(os.path.join(self.path, name))
+            self._open_segments[name] = segment
+        return segment
+
+    def _refresh(self):
+        """Recharge le manifeste et ouvre les nouveaux segments s'il a changé."""
+        with self._lock:
+            for _ in range(3):
+                try:
+                    stat = os.stat(self._manifest_path)
+                    stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                except FileNotFoundError:
+                    stamp = None
+                if stamp == self._stamp and stamp is not None:
+                    return
+                manifest = self._read_manifest()
+                try:
+                    segments = [(self._segment(entry["name"]), np.asarray(entry["deleted"], dtype=np.int64))
+                                for entry in manifest["segments"]]
+                except FileNotFoundError:
+                    continue  # Segment fusionné entre-temps : relire le manifeste
+                names = {entry["name"] for entry in manifest["segments"]}
+                self._open_segments = {name: seg for name, seg in self._open_segments.items() if name in names}
+                self._positions = {name: pos for name, pos in self._positions.items() if name in names}
+                self._segments = segments
+                self._stamp = stamp
+                return
+
+    # --- Écritures ---
+
+    def _id_positions(self, segment):
+        """
+        Identifiant -> position des documents d'un segment. Construit une fois par
+        segment (immuable) : un ajout ou une suppression ne parcourt plus les
+        identifiants de tout l'index.
+        """
+        positions = self._positions.get(segment.name)
+        if positions is None:
+            positions = {uid: index for index, uid in enumerate(segment.ids.tolist())}
+            self._positions[segment.name] = positions
+        return positions
+
+    def add(self, builder: SegmentBuilder):
+        """
+        Ajoute les documents accumulés dans un nouveau segment. Les documents
+        déjà présents (même identifiant) ne sont pas ajoutés une seconde fois.
+
+        :return: Le nombre de documents ajoutés.
+        """
+        if not len(builder):
+            return 0
+        ids, lengths, hashes, docs, tfs = builder.arrays()
+        with self._write_lock():
+            self._stamp = None
+            self._refresh()
+            encoded = [uid.encode("utf-8") for uid in ids]
+            known = np.zeros(len(ids), dtype=bool)
+            for segment, deleted in self._segments:
+                positions = self._id_positions(segment)
+                deleted = set(deleted.tolist())
+                for index, uid in enumerate(encoded):
+                    position = positions.get(uid)
+                    if position is not None and position not in deleted:
+                        known[index] = True
+            if known.all():
+                return 0
+            if known.any():
+                # Renuméroter les documents restants
+                keep = ~known
+                new_index = np.cumsum(keep) - 1
+                posting_keep = keep[docs]
+                ids = [uid for uid, flag in zip(ids, keep) if flag]
+                lengths, hashes = lengths[keep], hashes[posting_keep]
+                docs, tfs = new_index[docs[posting_keep]], tfs[posting_keep]
+
+            manifest = self._read_manifest()
+            manifest["segments"].append(self._write_segment(ids, lengths, hashes, docs, tfs))
+            merged = []
+            if len(manifest["segments"]) > self.max_segments:
+                manifest, merged = self._merge(manifest)
+            self._write_manifest(manifest)
+            # Les anciens segments ne sont supprimés qu'une fois le nouveau manifeste publié
+            self._remove_segments(merged)
+            return len(ids)
+
+    def delete(self, uids):
+        """Marque des documents comme supprimés (ils disparaissent à la prochaine fusion)."""
+        if not uids:
+            return
+        encoded = [uid.encode("utf-8") for uid in uids]
+        with self._write_lock():
+            manifest = self._read_manifest()
+            changed = False
+            for entry in manifest["segments"]:
+                positions = self._id_positions(self._segment(entry["name"]))
+                new_positions = {positions[uid] for uid in encoded if uid in positions} - set(entry["deleted"])
+                if new_positions:
+                    entry["deleted"] = sorted(set(entry["deleted"]) | new_positions)
+                    changed = True
+            if changed:
+                self._write_manifest(manifest)
+
+    def stage(self, builder: SegmentBuilder, staged: list) -> list:
+        """
+        Écrit un segment sans le publier, pour reconstruire l'index par morceaux :
+        les recherches continuent d'utiliser l'index publié jusqu'à publish().
+        Au-delà de max_segments, les plus petits segments préparés sont fusionnés.
+
+        :param builder: Les documents du segment.
+        :param staged: Les entrées des segments déjà préparés.
+        :return: Les entrées des segments préparés.
+        """
+        if len(builder):
+            staged = staged + [self._write_segment(*builder.arrays())]
+        if len(staged) > self.max_segments:
+            with self._lock:
+                manifest, merged = self._merge({"segments": staged})
+                self._remove_segments(merged)  # Jamais publiés : suppression immédiate
+            staged = manifest["segments"]
+        return staged
+
+    def begin_rebuild(self) -> dict:
+        """
+        Photographie l'index au début d'une reconstruction, à passer à publish().
+
+        :return: Segment publié -> positions des documents déjà supprimés.
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+        return {entry["name"]: list(entry["deleted"]) for entry in manifest["segments"]}
+
+    def publish(self, staged: list, snapshot: dict):
+        """
+        Remplace les segments présents au début de la reconstruction par les segments
+        préparés (un seul remplacement du manifeste). Les écritures faites pendant la
+        reconstruction sont conservées : les segments ajoutés depuis restent publiés
+        (leurs documents priment sur les copies préparées) et les suppressions faites
+        depuis sont reportées sur les segments préparés.
+
+        :param staged: Les entrées des segments préparés (voir stage).
+        :param snapshot: La photographie retournée par begin_rebuild.
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            replaced, newer, superseded = [], [], set()
+            for entry in manifest["segments"]:
+                segment = self._segment(entry["name"])
+                if entry["name"] in snapshot:
+                    replaced.append(entry["name"])
+                    fresh = set(entry["deleted"]) - set(snapshot[entry["name"]])
+                    superseded.update(segment.ids[position] for position in fresh)
+                else:
+                    newer.append(entry)  # Écrit pendant la reconstruction (ingestion, fusion)
+                    superseded.update(segment.ids.tolist())
+            for entry in staged:
+                positions = self._id_positions(self._segment(entry["name"]))
+                hidden = {positions[uid] for uid in superseded if uid in positions}
+                if hidden:
+                    entry["deleted"] = sorted(set(entry["deleted"]) | hidden)
+            self._write_manifest({"segments": staged + newer})
+            self._remove_segments(replaced)
+
+    def discard(self, staged: list):
+        """Supprime des segments préparés qui ne seront pas publiés."""
+        with self._lock:
+            self._remove_segments([entry["name"] for entry in staged])
+
+    def clear(self):
+        """Vide l'index."""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            self._write_manifest({"segments": []})
+            self._remove_segments([entry["name"] for entry in manifest["segments"]])
+
+    def _remove_segments(self, names):
+        """Supprime des segments qui ne sont plus dans le manifeste publié."""
+        # Les lecteurs qui ont encore les anciens segments ouverts les gardent (mémoire mappée)
+        for name in names:
+            self._open_segments.pop(name, None)
+            self._positions.pop(name, None)
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def _write_segment(self, ids, lengths, hashes, docs, tfs):
+        """Écrit un nouveau segment et retourne son entrée de manifeste."""
+        name = f"seg-{time.time_ns()}-{os.getpid()}"
+        Segment.write(os.path.join(self.path, name), ids, lengths, hashes, docs, tfs)
+        return {"name": name, "docs": len(ids), "total_length": int(np.sum(lengths)), "deleted": []}
+
+    def _merge(self, manifest):
+        """
+        Fusionne les plus petits segments en un seul, sans les documents supprimés,
+        pour revenir à max_segments / 2 segments : les gros segments ne sont pas
+        réécrits à chaque fusion. Les anciens segments restent sur le disque :
+        à supprimer (_remove_segments) après l'écriture du nouveau manifeste.
+
+        :return: (nouveau manifeste, noms des segments fusionnés)
+        """
+        entries = manifest["segments"]
+        by_size = sorted(entries, key=lambda entry: entry["docs"] - len(entry["deleted"]))
+        to_merge = by_size[:max(2, len(entries) - self.max_segments // 2)]
+        merged_names = {entry["name"] for entry in to_merge}
+
+        ids, lengths, hashes, docs, tfs = [], [], [], [], []
+        base = 0
+        for entry in to_merge:
+            segment = self._segment(entry["name"])
+            keep = np.ones(segment.doc_count, dtype=bool)
+            keep[np.asarray(entry["deleted"], dtype=np.int64)] = False
+            new_index = np.cumsum(keep) - 1 + base
+            posting_keep = keep[segment.docs]
+            ids.extend(uid.decode("utf-8") for uid in np.asarray(segment.ids)[keep])
+            lengths.append(np.asarray(segment.lengths)[keep])
+            hashes.append(np.repeat(segment.terms, np.diff(segment.offsets))[posting_keep])
+            docs.append(new_index[segment.docs][posting_keep])
+            tfs.append(np.asarray(segment.tfs)[posting_keep])
+            base += int(keep.sum())
+
+        old_names = [entry["name"] for entry in to_merge]
+        merged = {"segments": [entry for entry in entries if entry["name"] not in merged_names]}
+        if ids:
+            merged["segments"].append(self._write_segment(ids, np.concatenate(lengths), np.concatenate(hashes),
+                                                          np.concatenate(docs), np.concatenate(tfs)))
+        logger.info(f"Index lexical : {len(old_names)} segments fusionnés ({len(ids)} documents)")
+        return merged, old_names
+
+    # --- Lecture ---
+
+    def search(self, query: str, top_k: int = 10):
+        """
+        Recherche les documents les plus pertinents (BM25) pour une requête.
+        Les documents supprimés (pas encore retirés par une fusion) sont exclus
+        des résultats et des statistiques : nombre de documents, longueur
+        moyenne et fréquence des termes (df).
+
+        :param query: La requête.
+        :param top_k: Le nombre de résultats.
+        :return: Une liste de (identifiant, score), du plus au moins pertinent.
+        """
+        self._refresh()
+        segments = self._segments
+        terms = list(dict.fromkeys(self.analyzer.analyze(query)))
+        if not segments or not terms:
+            return []
+        hashes = np.asarray([term_hash(term) for term in terms], dtype=np.uint64)
+
+        doc_count = sum(segment.doc_count - len(deleted) for segment, deleted in segments)
+        total_length = sum(float(np.sum(segment.lengths)) - float(np.sum(np.asarray(segment.lengths)[deleted]))
+                           for segment, deleted in segments)
+        avg_length = total_length / max(doc_count, 1)
+        bounds = [segment.postings(hashes) for segment, _ in segments]
+        df = np.zeros(len(hashes), dtype=np.int64)
+        for (segment, deleted), (starts, ends) in zip(segments, bounds):
+            counts = ends - starts
+            if len(deleted):
+                for term, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+                    if start < end:
+                        counts[term] -= np.count_nonzero(np.isin(segment.docs[start:end], deleted))
+            df += counts
+        idf = np.log1p((doc_count - df + 0.5) / (df + 0.5))
+
+        results = []
+        for (segment, deleted), (starts, ends) in zip(segments, bounds):
+            scores = np.zeros(segment.doc_count, dtype=np.float32)
+            lengths = np.asarray(segment.lengths, dtype=np.float32)
+            for weight, start, end in zip(idf.tolist(), starts.tolist(), ends.tolist()):
+                if start == end:
+                    continue
+                docs = segment.docs[start:end]
+                tf = segment.tfs[start:end].astype(np.float32)
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avg_length)
+                scores[docs] += weight * tf * (self.k1 + 1) / (tf + norm)
+            scores[deleted] = 0
+            matches = np.nonzero(scores > 0)[0]
+            if len(matches) > top_k:
+                matches = matches[np.argpartition(scores[matches], -top_k)[-top_k:]]
+            results.extend((float(scores[doc]), segment.ids[doc].decode("utf-8")) for doc in matches)
+
+        results.sort(key=lambda pair: pair[0], reverse=True)
+        return [(uid, score) for score, uid in results[:top_k]]
+
+    def stats(self):
+        """Retourne le nombre de segments et de documents de l'index."""
+        self._refresh()
+        return {
+            "segments": len(self._segments),
+            "documents": sum(segment.doc_count for segment, _ in self._segments),
+            "deleted": sum(len(deleted) for _, deleted in self._segments),
+        }
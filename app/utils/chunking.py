@@ -0,0 +1,174 @@
+import bisect
+import numpy as np
+
+
+class ChunkingEngine:
+    """
+    Moteur de découpage partagé par tous les types de fichiers.
+
+    Les mots sont accumulés dans un tableau unique et les fenêtres (début, fin)
+    sont calculées d'un coup avec numpy ; les pages de chaque chunk sont lues
+    dans un index (premier mot de chaque page) au lieu d'être suivies mot par mot.
+    Le flux est traité par blocs de `block_size` mots, la mémoire reste donc
+    bornée quelle que soit la taille du document.
+
+    Les fenêtres reproduisent le découpage historique : `window` mots, `overlap`
+    mots de chevauchement, puis un dernier chunk avec les mots restants.
+    """
+
+    def __init__(self, window: int = 100, overlap: int = 50, token_counter=None, max_tokens: int = None,
+                 block_size: int = 65536):
+        """
+        :param window: Le nombre de mots par chunk.
+        :param overlap: Le nombre de mots repris du chunk précédent.
+        :param token_counter: Fonction liste de mots -> nombre de tokens de chaque mot
+                              (voir from_tokenizer). Requise avec `max_tokens`.
+        :param max_tokens: Le nombre maximal de tokens par chunk (None : pas de limite).
+        :param block_size: Le nombre de mots traités par bloc.
+        """
+        if not 0 <= overlap < window:
+            raise ValueError("Le chevauchement doit être compris entre 0 et la taille de la fenêtre.")
+        if max_tokens and token_counter is None:
+            raise ValueError("max_tokens nécessite un token_counter.")
+        self.window = window
+        self.overlap = overlap
+        self.step = window - overlap
+        self.token_counter = token_counter
+        self.max_tokens = max_tokens or None
+        self.block_size = max(block_size, window)
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, max_tokens: int, **kwargs):
+        """
+        Crée un moteur dont les chunks ne dépassent pas `max_tokens` tokens
+        du tokenizer (Hugging Face) du modèle d'embedding.
+        """
+        def token_counter(words):
+            encoded = tokenizer(words, add_special_tokens=False)["input_ids"]
+            return [len(ids) for ids in encoded]
+
+        return cls(token_counter=token_counter, max_tokens=max_tokens, **kwargs)
+
+    def window_offsets(self, n: int, start: int = 0, final: bool = True, cum_tokens=None):
+        """
+        Calcule les fenêtres d'un tableau de `n` mots à partir de l'index `start`.
+
+        :param n: Le nombre de mots disponibles.
+        :param start: L'index du premier mot de la première fenêtre.
+        :param final: Ajouter le dernier chunk (mots restants) : fin du document.
+        :param cum_tokens: Somme cumulée des tokens (taille n + 1), si max_tokens est utilisé.
+        :return: (débuts, fins, début de la prochaine fenêtre)
+        """
+        if cum_tokens is None:
+            starts = np.arange(start, n - self.window + 1, self.step, dtype=np.int64)
+            ends = starts + self.window
+            next_start = int(starts[-1]) + self.step if len(starts) else start
+            if final and next_start < n:
+                starts = np.append(starts, next_start)
+                ends = np.append(ends, n)
+                next_start = n
+            return starts, ends, next_start
+
+        # Fenêtres limitées en tokens : chaque fin dépend de la précédente
+        starts, ends = [], []
+        s = start
+        while s < n and (final or s + self.window <= n):
+            limit = int(np.searchsorted(cum_tokens, cum_tokens[s] + self.max_tokens, side="right")) - 1
+            e = max(s + 1, min(s + self.window, n, limit))
+            starts.append(s)
+            ends.append(e)
+            if e >= n and final:
+                s = n
+                break
+            # Fenêtre raccourcie par la limite de tokens : chevauchement borné à la moitié
+            # de la fenêtre, sinon la suivante n'avancerait que d'un mot
+            overlap = self.overlap if e - s >= self.window else min(self.overlap, (e - s) // 2)
+            s = max(e - overlap, s + 1)
+        return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), s
+
+    def chunk_text(self, text: str):
+        """Découpe un texte en chunks (liste de chaînes)."""
+        words = text.split()
+        starts, ends, _ = self.window_offsets(len(words), cum_tokens=self._cum_tokens(words))
+        return [' '.join(words[s:e]) for s, e in zip(starts.tolist(), ends.tolist())]
+
+    def _cum_tokens(self, words):
+        if self.max_tokens is None:
+            return None
+        return np.concatenate(([0], np.cumsum(self.token_counter(words), dtype=np.int64)))
+
+    def iter_chunks(self, pages, file_name, timestamp, page_label=None):
+        """
+        Découpe un flux de pages en chunks.
+
+        :param pages: Un itérable de couples (numéro de page, liste de mots).
+        :param file_name: Le nom du fichier (métadonnée des chunks).
+        :param timestamp: La date de traitement (métadonnée des chunks).
+        :param page_label: Valeur fixe de "pages" (ex. fichiers Word sans pagination).
+        :return: Un générateur de chunks.
+        """
+        words = []          # Mots du bloc courant
+        base = 0            # Index global du premier mot du bloc
+        page_starts = []    # Index global du premier mot de chaque page
+        page_nums = []
+        next_start = 0      # Index global de la prochaine fenêtre
+        prev_last_page = 1  # Page du dernier mot du chunk précédent
+        chunk_id = 1
+        page_num = None
+
+        def page_of(indexes):
+            positions = np.searchsorted(page_starts, indexes, side="right") - 1
+            return np.asarray(page_nums)[positions]
+
+        def emit(final):
+            nonlocal next_start, prev_last_page, chunk_id
+            n = len(words)
+            cum_tokens = self._cum_tokens(words)
+            starts, ends, local_next = self.window_offsets(n, next_start - base, final, cum_tokens)
+            if len(starts) == 0:
+                return
+
+            if page_label is None:
+                last_pages = page_of(ends - 1 + base)
+                first_pages = np.concatenate(([prev_last_page], last_pages[:-1]))
+                if final and self.max_tokens is None and starts[-1] + self.window > n:
+                    # Dernier chunk : historiquement, il se termine sur la dernière page lue
+                    last_pages[-1] = page_num
+                prev_last_page = int(last_pages[-1])
+                pages_values = [f"{first}-{last}" if first != last else str(last)
+                                for first, last in zip(first_pages.tolist(), last_pages.tolist())]
+            else:
+                pages_values = [page_label] * len(starts)
+
+            for pages_value, s, e in zip(pages_values, starts.tolist(), ends.tolist()):
+                yield {
+                    "file_name": file_name,
+                    "pages": pages_value,
+                    "timestamp": timestamp,
+                    "chunk_id": chunk_id,
+                    "chunk": ' '.join(words[s:e])
+                }
+                chunk_id += 1
+            next_start = base + local_next
+
+        def drop_consumed():
+            nonlocal words, base
+            consumed = next_start - base
+            if consumed <= 0:
+                return
+            del words[:consumed]
+            base = next_start
+            # Garder la page qui contient le premier mot restant
+            keep = max(bisect.bisect_right(page_starts, base) - 1, 0)
+            del page_starts[:keep]
+            del page_nums[:keep]
+
+        for page_num, page_words in pages:
+            page_starts.append(base + len(words))
+            page_nums.append(page_num)
+            words.extend(page_words)
+            if len(words) >= self.block_size + self.window:
+                yield from emit(final=False)
+                drop_consumed()
+
+        yield from emit(final=True)
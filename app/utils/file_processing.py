@@ -4,13 +4,30 @@ import logging
 import re
 import os
 #import win32com.client as win32
-from langchain_community.embeddings import HuggingFaceEmbeddings
 import datetime
+import hashlib
+import multiprocessing
+import queue
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import openpyxl
-from sentence_transformers import SentenceTransformer
 import numpy as np
 import platform
+from app.core.config import (
+    CHUNK_WORDS,
+    CHUNK_OVERLAP,
+    CHUNK_MAX_TOKENS,
+    EXCEL_ROWS_PER_CHUNK,
+    INGESTION_BATCH_SIZE,
+    PDF_EXTRACT_WORKERS,
+    PDF_PARALLEL_MIN_PAGES,
+    PDF_PAGES_PER_TASK,
+)
+from app.services.embedding_service import get_embedding_engine
+from app.utils.chunking import ChunkingEngine
 
 if platform.system() == "Windows":
     import win32com.client as win32
@@ -30,30 +47,50 @@ def divide_text_by_min_words(text, min_words=250, overlap=50):
     :param overlap: Le nombre de mots à chevaucher entre les chunks.
     :return: Une liste de morceaux de texte.
     """
-    words = text.split()
-    chunks = []
-    i = 0
-
-    while i < len(words):
-        end = i + min_words
-        chunk = words[i:end]
-        chunks.append(' '.join(chunk))
-        i += min_words - overlap
-
-    return chunks
+    return ChunkingEngine(window=min_words, overlap=overlap).chunk_text(text)
 
 # Fonction pour vectoriser les chunks de texte
 def vectorize_chunks(chunks):
     """
-    Vectorise les chunks de texte en utilisant langchain.
+    Vectorise les chunks de texte avec le moteur d'embedding partagé du processus.
     
     :parametre chunks: Une liste de morceaux de texte.
     :return: Une liste de vecteurs.
     """
-    model_name = "sentence-transformers/all-mpnet-base-v2"
-    embeddings = HuggingFaceEmbeddings(model_name=model_name)
-    vectors = embeddings.embed_documents(chunks)
-    return vectors
+    return get_embedding_engine().embed_documents(chunks)
+
+# Fonction pour regrouper un flux en batchs
+def iter_batches(iterable, batch_size):
+    """
+    Regroupe les éléments d'un itérable en listes de `batch_size` éléments.
+    
+    :param iterable: L'itérable à découper.
+    :param batch_size: La taille des batchs.
+    :return: Un générateur de listes.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Fonction pour vectoriser un flux de chunks par batchs
+def vectorize_chunk_stream(chunks, batch_size=INGESTION_BATCH_SIZE):
+    """
+    Ajoute le vecteur de chaque chunk d'un flux, en vectorisant par batchs.
+    
+    :param chunks: Un itérable de chunks.
+    :param batch_size: Le nombre de chunks vectorisés ensemble.
+    :return: Un générateur de chunks avec la clé "vector".
+    """
+    for batch in iter_batches(chunks, batch_size):
+        vectors = vectorize_chunks([chunk["chunk"] for chunk in batch])
+        for chunk, vector in zip(batch, vectors):
+            chunk["vector"] = vector
+            yield chunk
 
 # Fonction pour nettoyer le texte et supprimer les séquences inutiles
 def filter_unnecessary_sequences(text):
@@ -67,92 +104,107 @@ def filter_unnecessary_sequences(text):
     text = re.sub(r'\.{3,}', '', text)
     return text
 
-# Fonction pour traiter les fichiers Word
-def process_word_file(file_path):
+_chunking_engine = None
+
+# Fonction pour obtenir le moteur de découpage partagé
+def get_chunking_engine():
     """
-    Traite un fichier Word et le divise en morceaux de texte basés sur les paragraphes.
-    Détecte également les images et les inclut dans les chunks.
+    Retourne le moteur de découpage du processus, configuré par CHUNK_WORDS,
+    CHUNK_OVERLAP et CHUNK_MAX_TOKENS (limite en tokens du modèle d'embedding).
+    """
+    global _chunking_engine
+    if _chunking_engine is None:
+        if CHUNK_MAX_TOKENS:
+            tokenizer = get_embedding_engine()._get_model().tokenizer
+            _chunking_engine = ChunkingEngine.from_tokenizer(
+                tokenizer, CHUNK_MAX_TOKENS, window=CHUNK_WORDS, overlap=CHUNK_OVERLAP
+            )
+        else:
+            _chunking_engine = ChunkingEngine(window=CHUNK_WORDS, overlap=CHUNK_OVERLAP)
+    return _chunking_engine
+
+# Fonction pour découper un flux de mots en chunks avec chevauchement
+def iter_word_chunks(pages, file_name, timestamp, page_label=None):
+    """
+    Découpe un flux de mots en chunks avec chevauchement, sans jamais
+    matérialiser tout le document (voir app.utils.chunking.ChunkingEngine).
+    
+    :param pages: Un itérable de couples (numéro de page, liste de mots).
+    :param file_name: Le nom du fichier (métadonnée des chunks).
+    :param timestamp: La date de traitement (métadonnée des chunks).
+    :param page_label: Valeur fixe de "pages" (ex. fichiers Word sans pagination).
+    :return: Un générateur de chunks.
+    """
+    return get_chunking_engine().iter_chunks(pages, file_name, timestamp, page_label=page_label)
 
+# Fonction pour extraire le texte d'un fichier Word au fil de l'eau
+def iter_word_texts(doc):
+    """
+    Parcourt les paragraphes, les tableaux et les images d'un document Word.
+    
+    :param doc: Le document python-docx.
+    :return: Un générateur de textes.
+    """
+    for para in doc.paragraphs:
+        if para.text.strip() == "":
+            continue
+        yield para.text
+
+    # Récupérer le texte des tableaux
+    for table_index, table in enumerate(doc.tables):
+        table_content = []
+        for row in table.rows:
+            row_content = []
+            for cell in row.cells:
+                cell_text = cell.text.strip()
+                if cell_text:
+                    row_content.append(cell_text)
+            if row_content:
+                table_content.append(' | '.join(row_content))
+        if table_content:
+            yield f"Table {table_index + 1}: " + ' || '.join(table_content)
+            print(f"Table {table_index + 1}:")
+            for row in table_content:
+                print(row)
+
+    # Détecter les images
+    for rel in doc.part.rels.values():
+        if "image" in rel.target_ref:
+            yield f"[Image: {rel.target_ref}]"
+
+# Fonction pour découper un fichier Word en flux de chunks
+def iter_word_file_chunks(file_path):
+    """
+    Découpe un fichier Word en chunks, au fil de l'eau.
+    
+    :param file_path: Le chemin du fichier.
+    :return: Un générateur de chunks (sans vecteurs).
     """
     try:
         doc = Document(file_path)
-        full_text = []
-
-        for para in doc.paragraphs:
-            if para.text.strip() == "":
-                continue
-            full_text.append(para.text)
-
-        # Récupérer le texte des tableaux
-        for table_index, table in enumerate(doc.tables):
-            table_content = []
-            for row in table.rows:
-                row_content = []
-                for cell in row.cells:
-                    cell_text = cell.text.strip()
-                    if cell_text:
-                        row_content.append(cell_text)
-                if row_content:
-                    table_content.append(' | '.join(row_content))
-            if table_content:
-                full_text.append(f"Table {table_index + 1}: " + ' || '.join(table_content))
-                print(f"Table {table_index + 1}:")
-                for row in table_content:
-                    print(row)
-        
-        
-        # Détecter les images
-        for rel in doc.part.rels.values():
-            if "image" in rel.target_ref:
-                full_text.append(f"[Image: {rel.target_ref}]")
-        
-        text = ' '.join(full_text)
-        text = filter_unnecessary_sequences(text)
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        overlap = 50
         timestamp = datetime.datetime.now().isoformat()
         file_name = os.path.basename(file_path)
-        chunks_id_counter = 1
-
-        for word in words:
-            current_chunk.append(word)
-            if len(current_chunk) >= 100:
-                chunks.append({
-                    "file_name": file_name,
-                    "pages": "Non trouvé",  # Par défaut pour les fichiers Word
-                    "timestamp": timestamp,
-                    "chunk_id": chunks_id_counter,
-                    "chunk": ' '.join(current_chunk)
-                })
-                chunks_id_counter += 1
-                current_chunk = current_chunk[-overlap:]  # Conserver les 50 derniers mots
-
-        # Ajouter le dernier chunk s'il contient des mots
-        if current_chunk:
-            chunks.append({
-                "file_name": file_name,
-                "pages": "Non trouvé",  # Par défaut pour les fichiers Word
-                "timestamp": timestamp,
-                "chunk_id": chunks_id_counter,
-                "chunk": ' '.join(current_chunk)
-            })
-
-        # Vectoriser les chunks et ajouter les vecteurs aux chunks
-        chunk_texts = [chunk["chunk"] for chunk in chunks]
-        vectors = vectorize_chunks(chunk_texts)
-        
-        for i, chunk in enumerate(chunks):
-            chunk["vector"] = vectors[i]
-
-        return chunks
+        # Les séquences de points ne peuvent pas chevaucher deux textes (joints par un espace)
+        texts = ((None, filter_unnecessary_sequences(text).split()) for text in iter_word_texts(doc))
+        yield from iter_word_chunks(texts, file_name, timestamp, page_label="Non trouvé")  # Par défaut pour les fichiers Word
     except Exception as e:
         logger.error(f"Error processing Word file: {e}")
         raise
 
+# Fonction pour traiter les fichiers Word
+def process_word_file(file_path, vectorize=True):
+    """
+    Traite un fichier Word et le divise en morceaux de texte basés sur les paragraphes.
+    Détecte également les images et les inclut dans les chunks.
+
+    :param vectorize: Ajouter le vecteur de chaque chunk (clé "vector").
+    :return: Un itérateur de chunks.
+    """
+    chunks = iter_word_file_chunks(file_path)
+    return vectorize_chunk_stream(chunks) if vectorize else chunks
+
 # Fonction pour traiter les fichiers .doc
-def process_doc_file(file_path):
+def process_doc_file(file_path, vectorize=True):
     """
     Traite un fichier Word .doc en le convertissant en .docx,
     puis le divise en morceaux de texte.
@@ -182,97 +234,155 @@ def process_doc_file(file_path):
             raise FileNotFoundError(f"Conversion failed, DOCX file not found: {docx_file_path}")
         
         # Traiter le fichier .docx comme un fichier Word
-        return process_word_file(docx_file_path)
+        return process_word_file(docx_file_path, vectorize=vectorize)
     except Exception as e:
         logger.error(f"Error processing DOC file: {e}")
         raise
 
-# Fonction pour traiter les fichiers PDF
-def process_pdf_file(file_path):
+# Fonction pour extraire les mots d'un PDF page par page
+def iter_pdf_pages(doc):
     """
-    Traite un fichier PDF et le divise en morceaux de texte basés sur les paragraphes.
+    Parcourt les pages d'un PDF et retourne leurs mots.
+    
+    :param doc: Le document fitz.
+    :return: Un générateur de couples (numéro de page, liste de mots).
+    """
+    for page_num, page in enumerate(doc, start=1):
+        text = page.get_text("text")
+        text = filter_unnecessary_sequences(text)
+        yield page_num, text.split()
+
+# Fonction exécutée dans un processus d'extraction PDF
+def extract_pdf_page_range(file_path, start, end):
+    """
+    Extrait les mots d'une plage de pages avec un document fitz propre au processus.
+    
+    :param file_path: Le chemin du fichier.
+    :param start: Index (à partir de 0) de la première page.
+    :param end: Index de fin (exclu).
+    :return: La liste des couples (numéro de page, liste de mots).
+    """
+    with fitz.open(file_path) as doc:
+        pages = []
+        for page_index in range(start, end):
+            text = doc[page_index].get_text("text")
+            text = filter_unnecessary_sequences(text)
+            pages.append((page_index + 1, text.split()))
+        return pages
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+def get_pdf_extraction_pool():
+    """Retourne le pool de processus d'extraction PDF, créé au premier appel."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                _pdf_pool = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pdf_pool
+
+# Fonction pour extraire les pages d'un PDF en parallèle
+def iter_pdf_pages_parallel(file_path, page_count, pages_per_task=PDF_PAGES_PER_TASK):
+    """
+    Répartit les plages de pages d'un PDF sur le pool d'extraction et restitue
+    les pages dans l'ordre, comme iter_pdf_pages. Le nombre de plages en cours
+    est borné pour ne pas accumuler tout le document en mémoire.
+    
+    :param file_path: Le chemin du fichier.
+    :param page_count: Le nombre de pages du document.
+    :param pages_per_task: Le nombre de pages par tâche.
+    :return: Un générateur de couples (numéro de page, liste de mots).
+    """
+    pool = get_pdf_extraction_pool()
+    ranges = iter(
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    )
+    pending = deque()
+    try:
+        for start, end in ranges:
+            pending.append(pool.submit(extract_pdf_page_range, file_path, start, end))
+            if len(pending) >= PDF_EXTRACT_WORKERS * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+# Fonction pour découper un PDF en flux de chunks
+def iter_pdf_chunks(file_path):
+    """
+    Découpe un fichier PDF en chunks, page par page, sans charger tout le document.
+    Les gros documents sont extraits en parallèle ; les chunks obtenus sont
+    identiques à ceux de l'extraction séquentielle.
+    
+    :param file_path: Le chemin du fichier.
+    :return: Un générateur de chunks (sans vecteurs).
     """
     try:
-        doc = fitz.open(file_path)
-        full_text = []
-        current_page = 1
-        current_chunk = []
-        chunks = []
-        overlap = 50
         timestamp = datetime.datetime.now().isoformat()
         file_name = os.path.basename(file_path)
-        chunks_id_counter = 1
-
-        for page_num, page in enumerate(doc, start=1):
-            text = page.get_text("text")
-            text = filter_unnecessary_sequences(text)
-            words = text.split()
-            
-            for word in words:
-                current_chunk.append(word)
-                if len(current_chunk) >= 100:
-                    chunks.append({
-                        "file_name": file_name,
-                        "pages": f"{current_page}-{page_num}" if current_page != page_num else str(page_num),
-                        "timestamp": timestamp,
-                        "chunk_id": chunks_id_counter,
-                        "chunk": ' '.join(current_chunk)
-                    })
-                    chunks_id_counter += 1
-                    current_chunk = current_chunk[-overlap:]  # Conserver les 50 derniers mots
-                    current_page = page_num
-
-        # Ajouter le dernier chunk s'il contient des mots
-        if current_chunk:
-            chunks.append({
-                "file_name": file_name,
-                "pages": f"{current_page}-{page_num}" if current_page != page_num else str(page_num),
-                "timestamp": timestamp,
-                "chunk_id": chunks_id_counter,
-                "chunk": ' '.join(current_chunk)
-            })
-
-        # Vectoriser les chunks et ajouter les vecteurs aux chunks
-        chunk_texts = [chunk["chunk"] for chunk in chunks]
-        vectors = vectorize_chunks(chunk_texts)
-        
-        for i, chunk in enumerate(chunks):
-            chunk["vector"] = vectors[i]
-
-        return chunks
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+            if PDF_EXTRACT_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+                logger.info(f"Extraction parallèle de {page_count} pages : {file_path}")
+                pages = iter_pdf_pages_parallel(file_path, page_count)
+            else:
+                pages = iter_pdf_pages(doc)
+            yield from iter_word_chunks(pages, file_name, timestamp)
     except Exception as e:
         logger.error(f"Error processing PDF file: {e}")
         raise
 
-# Fonction pour charger un fichier Excel avec openpyxl
-def load_excel_with_hidden_content(file_name):
+# Fonction pour traiter les fichiers PDF
+def process_pdf_file(file_path, vectorize=True):
     """
-    Charge un fichier Excel en incluant les contenus masqués.
+    Traite un fichier PDF et le divise en morceaux de texte basés sur les paragraphes.
+
+    :param vectorize: Ajouter le vecteur de chaque chunk (clé "vector").
+    :return: Un itérateur de chunks.
+    """
+    chunks = iter_pdf_chunks(file_path)
+    return vectorize_chunk_stream(chunks) if vectorize else chunks
+
+# Fonction pour parcourir un fichier Excel avec openpyxl
+def iter_excel_sheets(file_name):
+    """
+    Parcourt un fichier Excel en lecture seule (streaming), contenus masqués compris.
+    Les lignes sont lues au fil de l'eau : la mémoire ne dépend pas de la taille du classeur.
     
     Args:
         file_name (str): Nom du fichier Excel (ex. : "example.xlsm").
 
     Returns:
-        dict: Dictionnaire contenant les feuilles et leurs données (visibles et masquées).
+        Générateur de couples (nom de la feuille, itérateur de lignes (numéro, valeurs)).
     """
     try:
-        # Construire le chemin complet
-        file_path = file_name
-        # Charger le fichier Excel avec openpyxl
-        workbook = openpyxl.load_workbook(file_path, data_only=True, keep_links=True)
-
-        data = {}
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            sheet_data = []
-            for row in sheet.iter_rows(values_only=True):
-                sheet_data.append(row)
-            data[sheet_name] = sheet_data
-
-        return data
+        workbook = openpyxl.load_workbook(file_name, read_only=True, data_only=True, keep_links=False)
     except Exception as e:
         raise ValueError(f"Erreur lors du chargement du fichier Excel : {e}")
-    
+
+    try:
+        for sheet in workbook.worksheets:
+            rows = enumerate(sheet.iter_rows(values_only=True), start=1)
+            yield sheet.title, rows
+    finally:
+        workbook.close()  # Le mode lecture seule garde le fichier ouvert
+
+# Fonction pour nettoyer une ligne extraite sur excel
+def clean_row(row):
+    """
+    Normalise une ligne (cellules en texte) ; retourne None si elle est entièrement vide.
+    """
+    if not any(row):
+        return None
+    return [str(cell).strip() if cell else "" for cell in row]
+
 # Fonction pour nettoyer les données extraites sur excel
 def clean_data(data):
     """
@@ -280,8 +390,9 @@ def clean_data(data):
     """
     cleaned_data = []
     for row in data:
-        if any(row):  # Conserver les lignes qui ne sont pas entièrement vides
-            cleaned_data.append([str(cell).strip() if cell else "" for cell in row])
+        cleaned_row = clean_row(row)
+        if cleaned_row is not None:  # Conserver les lignes qui ne sont pas entièrement vides
+            cleaned_data.append(cleaned_row)
     return cleaned_data
 
 # Fonction pour vectoriser les données sur excel (chunk)
@@ -290,72 +401,206 @@ def vectorize_page(page_data):
     Vectorise les données d'une page (chunk).
     """
     text = " ".join([" ".join(map(str, row)) for row in page_data])
-    model_name = "sentence-transformers/all-mpnet-base-v2"
-    embeddings = HuggingFaceEmbeddings(model_name=model_name)
-    embedding = embeddings.embed_documents([text])
-    return embedding.tolist()  # Convertir en liste Python
+    return get_embedding_engine().embed_query(text)
 
-# Fonction pour traiter les fichiers Excel
-def process_excel_file(file_name):
+# Fonction pour découper un fichier Excel en flux de chunks
+def iter_excel_chunks(file_name, rows_per_chunk=EXCEL_ROWS_PER_CHUNK):
     """
-    Traite un fichier Excel et génère un chunk par page (feuille).
+    Découpe chaque feuille d'un fichier Excel en fenêtres de lignes. La première
+    ligne non vide d'une feuille est considérée comme l'en-tête et répétée en
+    tête de chaque chunk pour garder le contexte des colonnes.
+    
+    :param file_name: Le chemin du fichier.
+    :param rows_per_chunk: Le nombre de lignes de données par chunk.
+    :return: Un générateur de chunks (sans vecteurs) ; "pages" vaut "feuille:première-dernière ligne".
     """
     try:
-        # Charger tout le contenu, y compris les données masquées
-        data = load_excel_with_hidden_content(file_name)
-
-        chunks = []
         timestamp = datetime.datetime.now().isoformat()
-        file_name = os.path.basename(file_name)
+        base_name = os.path.basename(file_name)
         chunks_id_counter = 1
 
-        for sheet_name, sheet_data in data.items():
-            # Nettoyer les données
-            cleaned_data = clean_data(sheet_data)
-            
-            # Vectoriser les données de la feuille entière
-            #embedding = vectorize_page(cleaned_data)
-
-            chunk_text = ' '.join([' '.join(map(str, row)) for row in cleaned_data])
-            
-
-            # Ajouter les résultats
-            chunks.append({
-                "file_name": file_name,
-                "pages": sheet_name,
+        def make_chunk(sheet_name, header, rows):
+            nonlocal chunks_id_counter
+            lines = ([header[1]] if header else []) + [cells for _, cells in rows]
+            chunk = {
+                "file_name": base_name,
+                "pages": f"{sheet_name}:{rows[0][0]}-{rows[-1][0]}",
                 "timestamp": timestamp,
                 "chunk_id": chunks_id_counter,
-                "chunk": chunk_text,
-                
-            })
+                "chunk": ' '.join(' '.join(cells) for cells in lines),
+            }
             chunks_id_counter += 1
+            return chunk
+
+        for sheet_name, rows in iter_excel_sheets(file_name):
+            header = None
+            window = []
+            sheet_chunks = 0
+            for row_number, row in rows:
+                cells = clean_row(row)
+                if cells is None:
+                    continue
+                if header is None:
+                    header = (row_number, cells)
+                    continue
+                window.append((row_number, cells))
+                if len(window) >= rows_per_chunk:
+                    yield make_chunk(sheet_name, header, window)
+                    sheet_chunks += 1
+                    window = []
+
+            if window:
+                yield make_chunk(sheet_name, header, window)
+            elif header is not None and sheet_chunks == 0:
+                # Feuille réduite à une seule ligne : elle forme son propre chunk
+                yield make_chunk(sheet_name, None, [header])
+    except Exception as e:
+        logger.error(f"Error processing Excel file: {e}")
+        raise ValueError(str(e))
 
-        chunk_texts = [chunk["chunk"] for chunk in chunks]
-        vectors = vectorize_chunks(chunk_texts)
-        
-        for i, chunk in enumerate(chunks):
-            chunk["vector"] = vectors[i]
+# Fonction pour traiter les fichiers Excel
+def process_excel_file(file_name, vectorize=True):
+    """
+    Traite un fichier Excel et génère des chunks de lignes pour chaque page (feuille).
 
-        return chunks
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    :param vectorize: Ajouter le vecteur de chaque chunk (clé "vector").
+    :return: Un itérateur de chunks.
+    """
+    chunks = iter_excel_chunks(file_name)
+    return vectorize_chunk_stream(chunks) if vectorize else chunks
 
 # Fonction principale pour traiter les fichiers
-def process_file(file_path):
+def process_file(file_path, vectorize=True):
     """
     Traite un fichier en fonction de son type et le divise en morceaux de texte.
+    Les chunks sont produits au fil de l'eau : la mémoire utilisée dépend de la
+    taille des batchs, pas de celle du document.
     
     :param file_path: Le chemin du fichier.
-    :return: Une liste de morceaux de texte avec des informations sur le fichier.
+    :param vectorize: Ajouter le vecteur de chaque chunk (clé "vector").
+    :return: Un itérateur de morceaux de texte avec des informations sur le fichier.
     """
     if file_path.endswith('.pdf'):
-        return process_pdf_file(file_path)
+        return process_pdf_file(file_path, vectorize=vectorize)
     elif file_path.endswith('.docx'):
-        return process_word_file(file_path)
+        return process_word_file(file_path, vectorize=vectorize)
     elif file_path.endswith('.doc'):
-        return process_doc_file(file_path)
+        return process_doc_file(file_path, vectorize=vectorize)
     elif file_path.endswith('.xlsx') or file_path.endswith('.xlsm'):
-        return process_excel_file(file_path)
+        return process_excel_file(file_path, vectorize=vectorize)
     
     else:
         raise ValueError("Unsupported file type")
+
+# Fonction pour calculer l'empreinte d'un fichier
+def compute_file_hash(file_path):
+    """
+    Calcule l'empreinte SHA-256 du contenu d'un fichier.
+    
+    :param file_path: Le chemin du fichier.
+    :return: L'empreinte hexadécimale.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Fonction pour calculer l'empreinte d'un chunk
+def compute_chunk_hash(text):
+    """Calcule l'empreinte SHA-256 du texte d'un chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Fonction pour construire l'identifiant Chroma d'un chunk
+def make_chunk_uid(file_hash, chunk_hash):
+    """Identifiant adressé par le contenu : empreinte du fichier + empreinte du chunk."""
+    return f"{file_hash[:32]}-{chunk_hash[:32]}"
+
+# Fonction pour préparer les chunks d'un fichier en vue d'une ingestion incrémentale
+def iter_prepared_batches(file_path, known_chunk_hashes=(), batch_size=INGESTION_BATCH_SIZE):
+    """
+    Découpe un fichier par batchs, calcule les empreintes et ne vectorise que
+    les chunks dont le contenu n'est pas déjà dans la base.
+    
+    :param file_path: Le chemin du fichier.
+    :param known_chunk_hashes: Les empreintes des chunks déjà stockés pour ce fichier ;
+                               leur vecteur est laissé à None pour être réutilisé.
+    :param batch_size: Le nombre de chunks par batch.
+    :return: Un générateur de batchs de chunks, avec les clés "file_hash",
+             "chunk_hash", "uid" et "vector".
+    """
+    file_hash = compute_file_hash(file_path)
+    known_chunk_hashes = set(known_chunk_hashes)
+    seen = set()  # Un même texte présent plusieurs fois dans le fichier n'est stocké qu'une fois
+
+    for batch in iter_batches(process_file(file_path, vectorize=False), batch_size):
+        unique_chunks = []
+        for chunk in batch:
+            chunk_hash = compute_chunk_hash(chunk["chunk"])
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            chunk["file_hash"] = file_hash
+            chunk["chunk_hash"] = chunk_hash
+            chunk["uid"] = make_chunk_uid(file_hash, chunk_hash)
+            chunk["vector"] = None
+            unique_chunks.append(chunk)
+
+        new_chunks = [chunk for chunk in unique_chunks if chunk["chunk_hash"] not in known_chunk_hashes]
+        vectors = vectorize_chunks([chunk["chunk"] for chunk in new_chunks])
+        for chunk, vector in zip(new_chunks, vectors):
+            chunk["vector"] = vector
+
+        if unique_chunks:
+            yield unique_chunks
+
+class IngestionCancelled(Exception):
+    """Levée dans le worker quand le processus principal a abandonné le fichier."""
+
+
+def _put_batch(out_queue, item, cancel_event, put_timeout):
+    """
+    Dépose un élément dans la file bornée en vérifiant chaque seconde que le
+    processus principal lit encore (sinon le worker resterait bloqué).
+    """
+    deadline = time.monotonic() + put_timeout
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise IngestionCancelled()
+        try:
+            out_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            if time.monotonic() >= deadline:
+                raise
+
+# Fonction exécutée dans un processus d'ingestion
+def stream_prepared_batches(file_path, known_chunk_hashes, out_queue, batch_size=INGESTION_BATCH_SIZE, put_timeout=600,
+                            cancel_event=None):
+    """
+    Prépare les chunks d'un fichier et envoie chaque batch dans une file
+    (bornée) vers le processus principal, qui les écrit au fur et à mesure.
+    
+    :param out_queue: File multiprocessing recevant ("batch", chunks), puis ("done", None)
+                      ou ("error", message).
+    :param put_timeout: Abandon si le processus principal ne lit plus la file pendant ce délai.
+    :param cancel_event: Événement levé par le processus principal s'il abandonne le fichier
+                         (erreur d'écriture) : le worker s'arrête sans attendre `put_timeout`.
+    """
+    try:
+        for batch in iter_prepared_batches(file_path, known_chunk_hashes, batch_size):
+            _put_batch(out_queue, ("batch", batch), cancel_event, put_timeout)
+    except IngestionCancelled:
+        logger.info(f"Ingestion abandonnée : {file_path}")
+        return
+    except Exception as e:
+        logger.error(f"Error preparing file {file_path}: {e}")
+        try:
+            _put_batch(out_queue, ("error", str(e)), cancel_event, put_timeout)
+        except (IngestionCancelled, queue.Full):
+            pass
+        return
+    try:
+        _put_batch(out_queue, ("done", None), cancel_event, put_timeout)
+    except IngestionCancelled:
+        pass
@@ -0,0 +1,64 @@
+import logging
+import re
+import threading
+from app.core.config import NLTK_DATA_PATH
+
+
+logger = logging.getLogger(__name__)
+
+_path_lock = threading.Lock()
+_path_added = False
+_warned = set()
+
+
+def _ensure_data_path():
+    """Ajoute NLTK_DATA_PATH aux chemins de recherche de NLTK (une seule fois)."""
+    global _path_added
+    if not _path_added:
+        with _path_lock:
+            if not _path_added:
+                import nltk
+                if NLTK_DATA_PATH and NLTK_DATA_PATH not in nltk.data.path:
+                    nltk.data.path.append(NLTK_DATA_PATH)
+                _path_added = True
+
+
+def _warn_missing(resource: str):
+    if resource not in _warned:
+        _warned.add(resource)
+        logger.warning(
+            f"Ressource NLTK '{resource}' introuvable (aucun téléchargement à l'exécution). "
+            f"Installez-la avec : python -m nltk.downloader -d {NLTK_DATA_PATH} {resource}"
+        )
+
+
+def french_stopwords() -> frozenset:
+    """
+    Retourne les stopwords français de NLTK, lus uniquement sur le disque.
+
+    :return: Les stopwords, ou un ensemble vide si la ressource n'est pas installée.
+    """
+    _ensure_data_path()
+    from nltk.corpus import stopwords
+    try:
+        return frozenset(stopwords.words("french"))
+    except LookupError:
+        _warn_missing("stopwords")
+        return frozenset()
+
+
+def tokenize(text: str) -> list:
+    """
+    Découpe un texte en mots avec le tokenizer punkt de NLTK, ou à défaut
+    (ressource non installée) avec une expression régulière.
+
+    :param text: Le texte à découper.
+    :return: La liste des mots.
+    """
+    _ensure_data_path()
+    from nltk.tokenize import word_tokenize
+    try:
+        return word_tokenize(text, language="french")
+    except LookupError:
+        _warn_missing("punkt_tab")
+        return re.findall(r"\w+|[^\w\s]", text)
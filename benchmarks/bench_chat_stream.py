@@ -0,0 +1,68 @@
+"""
+Mesure le temps jusqu'au premier token de stream_response (app/services/llm_service.py)
+avec un modèle de chat factice local, comparé à la réponse complète.
+
+Usage : python -m benchmarks.bench_chat_stream [nombre_de_mots] [délai_par_token_ms]
+"""
+import asyncio
+import sys
+import time
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from app.services.llm_service import stream_response
+
+
+class SlowFakeChatModel(GenericFakeChatModel):
+    """Modèle factice qui simule la latence de génération de chaque token."""
+
+    token_delay: float = 0.0
+
+    async def _astream(self, *args, **kwargs):
+        async for chunk in super()._astream(*args, **kwargs):
+            await asyncio.sleep(self.token_delay)
+            yield chunk
+
+
+def make_documents(count=4):
+    return [{
+        "id": f"doc-{i}",
+        "file_name": "guide.pdf",
+        "page": str(i + 1),
+        "chunk_id": i + 1,
+        "content": f"Contenu du chunk {i + 1} sur les règles de sécurité des chantiers.",
+    } for i in range(count)]
+
+
+async def run(words, token_delay):
+    answer = " ".join(f"mot{i}" for i in range(words))
+    chat_model = SlowFakeChatModel(messages=iter([AIMessage(content=answer)]), token_delay=token_delay)
+
+    events = []
+    tokens = []
+    async for event, data in stream_response("Quelles sont les règles ?", make_documents(), "", [], None,
+                                             use_cache=False, chat_model=chat_model):
+        events.append(event)
+        if event == "token":
+            tokens.append(data)
+        elif event == "done":
+            done = data
+
+    # Ordre des événements : sources, tokens, done
+    assert events[0] == "sources" and events[-1] == "done"
+    assert set(events[1:-1]) == {"token"}
+    assert "".join(tokens) == answer
+    return done["timings"]
+
+
+def main():
+    words = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    token_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 10) / 1000
+    started = time.perf_counter()
+    timings = asyncio.run(run(words, token_delay))
+    print(f"{words} mots, {token_delay * 1000:.0f} ms par token (durée mesurée : {time.perf_counter() - started:.2f} s)")
+    print(f"  premier token : {timings['first_token']:.3f} s")
+    print(f"  réponse complète : {timings['total']:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark du moteur de découpage (app/utils/chunking.py) contre la boucle
+historique mot par mot de process_pdf_file.
+
+Usage : python -m benchmarks.bench_chunking [nombre_de_mots]
+"""
+import random
+import sys
+import time
+from app.utils.chunking import ChunkingEngine
+
+
+def legacy_chunks(pages, file_name, timestamp, chunk_size=100, overlap=50):
+    """Boucle historique de process_pdf_file (référence)."""
+    current_page = 1
+    current_chunk = []
+    chunks = []
+    chunks_id_counter = 1
+    page_num = None
+    for page_num, words in pages:
+        for word in words:
+            current_chunk.append(word)
+            if len(current_chunk) >= chunk_size:
+                chunks.append({
+                    "file_name": file_name,
+                    "pages": f"{current_page}-{page_num}" if current_page != page_num else str(page_num),
+                    "timestamp": timestamp,
+                    "chunk_id": chunks_id_counter,
+                    "chunk": ' '.join(current_chunk)
+                })
+                chunks_id_counter += 1
+                current_chunk = current_chunk[-overlap:]
+                current_page = page_num
+    if current_chunk:
+        chunks.append({
+            "file_name": file_name,
+            "pages": f"{current_page}-{page_num}" if current_page != page_num else str(page_num),
+            "timestamp": timestamp,
+            "chunk_id": chunks_id_counter,
+            "chunk": ' '.join(current_chunk)
+        })
+    return chunks
+
+
+def make_pages(word_count, seed=0):
+    """Génère des pages de tailles variables (dont des pages vides)."""
+    rng = random.Random(seed)
+    vocabulary = [f"mot{i}" for i in range(5000)]
+    pages = []
+    remaining = word_count
+    while remaining > 0:
+        size = min(remaining, rng.choice([0, 0, 37, 120, 350, 600, 1200]))
+        pages.append((len(pages) + 1, [rng.choice(vocabulary) for _ in range(size)]))
+        remaining -= size
+    pages.append((len(pages) + 1, []))  # Page finale vide
+    return pages
+
+
+def best_of(function, repeat=3):
+    """Exécute `function` plusieurs fois et retourne (résultat, meilleur temps)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    word_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    pages = make_pages(word_count)
+    engine = ChunkingEngine(window=100, overlap=50, block_size=65536)
+
+    expected, legacy_time = best_of(lambda: legacy_chunks(pages, "bench.pdf", "t"))
+    chunks, engine_time = best_of(lambda: list(engine.iter_chunks(pages, "bench.pdf", "t")))
+
+    assert chunks == expected, "Le moteur ne reproduit pas le découpage historique"
+    for size in (0, 1, 50, 99, 100, 101, 150, 151, 250):
+        small = [(1, [f"w{i}" for i in range(size)]), (2, [])]
+        assert list(engine.iter_chunks(small, "f", "t")) == legacy_chunks(small, "f", "t"), size
+
+    print(f"{word_count} mots, {len(chunks)} chunks")
+    print(f"boucle historique : {legacy_time:.3f} s")
+    print(f"moteur            : {engine_time:.3f} s ({legacy_time / engine_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Débit de la génération GPT-2 (app/services/gpt2_service.py) pour des requêtes
+concurrentes : une génération par prompt, l'une après l'autre (ancien
+comportement de /api/gpt2/), contre le planificateur par micro-batchs.
+
+Usage : python -m benchmarks.bench_gpt2_batching [requêtes_concurrentes] [max_length] [taille_de_batch]
+"""
+import asyncio
+import random
+import sys
+import time
+from app.services.gpt2_service import GPT2BatchScheduler
+from app.services.model_registry import get_model_registry
+
+WORDS = ("le chantier la sécurité un échafaudage les travaux en hauteur le casque "
+         "la prévention du risque de chute pour les ouvriers").split()
+
+
+def make_prompts(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 20))) for _ in range(count)]
+
+
+def run_sequential(prompts, max_length):
+    tokenizer, model = get_model_registry().get("gpt2")
+    started = time.perf_counter()
+    for prompt in prompts:
+        inputs = tokenizer.encode(prompt, return_tensors="pt")
+        outputs = model.generate(inputs, max_length=max_length, num_return_sequences=1,
+                                 pad_token_id=tokenizer.eos_token_id)
+        tokenizer.decode(outputs[0], skip_special_tokens=True)
+    return time.perf_counter() - started
+
+
+async def run_batched(prompts, max_length, batch_size):
+    scheduler = GPT2BatchScheduler(max_batch_size=batch_size, batch_wait_ms=10, queue_size=len(prompts))
+    started = time.perf_counter()
+    await asyncio.gather(*(asyncio.wrap_future(scheduler.submit(prompt, max_length)) for prompt in prompts))
+    return time.perf_counter() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    max_length = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    prompts = make_prompts(count)
+    get_model_registry().get("gpt2")  # Chargement du modèle hors mesure
+
+    sequential = run_sequential(prompts, max_length)
+    batched = asyncio.run(run_batched(prompts, max_length, batch_size))
+    print(f"{count} requêtes concurrentes, max_length={max_length}, batchs de {batch_size}")
+    print(f"  une par une : {sequential:.2f} s ({count / sequential:.2f} requêtes/s)")
+    print(f"  micro-batchs : {batched:.2f} s ({count / batched:.2f} requêtes/s, x{sequential / batched:.1f})")
+
+
+if __name__ == "__main__":
+    main()
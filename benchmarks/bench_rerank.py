@@ -0,0 +1,53 @@
+"""
+Benchmark du reranker (app/services/rerank_service.py) selon le nombre de
+candidats : micro-batchs triés par longueur contre un seul batch complété
+jusqu'au plus long candidat (ancien rank_chunks), avec et sans quantification int8.
+
+Usage : python -m benchmarks.bench_rerank [nombres_de_candidats, ex. 10,25,50,100]
+"""
+import random
+import sys
+import time
+from app.core.config import RERANK_BATCH_SIZE, RERANK_MAX_LENGTH, RERANK_MODEL_NAME
+from app.services.rerank_service import CrossEncoderReranker
+
+WORDS = ("chantier sécurité échafaudage garde-corps harnais béton coffrage levage grue casque "
+         "prévention risque chute travaux hauteur formation contrôle vérification norme").split()
+
+
+def make_candidates(count, seed=0):
+    """Chunks de longueurs variées (5 à 150 mots), comme des chunks de fin de page et des chunks pleins."""
+    rng = random.Random(seed)
+    return [{"content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 150)))} for _ in range(count)]
+
+
+def best_of(function, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    counts = [int(value) for value in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10, 25, 50, 100]
+    query = "Quelles protections contre les chutes de hauteur sur un échafaudage ?"
+
+    for quantize in (False, True):
+        bucketed = CrossEncoderReranker(RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE,
+                                        max_length=RERANK_MAX_LENGTH, quantize=quantize)
+        bucketed.score(query, ["échauffement"])  # Chargement du modèle hors mesure
+        print(f"Quantification int8 : {'oui' if quantize else 'non'}")
+        for count in counts:
+            candidates = make_candidates(count)
+            single = CrossEncoderReranker(RERANK_MODEL_NAME, batch_size=count, max_length=RERANK_MAX_LENGTH)
+            single._tokenizer, single._model = bucketed._get_model()  # Même modèle, un seul batch
+            bucketed_time = best_of(lambda: bucketed.rerank(query, candidates, top_k=4))
+            single_time = best_of(lambda: single.rerank(query, candidates, top_k=4))
+            print(f"  {count:4d} candidats : micro-batchs {bucketed_time * 1000:8.1f} ms "
+                  f"({bucketed_time / count * 1000:.2f} ms/candidat), un seul batch {single_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
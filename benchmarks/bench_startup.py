@@ -0,0 +1,56 @@
+"""
+Mesure le démarrage à froid de l'application : durée de l'import de app.main
+(ce que fait chaque worker uvicorn avant d'accepter des requêtes), puis durée
+du préchargement des modèles (MODEL_WARMUP) jusqu'à ce que /api/health/ready
+réponde 200. Chaque mesure tourne dans un nouveau processus Python.
+
+Usage : python -m benchmarks.bench_startup [répétitions] [--warmup]
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import app.main
+result = {"import": time.perf_counter() - started}
+if WARMUP:
+    from app.core.config import MODEL_WARMUP
+    from app.services.model_registry import get_model_registry
+    registry = get_model_registry()
+    started = time.perf_counter()
+    registry.warm_up(MODEL_WARMUP).join()
+    result["warmup"] = time.perf_counter() - started
+    result["models"] = registry.status()
+print(json.dumps(result))
+"""
+
+
+def run_once(warmup):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.replace("WARMUP", str(warmup))],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    repeat = int(args[0]) if args else 5
+    warmup = "--warmup" in sys.argv
+
+    results = [run_once(warmup) for _ in range(repeat)]
+    imports = [result["import"] for result in results]
+    print(f"Import de app.main ({repeat} processus) : médiane {statistics.median(imports):.2f} s, "
+          f"min {min(imports):.2f} s, max {max(imports):.2f} s")
+    if warmup:
+        warmups = [result["warmup"] for result in results]
+        print(f"Préchargement des modèles : médiane {statistics.median(warmups):.2f} s")
+        for name, state in results[-1]["models"].items():
+            print(f"  {name} : {state}")
+
+
+if __name__ == "__main__":
+    main()
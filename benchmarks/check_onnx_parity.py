@@ -0,0 +1,115 @@
+"""
+Vérifie que le moteur ONNX Runtime (app/services/onnx_backend.py) reste fidèle
+au moteur torch et mesure le gain de débit sur CPU :
+- embeddings : la dérive cosinus (1 - cosinus entre les vecteurs torch et onnx)
+  de chaque texte doit rester sous `--max-drift` ;
+- reclassement : pour chaque requête, l'ordre des `--top-k` premiers chunks ne
+  doit pas changer de plus de `--max-swaps` (part des paires inversées, distance
+  de Kendall) et le premier chunk doit rester le même.
+
+Le script se termine avec le code 1 si une borne est dépassée.
+
+Usage : python -m benchmarks.check_onnx_parity [--quantize] [--max-drift 0.01] [--max-swaps 0.1] [--top-k 10]
+"""
+import argparse
+import random
+import sys
+import time
+import numpy as np
+from app.core.config import EMBEDDING_MODEL_NAME, RERANK_BATCH_SIZE, RERANK_MAX_LENGTH, RERANK_MODEL_NAME
+from app.services.embedding_service import EmbeddingEngine
+from app.services.rerank_service import CrossEncoderReranker
+
+WORDS = ("chantier sécurité échafaudage garde-corps harnais béton coffrage levage grue casque "
+         "prévention risque chute travaux hauteur formation contrôle vérification norme").split()
+QUERIES = [
+    "Quelles protections contre les chutes de hauteur sur un échafaudage ?",
+    "Qui vérifie les appareils de levage avant la mise en service ?",
+    "Quelle formation pour monter un coffrage ?",
+    "Le port du casque est-il obligatoire sur le chantier ?",
+]
+
+
+def make_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 150))) for _ in range(count)]
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def kendall_distance(reference: list, other: list) -> float:
+    """Part des paires de `reference` dont l'ordre est inversé dans `other` (0 : même ordre)."""
+    position = {item: index for index, item in enumerate(other)}
+    items = [item for item in reference if item in position]
+    pairs = [(a, b) for i, a in enumerate(items) for b in items[i + 1:]]
+    if not pairs:
+        return 0.0
+    return sum(position[a] > position[b] for a, b in pairs) / len(pairs)
+
+
+def check_embeddings(texts, quantize, max_drift):
+    torch_engine = EmbeddingEngine(EMBEDDING_MODEL_NAME, backend="torch")
+    onnx_engine = EmbeddingEngine(EMBEDDING_MODEL_NAME, backend="onnx", quantize=quantize)
+    torch_engine.encode(texts[:2]), onnx_engine.encode(texts[:2])  # Chargement hors mesure
+
+    reference, torch_time = timed(lambda: np.array(torch_engine.encode(texts)))
+    vectors, onnx_time = timed(lambda: np.array(onnx_engine.encode(texts)))
+    cosine = (reference * vectors).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1))
+    drift = float((1 - cosine).max())
+    print(f"Embeddings ({len(texts)} textes) : torch {torch_time:.2f} s, onnx {onnx_time:.2f} s "
+          f"(x{torch_time / onnx_time:.1f}), dérive cosinus max {drift:.5f}, moyenne {float((1 - cosine).mean()):.5f}")
+    return drift <= max_drift
+
+
+def check_rerank(texts, quantize, top_k, max_swaps):
+    torch_reranker = CrossEncoderReranker(RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE,
+                                          max_length=RERANK_MAX_LENGTH, backend="torch")
+    onnx_reranker = CrossEncoderReranker(RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE,
+                                         max_length=RERANK_MAX_LENGTH, quantize=quantize, backend="onnx")
+    torch_reranker.score(QUERIES[0], texts[:2]), onnx_reranker.score(QUERIES[0], texts[:2])
+    candidates = [{"id": index, "content": text} for index, text in enumerate(texts)]
+
+    ok = True
+    torch_total = onnx_total = 0.0
+    for query in QUERIES:
+        reference, torch_time = timed(lambda: torch_reranker.rerank(query, candidates, top_k=top_k))
+        ranked, onnx_time = timed(lambda: onnx_reranker.rerank(query, candidates, top_k=top_k))
+        torch_total += torch_time
+        onnx_total += onnx_time
+        reference_ids = [chunk["id"] for chunk in reference]
+        ranked_ids = [chunk["id"] for chunk in ranked]
+        swaps = kendall_distance(reference_ids, ranked_ids)
+        overlap = len(set(reference_ids) & set(ranked_ids)) / len(reference_ids)
+        same_first = reference_ids[0] == ranked_ids[0]
+        print(f"  {query[:50]:50s} : paires inversées {swaps:.3f}, top-{top_k} communs {overlap:.0%}, "
+              f"premier identique : {'oui' if same_first else 'non'}")
+        ok = ok and swaps <= max_swaps and same_first
+    print(f"Reclassement ({len(texts)} candidats x {len(QUERIES)} requêtes) : torch {torch_total:.2f} s, "
+          f"onnx {onnx_total:.2f} s (x{torch_total / onnx_total:.1f})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quantize", action="store_true", help="Comparer avec la version int8 d'ONNX Runtime")
+    parser.add_argument("--max-drift", type=float, default=0.01)
+    parser.add_argument("--max-swaps", type=float, default=0.1)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--texts", type=int, default=256)
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts)
+    embeddings_ok = check_embeddings(texts, args.quantize, args.max_drift)
+    rerank_ok = check_rerank(texts[:50], args.quantize, args.top_k, args.max_swaps)
+    print(f"Embeddings : {'OK' if embeddings_ok else 'ÉCHEC'} (dérive max autorisée {args.max_drift})")
+    print(f"Reclassement : {'OK' if rerank_ok else 'ÉCHEC'} (paires inversées max {args.max_swaps})")
+    sys.exit(0 if embeddings_ok and rerank_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Configuration gunicorn : plusieurs workers uvicorn qui partagent les modèles locaux.
+#
+#   gunicorn app.main:app -c gunicorn.conf.py
+#
+# Les modèles de MODEL_WARMUP sont chargés une seule fois dans le processus
+# maître, avant la création des workers : après le fork, leurs poids sont
+# partagés en copie à l'écriture au lieu d'être copiés dans chaque worker.
+# L'application elle-même (clients ChromaDB et MongoDB) est importée dans
+# chaque worker, après le fork : pas de connexion SQLite ou réseau héritée.
+import gc
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = False
+
+# Threads torch par worker (par défaut : les cœurs répartis entre les workers)
+torch_threads = int(os.getenv("TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // workers))))
+
+
+def when_ready(server):
+    # Appelé dans le maître avant la création des premiers workers
+    import torch
+    from app.core.config import INFERENCE_BACKEND, MODEL_WARMUP
+    from app.services.model_registry import get_model_registry
+    # Importer les services enregistre leurs modèles dans le registre
+    import app.services.embedding_service  # noqa: F401
+    import app.services.gpt2_service  # noqa: F401
+    import app.services.prompt_service  # noqa: F401
+    import app.services.rerank_service  # noqa: F401
+
+    if INFERENCE_BACKEND == "onnx":
+        # Les sessions ONNX Runtime créent leurs pools de threads au chargement,
+        # qui ne survivent pas au fork : chaque worker charge ses modèles
+        server.log.info("INFERENCE_BACKEND=onnx : pas de préchargement des modèles avant le fork")
+        return
+
+    # Un seul thread dans le maître : un pool OpenMP créé avant le fork bloquerait les workers
+    torch.set_num_threads(1)
+    registry = get_model_registry()
+    registry.load(MODEL_WARMUP)
+    # Sortir les objets déjà créés du ramasse-miettes : il ne les parcourt plus
+    # dans les workers et ne touche donc plus leurs pages mémoire partagées
+    gc.freeze()
+    server.log.info(f"Modèles chargés avant le fork : {registry.status()}")
+
+
+def post_fork(server, worker):
+    import torch
+    torch.set_num_threads(torch_threads)
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("fastapi")
+os.environ.setdefault("OPENAI_API_KEY", "test")  # Le client OpenAI est créé à l'import, jamais appelé
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app.api.endpoints import chat
+
+
+DOCUMENTS = [
+    {"id": "a-1", "file_name": "cctp.pdf", "page": "3", "chunk_id": 7, "content": "Béton C25/30 pour les fondations."},
+]
+
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(chat, "search_documents", lambda query: DOCUMENTS)
+    app = FastAPI()
+    app.include_router(chat.router)
+    app.dependency_overrides[chat.get_chat_model] = lambda: GenericFakeChatModel(
+        messages=iter([AIMessage(content="Béton C25/30 en fondation")])
+    )
+    return TestClient(app)
+
+
+def test_chat_stream_sends_sources_tokens_then_done(client):
+    response = client.post("/chat/stream/", data={"query": "Quel béton ?", "history": "", "use_cache": "false"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    names = [event for event, _ in events]
+    assert names[0] == "sources"
+    assert names[-1] == "done"
+    assert set(names[1:-1]) == {"token"} and len(names) > 3
+
+    assert events[0][1] == [{"file_name": "cctp.pdf", "page": "3", "chunk_id": 7}]
+    assert "".join(data for event, data in events if event == "token") == "Béton C25/30 en fondation"
+    done = events[-1][1]
+    assert done["cached"] is False
+    assert done["prompt_tokens"]["total"] > 0
+    assert {"retrieval", "prompt_ready", "first_token", "total"} <= set(done["timings"])
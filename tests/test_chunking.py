@@ -0,0 +1,31 @@
+import numpy as np
+
+from app.utils.chunking import ChunkingEngine
+
+
+def char_counter(words):
+    # Un token par caractère : la limite de tokens raccourcit les fenêtres
+    return [len(w) for w in words]
+
+
+def test_token_capped_window_advances_past_overlap():
+    engine = ChunkingEngine(window=10, overlap=5, token_counter=char_counter, max_tokens=6)
+    chunks = engine.chunk_text("aa bb cc dd ee ff gg")
+    # Fenêtres de 3 mots : chevauchement d'un mot, pas de 'bb cc dd', 'cc dd ee'...
+    assert chunks == ["aa bb cc", "cc dd ee", "ee ff gg"]
+
+
+def test_token_capped_chunk_count_stays_bounded():
+    words = [f"mot{i:03d}" for i in range(1000)]  # 6 tokens par mot
+    engine = ChunkingEngine(window=100, overlap=50, token_counter=char_counter, max_tokens=64)
+    starts, ends, _ = engine.window_offsets(len(words), cum_tokens=engine._cum_tokens(words))
+    steps = np.diff(starts)
+    # Fenêtres de 10 mots : avance de 5 mots, pas d'un seul
+    assert steps.min() >= (ends - starts).min() // 2
+    assert len(starts) <= 2 * len(words) // 10 + 1
+
+
+def test_full_window_keeps_configured_overlap():
+    engine = ChunkingEngine(window=10, overlap=4)
+    starts, ends, _ = engine.window_offsets(30)
+    assert list(starts[:3]) == [0, 6, 12]
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("optimum.onnxruntime")
+
+from app.core.config import EMBEDDING_MODEL_NAME, RERANK_BATCH_SIZE, RERANK_MAX_LENGTH, RERANK_MODEL_NAME
+from app.services.embedding_service import EmbeddingEngine
+from app.services.rerank_service import CrossEncoderReranker
+from benchmarks.check_onnx_parity import QUERIES, kendall_distance, make_texts
+
+# Bornes du Readme (python -m benchmarks.check_onnx_parity --max-drift 0.01 --max-swaps 0.1)
+MAX_DRIFT = 0.01
+MAX_SWAPS = 0.1
+TOP_K = 10
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_onnx_embeddings_stay_close_to_torch(quantize):
+    texts = make_texts(64)
+    reference = np.array(EmbeddingEngine(EMBEDDING_MODEL_NAME, backend="torch").encode(texts))
+    vectors = np.array(EmbeddingEngine(EMBEDDING_MODEL_NAME, backend="onnx", quantize=quantize).encode(texts))
+
+    cosine = (reference * vectors).sum(axis=1) / (np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1))
+    assert float((1 - cosine).max()) <= MAX_DRIFT
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_onnx_rerank_keeps_torch_order(quantize):
+    candidates = [{"id": index, "content": text} for index, text in enumerate(make_texts(50))]
+    torch_reranker = CrossEncoderReranker(RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE,
+                                          max_length=RERANK_MAX_LENGTH, backend="torch")
+    onnx_reranker = CrossEncoderReranker(RERANK_MODEL_NAME, batch_size=RERANK_BATCH_SIZE,
+                                         max_length=RERANK_MAX_LENGTH, quantize=quantize, backend="onnx")
+
+    for query in QUERIES:
+        reference = [chunk["id"] for chunk in torch_reranker.rerank(query, candidates, top_k=TOP_K)]
+        ranked = [chunk["id"] for chunk in onnx_reranker.rerank(query, candidates, top_k=TOP_K)]
+        assert kendall_distance(reference, ranked) <= MAX_SWAPS, query
+        assert reference[0] == ranked[0], query